@@ -1 +1 @@
-from cost_calculator.app import app
+from cost_calculator.app import create_app
@@ -0,0 +1,5 @@
+import sys
+
+from cost_calculator.report import main
+
+sys.exit(main())
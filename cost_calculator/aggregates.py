@@ -0,0 +1,46 @@
+import attr
+
+ALL_NAMESPACES = ''
+
+
+@attr.s
+class CostTotals:
+    '''Hourly cost and resources of a group of priced pods'''
+    pod_count = attr.ib(default=0)
+    cost = attr.ib(default=0.0)
+    spot_price = attr.ib(default=0.0)
+    cpu = attr.ib(default=0.0)
+    memory = attr.ib(default=0.0)
+
+    def add(self, contribution):
+        cost, spot_price, cpu, memory = contribution
+        self.pod_count += 1
+        self.cost += cost
+        self.spot_price += spot_price
+        self.cpu += cpu
+        self.memory += memory
+
+    def for_hours(self, hours):
+        '''Totals with cost and spot price accumulated over hours'''
+        return attr.evolve(self, cost=self.cost * hours,
+                           spot_price=self.spot_price * hours)
+
+
+def pod_contribution(pod):
+    return (
+        pod.cost,
+        pod.spot_price,
+        max(pod.req_cpu, pod.lim_cpu),
+        max(pod.req_memory, pod.lim_memory),
+    )
+
+
+def namespace_totals(pods):
+    '''Totals of the pods of every namespace, and of all of them under
+    ALL_NAMESPACES'''
+    totals = {ALL_NAMESPACES: CostTotals()}
+    for pod in pods:
+        contribution = pod_contribution(pod)
+        totals[ALL_NAMESPACES].add(contribution)
+        totals.setdefault(pod.namespace, CostTotals()).add(contribution)
+    return totals
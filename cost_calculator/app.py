@@ -1,17 +1,29 @@
+import functools
 import json
 import logging
 import os
-import sys
+import tempfile
+import time
 from typing import Dict
 
 import attr
 from kubernetes import client, config
-from kubernetes.client import V1Pod, V1ObjectMeta, V1PodSpec, V1Container, V1ResourceRequirements, V1Node
-from kubernetes.utils import parse_quantity
-from flask import Flask, jsonify, request, flash
+from kubernetes.client import V1ObjectMeta, V1Node
+from flask import Blueprint, Flask, current_app, g, jsonify, request, flash, session
 import flask
 
-from cost_calculator.instance_selector import make_instance_selector
+from cost_calculator.aggregates import ALL_NAMESPACES
+from cost_calculator.binpacking import NodePacker, PackingConstraints
+from cost_calculator.comparison import PROVIDERS, compare_snapshot, list_targets
+from cost_calculator.export import iter_csv, iter_ndjson
+from cost_calculator.history import DAY, TIERS_BY_NAME, CostHistory, HistorySampler
+from cost_calculator.http_cache import compress, not_modified, set_validators
+from cost_calculator.informer import Informer, iter_raw_pages
+from cost_calculator.instance_selector import make_instance_selector, SpotPriceTable
+from cost_calculator.pod_query import PodQuery
+from cost_calculator.quantity import parse_cpu, parse_memory
+from cost_calculator.snapshot import ChangeTimes, SnapshotScheduler, build_snapshot
+from cost_calculator.startup import Startup
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -20,88 +32,141 @@ MONTH = 'month'
 YEAR = 'year'
 KIP_NODE_LABEL_KEY = 'type'
 KIP_NODE_LABEL_VALUE = 'virtual-kubelet'
-
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
-
-
-def k8s_container_resource_requirements(container) -> Dict[str, int]:
+INSTANCE_DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'instance-data')
+
+bp = Blueprint('cost_calculator', __name__)
+
+# phases needed to serve pages, spot prices are optional
+READY_PHASES = ('config', 'catalog', 'cluster_cost', 'snapshots')
+# pages rendered from the current snapshot, a GET of one of them is
+# answered with 304 when the client has the current snapshot already
+SNAPSHOT_ENDPOINTS = {
+    'cost_calculator.cost_summary',
+    'cost_calculator.node_cost',
+    'cost_calculator.forcast_summary',
+    'cost_calculator.calc',
+    'cost_calculator.pod_cost_query',
+    'cost_calculator.export',
+    'cost_calculator.region_comparison',
+}
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
+
+
+def resource_requirements(limits, requests) -> Dict[str, float]:
     """
-    returns dict in format:
+    returns dict in format (cpu in cores, memory in GiB):
      {"req_cpu": 1, "req_mem": 1, "lim_cpu": 2, "lim_mem": 2}
     """
+    cpu = 0
+    memory = 0
+    lim_cpu = 0
+    lim_mem = 0
+    if limits and limits.get('cpu'):
+        cpu = parse_cpu(limits['cpu'])
+        lim_cpu = cpu
+    if limits and limits.get('memory'):
+        memory = parse_memory(limits['memory'])
+        lim_mem = memory
+    req_cpu = 0
+    req_mem = 0
+    if requests and requests.get('cpu'):
+        cpu = parse_cpu(requests['cpu'])
+        req_cpu = max(cpu, cpu)
+    if requests and requests.get('memory'):
+        memory = parse_memory(requests['memory'])
+        req_mem = max(memory, memory)
+    return {
+        "req_cpu": req_cpu,
+        "req_mem": req_mem,
+        "lim_cpu": lim_cpu,
+        "lim_mem": lim_mem
+        }
+
+
+def k8s_container_resource_requirements(container) -> Dict[str, float]:
     try:
-        cpu = 0
-        memory = 0
         if not container.resources:
-            return {
-                "req_cpu": cpu,
-                "req_mem": memory,
-                "lim_cpu": cpu,
-                "lim_mem": memory
-            }
-        limits = container.resources.limits
-        lim_cpu = 0
-        lim_mem = 0
-        if limits and limits.get('cpu'):
-            cpu = parse_quantity(limits['cpu'])
-            lim_cpu = cpu
-        if limits and limits.get('memory'):
-            memory = parse_quantity(limits['memory'])
-            lim_mem = memory
-        requests = container.resources.requests
-        req_cpu = 0
-        req_mem = 0
-        if requests and requests.get('cpu'):
-            cpu = parse_quantity(requests['cpu'])
-            req_cpu = max(cpu, cpu)
-        if requests and requests.get('memory'):
-            memory = parse_quantity(requests['memory'])
-            req_mem = max(memory, memory)
-        return {
-            "req_cpu": req_cpu,
-            "req_mem": req_mem,
-            "lim_cpu": lim_cpu,
-            "lim_mem": lim_mem
-            }
+            return resource_requirements(None, None)
+        return resource_requirements(
+            container.resources.limits, container.resources.requests)
     except Exception:
         logger.exception('Error getting resource requirements for container')
 
 
-def k8s_pod_resource_requirements(pod):
+def raw_container_resource_requirements(container) -> Dict[str, float]:
+    """container is a container of a pod spec as returned by the API"""
+    try:
+        resources = container.get('resources') or {}
+        return resource_requirements(
+            resources.get('limits'), resources.get('requests'))
+    except Exception:
+        logger.exception('Error getting resource requirements for container')
+
+
+def pod_resource_requirements(init_containers, containers):
+    """takes the resource requirements of the init containers and
+    containers of a pod"""
     max_req_cpu = 0
     max_lim_cpu = 0
     max_req_memory = 0
     max_lim_memory = 0
-    if pod.spec.init_containers:
-        for container in pod.spec.init_containers:
-            resources = k8s_container_resource_requirements(container)
-            req_cpu, req_mem = resources['req_cpu'], resources['req_mem']
-            lim_cpu, lim_mem = resources['lim_cpu'], resources['lim_mem']
-            max_req_cpu = req_cpu
-            max_lim_cpu = lim_cpu
-            max_req_memory = req_mem
-            max_lim_memory = lim_mem
+    for resources in init_containers:
+        req_cpu, req_mem = resources['req_cpu'], resources['req_mem']
+        lim_cpu, lim_mem = resources['lim_cpu'], resources['lim_mem']
+        max_req_cpu = req_cpu
+        max_lim_cpu = lim_cpu
+        max_req_memory = req_mem
+        max_lim_memory = lim_mem
     sum_req_cpu = 0
     sum_lim_cpu = 0
     sum_req_memory = 0
     sum_lim_memory = 0
-    if pod.spec.containers:
-        for container in pod.spec.containers:
-            resources = k8s_container_resource_requirements(container)
-            sum_lim_cpu += resources['lim_cpu']
-            sum_lim_memory += resources['lim_mem']
-            sum_req_cpu += resources['req_cpu']
-            sum_req_memory += resources['req_mem']
+    for resources in containers:
+        sum_lim_cpu += resources['lim_cpu']
+        sum_lim_memory += resources['lim_mem']
+        sum_req_cpu += resources['req_cpu']
+        sum_req_memory += resources['req_mem']
     max_req_cpu = float(max(sum_req_cpu, max_req_cpu))
     max_lim_cpu = float(max(sum_lim_cpu, max_lim_cpu))
     max_req_memory = float(max(sum_req_memory, max_req_memory))
-    max_req_memory = max_req_memory / (1024.0 * 1024.0 * 1024.0)
     max_lim_memory = float(max(sum_lim_memory, max_lim_memory))
-    max_lim_memory = max_lim_memory / (1024.0 * 1024.0 * 1024.0)
     return max_req_cpu, max_req_memory, max_lim_cpu, max_lim_memory, ''
 
 
+def k8s_pod_resource_requirements(pod):
+    return pod_resource_requirements(
+        [k8s_container_resource_requirements(container)
+         for container in pod.spec.init_containers or []],
+        [k8s_container_resource_requirements(container)
+         for container in pod.spec.containers or []])
+
+
+def raw_pod_resource_requirements(pod_json):
+    spec = pod_json.get('spec') or {}
+    return pod_resource_requirements(
+        [raw_container_resource_requirements(container)
+         for container in spec.get('initContainers') or []],
+        [raw_container_resource_requirements(container)
+         for container in spec.get('containers') or []])
+
+
+def pod_owner(owner_references, labels):
+    '''Returns "Kind/name" of the controller of a pod, owner_references
+    are (kind, name, controller) tuples. Pods of a ReplicaSet created by
+    a Deployment are attributed to the Deployment.'''
+    for kind, name, controller in owner_references:
+        if not controller:
+            continue
+        template_hash = labels.get('pod-template-hash')
+        if kind == 'ReplicaSet' and template_hash and name.endswith('-' + template_hash):
+            return 'Deployment/' + name[:-len(template_hash) - 1]
+        return f'{kind}/{name}'
+    return ''
+
+
 @attr.s
 class Pod:
     '''Our representation of a pod, simpler to deal with and less
@@ -117,11 +182,18 @@ class Pod:
     instance_type = attr.ib(default='')
     cost = attr.ib(default=0.0)
     spot_price = attr.ib(default=0.0)
+    labels = attr.ib(default=attr.Factory(dict))
+    owner = attr.ib(default='')
 
     @classmethod
     def from_k8s(cls, kpod):
         namespace = kpod.metadata.namespace
         name = kpod.metadata.name
+        labels = kpod.metadata.labels or {}
+        owner = pod_owner(
+            [(ref.kind, ref.name, ref.controller)
+             for ref in kpod.metadata.owner_references or []],
+            labels)
         try:
             req_cpu, req_memory, lim_cpu, lim_memory, gpu_spec = k8s_pod_resource_requirements(kpod)
         except ValueError:
@@ -135,7 +207,37 @@ class Pod:
             req_memory=req_memory,
             lim_cpu=lim_cpu,
             lim_memory=lim_memory,
-            gpu_spec=gpu_spec
+            gpu_spec=gpu_spec,
+            labels=labels,
+            owner=owner,
+        )
+
+    @classmethod
+    def from_raw(cls, pod_json):
+        """builds a pod from the JSON returned by the API, without
+        deserializing it into a V1Pod"""
+        metadata = pod_json['metadata']
+        labels = metadata.get('labels') or {}
+        owner = pod_owner(
+            [(ref.get('kind'), ref.get('name'), ref.get('controller'))
+             for ref in metadata.get('ownerReferences') or []],
+            labels)
+        try:
+            req_cpu, req_memory, lim_cpu, lim_memory, gpu_spec = raw_pod_resource_requirements(pod_json)
+        except ValueError:
+            logger.exception('error getting resource requirements for container')
+            raise
+
+        return cls(
+            namespace=metadata.get('namespace'),
+            name=metadata.get('name'),
+            req_cpu=req_cpu,
+            req_memory=req_memory,
+            lim_cpu=lim_cpu,
+            lim_memory=lim_memory,
+            gpu_spec=gpu_spec,
+            labels=labels,
+            owner=owner,
         )
 
     @classmethod
@@ -154,8 +256,11 @@ class Pod:
                 "memory": "12Gi"
               }
             },
-            "initContainers": null
+            "initContainers": null,
+            "labels": {"app": "bonita"},
+            "owner": "StatefulSet/bonita-webapp"
           },
+        labels and owner are optional.
         """
         containers = pod_dict['containers']
         if containers is not None:
@@ -170,32 +275,20 @@ class Pod:
             ic_requests = containers.get('requests')
         else:
             ic_limits, ic_requests = {}, {}
-        pod = V1Pod(
-            metadata=V1ObjectMeta(
-                name=pod_dict['name'],
-                namespace=pod_dict['namespace']
-            ),
-            spec=V1PodSpec(
-                containers=[
-                    V1Container(
-                        name='1',
-                        resources=V1ResourceRequirements(
-                            limits=c_limits,
-                            requests=c_requests
-                        )
-                    )
-                ],
-                init_containers=[
-                    V1Container(
-                        name='1',
-                        resources=V1ResourceRequirements(
-                            limits=ic_limits,
-                            requests=ic_requests
-                        ))
-                ]
-            )
+        req_cpu, req_memory, lim_cpu, lim_memory, gpu_spec = pod_resource_requirements(
+            [resource_requirements(ic_limits, ic_requests)],
+            [resource_requirements(c_limits, c_requests)])
+        return cls(
+            namespace=pod_dict['namespace'],
+            name=pod_dict['name'],
+            req_cpu=req_cpu,
+            req_memory=req_memory,
+            lim_cpu=lim_cpu,
+            lim_memory=lim_memory,
+            gpu_spec=gpu_spec,
+            labels=pod_dict.get('labels') or {},
+            owner=pod_dict.get('owner') or '',
         )
-        return cls.from_k8s(pod)
 
     def __str__(self):
         return f'<{self.namespace}:{self.name}, {self.instance_type}, {self.cost}>'
@@ -216,7 +309,7 @@ class Node:
     cost = attr.ib(default=0.0)
 
     @classmethod
-    def from_k8s(cls, node):
+    def from_k8s(cls, node, cloud_provider=None):
         name = node.metadata.name
         instance_type = node.metadata.labels.get(
             'beta.kubernetes.io/instance-type', '')
@@ -235,14 +328,22 @@ class Node:
         return cls(name, nodegroup, '', '', '', instance_type, 0.0)
 
     @classmethod
-    def from_file(cls, node_dict):
+    def from_raw(cls, node_json, cloud_provider=None):
+        metadata = node_json['metadata']
+        return cls.from_file({
+            'name': metadata.get('name'),
+            'labels': metadata.get('labels') or {},
+        }, cloud_provider)
+
+    @classmethod
+    def from_file(cls, node_dict, cloud_provider=None):
         node = V1Node(
             metadata=V1ObjectMeta(
                 name=node_dict['name'],
                 labels=node_dict['labels']
             ),
         )
-        return cls.from_k8s(node)
+        return cls.from_k8s(node, cloud_provider)
 
 
 @attr.s
@@ -262,12 +363,18 @@ class ClusterCost:
     no_resource_spec = attr.ib(default=False)
     from_file = attr.ib(default=False)
     file_data = attr.ib(default=None)
+    pod_informer = attr.ib(default=None)
+    node_informer = attr.ib(default=None)
+    page_size = attr.ib(default=500)
+    cloud_provider = attr.ib(default=None)
     hours_in_week = 168
     hours_in_month = 730
     hours_in_year = 8760
 
     def get_current_cluster_cost(self):
-        nodes = self.get_nodes()
+        return self.price_nodes(self.get_nodes())
+
+    def price_nodes(self, nodes):
         for node in nodes:
             node_spec = self.instance_selector.spec_for_inst_type(node.instance_type)
             if not node_spec:
@@ -279,12 +386,17 @@ class ClusterCost:
         return nodes
 
     def get_nodeless_pods(self, namespace):
-        pods = self.get_pods(namespace)
-        for pod in pods:
-            cpu = max(pod.lim_cpu, pod.req_cpu)
-            memory = max(pod.lim_memory, pod.req_memory)
-            pod.instance_type, pod.cost, pod.spot_price = self.instance_selector.get_cheapest_instance(cpu, memory,
-                                                                                                       pod.gpu_spec)
+        return self.price_pods(self.get_pods(namespace))
+
+    def price_pods(self, pods):
+        '''Prices a list of pods in one batch'''
+        cpus = [max(pod.lim_cpu, pod.req_cpu) for pod in pods]
+        memories = [max(pod.lim_memory, pod.req_memory) for pod in pods]
+        instance_types, costs, spot_prices = self.instance_selector.get_cheapest_instances(
+            cpus, memories, [pod.gpu_spec for pod in pods])
+        for pod, cpu, memory, instance_type, cost, spot_price in zip(
+                pods, cpus, memories, instance_types, costs.tolist(), spot_prices.tolist()):
+            pod.instance_type, pod.cost, pod.spot_price = instance_type, cost, spot_price
             if cpu == 0 and memory == 0:
                 pod.no_resource_spec = True
         return pods
@@ -316,41 +428,178 @@ class ClusterCost:
     def get_pods(self, namespace):
         if self.from_file:
             return [Pod.from_file(pod_dict) for pod_dict in self.file_data['pods']]
+        if self.pod_informer and self.pod_informer.has_synced():
+            pods = self.pod_informer.items()
+            if namespace != '':
+                pods = [pod for pod in pods if pod.namespace == namespace]
+            return pods
         if namespace == '':
-            kpods = self.core_client.list_pod_for_all_namespaces()
+            pages = iter_raw_pages(
+                self.core_client.list_pod_for_all_namespaces, self.page_size)
         else:
-            kpods = self.core_client.list_namespaced_pod(namespace)
-        return [Pod.from_k8s(kpod) for kpod in kpods.items]
+            pages = iter_raw_pages(
+                self.core_client.list_namespaced_pod, self.page_size, namespace=namespace)
+        return [Pod.from_raw(pod_json) for page in pages for pod_json in page['items']]
 
     def get_nodes(self):
         if self.from_file:
-            return [Node.from_file(node_dict) for node_dict in self.file_data['nodes']]
+            return [Node.from_file(node_dict, self.cloud_provider)
+                    for node_dict in self.file_data['nodes']]
+        if self.node_informer and self.node_informer.has_synced():
+            return self.node_informer.items()
         nodes = self.core_client.list_node()
         filtered_nodes = self._filter_kip_nodes(nodes)
         print('num worker nodes', len(filtered_nodes))
-        return [Node.from_k8s(node) for node in filtered_nodes]
+        return [Node.from_k8s(node, self.cloud_provider) for node in filtered_nodes]
 
     def _filter_kip_nodes(self, nodes):
         filtered_nodes = [
             node for node in nodes.items
-            if not node.metadata.labels.get(KIP_NODE_LABEL_KEY, '') == KIP_NODE_LABEL_VALUE
+            if not is_kip_node(node)
         ]
         return filtered_nodes
 
+    def start_informers(self, watch_timeout=300):
+        self.pod_informer = Informer(
+            self.core_client.list_pod_for_all_namespaces,
+            Pod.from_raw,
+            name='pods',
+            watch_timeout=watch_timeout,
+            page_size=self.page_size)
+        self.node_informer = Informer(
+            self.core_client.list_node,
+            functools.partial(_node_from_raw, cloud_provider=self.cloud_provider),
+            name='nodes',
+            watch_timeout=watch_timeout,
+            page_size=self.page_size)
+        self.pod_informer.start()
+        self.node_informer.start()
+
+
+TIMEFRAME_HOURS = {
+    WEEK: ClusterCost.hours_in_week,
+    MONTH: ClusterCost.hours_in_month,
+    YEAR: ClusterCost.hours_in_year,
+}
+
+
+def is_kip_node(node):
+    return node.metadata.labels.get(KIP_NODE_LABEL_KEY, '') == KIP_NODE_LABEL_VALUE
+
 
-def make_cluster_cost_calculator(kubeconfig, cloud_provider, region, from_file=False, file_path=''):
-    scriptdir = os.path.dirname(os.path.realpath(__file__))
-    datadir = os.path.join(scriptdir, 'instance-data')
-    instance_selector = make_instance_selector(datadir, cloud_provider, region)
-    if kubeconfig:
-        config.load_kube_config(config_file=kubeconfig)
+def _node_from_raw(node_json, cloud_provider=None):
+    labels = node_json['metadata'].get('labels') or {}
+    if labels.get(KIP_NODE_LABEL_KEY, '') == KIP_NODE_LABEL_VALUE:
+        return None
+    return Node.from_raw(node_json, cloud_provider)
+
+
+@attr.s
+class Settings:
+    '''Configuration of the app, read from the environment'''
+    cloud_provider = attr.ib(default=None)
+    region = attr.ib(default=None)
+    kubeconfig = attr.ib(default='')
+    from_file = attr.ib(default=False)
+    file_path = attr.ib(default='/app/input_data.json')
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            cloud_provider=os.getenv('CLOUD_PROVIDER'),
+            region=os.getenv('REGION'),
+            kubeconfig=os.getenv('KUBECONFIG', ''),
+            from_file=bool(os.getenv('FROM_FILE', False)),
+            file_path=os.getenv('INPUT_FILE_PATH', '/app/input_data.json'),
+        )
+
+
+def check_config(settings):
+    if not settings.cloud_provider:
+        raise ValueError(
+            'CLOUD_PROVIDER environment variable is required. '
+            'Please restart this pod with a CLOUD_PROVIDER '
+            'environment variable set (one of: aws, gce, azure)')
+    if not settings.region:
+        raise ValueError(
+            'REGION environment variable is required. '
+            'Please restart this pod with a REGION environment variable set.')
+
+
+def load_catalog(settings):
+    return make_instance_selector(INSTANCE_DATA_DIR, settings.cloud_provider, settings.region)
+
+
+def make_spot_price_table(instance_selector, settings):
+    refresh_interval = float(os.getenv('SPOT_PRICE_REFRESH_INTERVAL', 60))
+    if refresh_interval <= 0:
+        return None
+    spot_price_table = SpotPriceTable(
+        instance_selector.price_getter, settings.region, refresh_interval)
+    instance_selector.price_getter = spot_price_table
+    return spot_price_table
+
+
+def make_cluster_cost_calculator(instance_selector, settings):
+    if settings.from_file:
+        data = _load_json_data(settings.file_path)
+        return ClusterCost(None, instance_selector, from_file=True, file_data=data,
+                           cloud_provider=settings.cloud_provider)
+    if settings.kubeconfig:
+        config.load_kube_config(config_file=settings.kubeconfig)
     else:
         config.load_incluster_config()
-    if from_file:
-        data = _load_json_data(file_path)
-        return ClusterCost(None, instance_selector, from_file=True, file_data=data)
-    core_client = client.CoreV1Api()
-    return ClusterCost(core_client, instance_selector)
+    return ClusterCost(
+        client.CoreV1Api(), instance_selector,
+        page_size=int(os.getenv('KUBE_LIST_PAGE_SIZE', 500)),
+        cloud_provider=settings.cloud_provider)
+
+
+def start_cluster_cost_calculator(cluster_cost):
+    if cluster_cost.from_file:
+        return
+    # connections opened before a fork must not be shared by workers
+    cluster_cost.core_client = client.CoreV1Api()
+    if os.getenv('USE_INFORMERS', 'yes').lower() not in ('no', 'false', '0'):
+        cluster_cost.start_informers(
+            watch_timeout=int(os.getenv('KUBE_WATCH_TIMEOUT', 300)))
+
+
+def make_snapshots(cluster_cost):
+    snapshots = make_snapshot_scheduler(cluster_cost, make_node_packer(cluster_cost))
+    snapshots.current()
+    return snapshots
+
+
+def make_startup(settings):
+    '''Startup phases of the app, each one builds on the previous'''
+    startup = Startup()
+    startup.add('config', lambda: check_config(settings))
+
+    def catalog():
+        startup.get('config')
+        return load_catalog(settings)
+
+    def spot_prices():
+        return make_spot_price_table(startup.get('catalog'), settings)
+
+    def cluster_cost():
+        # spot prices fill in later, pods are priced on-demand until then
+        startup.get('spot_prices')
+        return make_cluster_cost_calculator(startup.get('catalog'), settings)
+
+    startup.add('catalog', catalog)
+    startup.add('spot_prices', spot_prices,
+                ready=lambda table: table is None or table.loaded,
+                start=lambda table: table and table.start())
+    startup.add('cluster_cost', cluster_cost,
+                start=start_cluster_cost_calculator)
+    startup.add('snapshots', lambda: make_snapshots(startup.get('cluster_cost')),
+                ready=lambda snapshots: snapshots.has_snapshot,
+                start=lambda snapshots: snapshots.start())
+    startup.add('history', lambda: make_history_sampler(startup.get('snapshots')),
+                start=lambda sampler: sampler and sampler.start())
+    return startup
 
 
 def _load_json_data(file_path):
@@ -359,10 +608,96 @@ def _load_json_data(file_path):
     return data
 
 
-@app.route('/', methods=['GET', 'POST'])
+def packing_constraints():
+    families = os.getenv('PACKING_INSTANCE_FAMILIES', '')
+    max_pods = int(os.getenv('PACKING_MAX_PODS_PER_NODE', 110))
+    if max_pods < 1:
+        raise ValueError('PACKING_MAX_PODS_PER_NODE must be at least 1')
+    return PackingConstraints(
+        max_pods_per_node=max_pods,
+        reserved_cpu=float(os.getenv('PACKING_RESERVED_CPU', 0.1)),
+        reserved_memory=float(os.getenv('PACKING_RESERVED_MEMORY', 0.5)),
+        families=[family.strip() for family in families.split(',') if family.strip()])
+
+
+def make_node_packer(cluster_cost):
+    '''Packer of the snapshot pods onto the nodes of the region catalog,
+    None when NODE_PACKING is disabled'''
+    if os.getenv('NODE_PACKING', 'yes').lower() in ('no', 'false', '0'):
+        return None
+    return NodePacker(cluster_cost.instance_selector, packing_constraints())
+
+
+def make_snapshot_scheduler(cluster_cost, pack=None):
+    # shared by the workers, so they send the same Last-Modified
+    state_dir = os.getenv('SNAPSHOT_STATE_DIR',
+                          os.path.join(tempfile.gettempdir(), 'cost_calculator_snapshots'))
+    return SnapshotScheduler(
+        lambda version: build_snapshot(cluster_cost, version, TIMEFRAME_HOURS, pack),
+        interval=float(os.getenv('SNAPSHOT_INTERVAL', 30)),
+        max_staleness=float(os.getenv('SNAPSHOT_MAX_STALENESS', 300)),
+        change_times=ChangeTimes(state_dir) if state_dir else None)
+
+
+def make_history_sampler(snapshots):
+    '''Sampler recording the cost history, None when HISTORY_DB is not
+    set. The file should be on a volume that outlives the container.'''
+    path = os.getenv('HISTORY_DB', '')
+    if not path:
+        return None
+    interval = float(os.getenv('HISTORY_INTERVAL', 300))
+    if interval < 1:
+        raise ValueError('HISTORY_INTERVAL must be at least 1 second')
+    return HistorySampler(CostHistory(path, raw_step=interval), snapshots, interval)
+
+
+def get_startup():
+    return current_app.extensions['cost_calculator']
+
+
+def current_snapshot():
+    '''The snapshot of the current request, the same one is used for
+    its validators and its body'''
+    if 'snapshot' not in g:
+        g.snapshot = get_startup().get('snapshots').current()
+    return g.snapshot
+
+
+@bp.before_request
+def answer_conditional_get():
+    if request.method not in ('GET', 'HEAD') or request.endpoint not in SNAPSHOT_ENDPOINTS:
+        return None
+    # messages flashed by an earlier request are shown on this page only
+    g.pending_flashes = bool(session.get('_flashes'))
+    if g.pending_flashes:
+        return None
+    snapshot = current_snapshot()
+    if not_modified(request, snapshot):
+        return set_validators(flask.Response(status=304), snapshot)
+    return None
+
+
+@bp.after_request
+def add_validators_and_compress(response):
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200 and
+            request.endpoint in SNAPSHOT_ENDPOINTS and not g.get('pending_flashes')):
+        set_validators(response, current_snapshot())
+    return compress(response, request.accept_encodings,
+                    current_app.config['COMPRESS_MIN_SIZE'])
+
+
+def selected_timeframe():
+    period = MONTH
+    if request.method == 'POST':
+        period = request.form.get('timeframes') or MONTH
+        if total_pods_cost(period) is None:
+            period = MONTH
+    return period
+
+
+@bp.route('/', methods=['GET', 'POST'])
 def cost_summary():
     # TODO clean this up!!!
-    namespace = ''
     data = {
         'pod_cost': 0,
         'pod_spot_cost': 0,
@@ -377,50 +712,44 @@ def cost_summary():
         'savings_for_spot': 0,
         'savings_percentage': 0,
         'savings_spot_percentage': 0,
+        'optimal_node_cost': None,
+        'optimal_node_count': 0,
+        'unplaced_pods': 0,
         'selected_timeframe': '',
         'timeframes': [WEEK, MONTH, YEAR]
     }
 
-    pods = cluster_cost_calculator.get_nodeless_pods(namespace)
-    nodes = cluster_cost_calculator.get_current_cluster_cost()
+    snapshot = current_snapshot()
     # default to month for time
-    period = MONTH
-    timeframe = total_pods_cost(period)
-    if request.method == 'POST':
-        period = request.form.get('timeframes')
-        timeframe = total_pods_cost(period)
+    period = selected_timeframe()
     data['selected_timeframe'] = period
-    invalid_nodes = []
-    for node in nodes:
-        if not node.cost:
-            invalid_nodes.append(node.name)
-        else:
-            data['node_cost'] += node.cost
-            data['node_total_cpu'] += node.cpu
-            data['node_total_memory'] += node.memory
-    for pod in pods:
-        data['pod_cost'] += pod.cost
-        data['pod_spot_cost'] += pod.spot_price
-        data['pod_total_cpu'] += max(pod.req_cpu, pod.lim_cpu)
-        data['pod_total_memory'] += max(pod.req_memory, pod.lim_memory)
-    if invalid_nodes:
+    pod_totals = snapshot.totals(timeframe=period)
+    data['node_total_cpu'] = snapshot.node_totals.cpu
+    data['node_total_memory'] = snapshot.node_totals.memory
+    data['pod_total_cpu'] = pod_totals.cpu
+    data['pod_total_memory'] = pod_totals.memory
+    if snapshot.invalid_nodes:
         flash('Error: cost summary is likely incorrect. Could not calculate '
               'node cost for the following nodes: {}'.format(
-            ', '.join(invalid_nodes)))
-    data['node_cost'] = round(data['node_cost'] * timeframe, 2)
-    data['pod_cost'] = round(data['pod_cost'] * timeframe, 2)
-    data['pod_spot_cost'] = round(data['pod_spot_cost'] * timeframe, 2)
-    data['node_count'] = len(nodes)
-    data['pod_count'] = len(pods)
+            ', '.join(snapshot.invalid_nodes)))
+    data['node_cost'] = round(snapshot.timeframe_node_cost[period], 2)
+    data['pod_cost'] = round(pod_totals.cost, 2)
+    data['pod_spot_cost'] = round(pod_totals.spot_price, 2)
+    data['node_count'] = len(snapshot.nodes)
+    data['pod_count'] = pod_totals.pod_count
     data['savings'] = round(data['node_cost'] - data['pod_cost'], 2)
     data['savings_for_spot'] = round(data['node_cost'] - data['pod_spot_cost'], 2)
     if data['node_cost'] != 0:
         data['savings_percentage'] = round((data['savings'] / data['node_cost']) * 100, 2)
         data['savings_spot_percentage'] = round((data['savings_for_spot'] / data['node_cost']) * 100, 2)
+    if snapshot.packing is not None:
+        data['optimal_node_cost'] = round(snapshot.packing.cost * TIMEFRAME_HOURS[period], 2)
+        data['optimal_node_count'] = snapshot.packing.node_count
+        data['unplaced_pods'] = snapshot.packing.unplaced_pods
     return flask.render_template('comparison.html', data=data)
 
 
-@app.route('/node_cost', methods=['GET', 'POST'])
+@bp.route('/node_cost', methods=['GET', 'POST'])
 def node_cost():
     data = {
         'cost': 0,
@@ -429,91 +758,173 @@ def node_cost():
         'selected_timeframe': '',
         'timeframes': [WEEK, MONTH, YEAR]
     }
-    nodes = cluster_cost_calculator.get_current_cluster_cost()
-
-    period = MONTH
-    timeframe = total_pods_cost(period)
-    if request.method == 'POST':
-        period = request.form.get('timeframes')
-        if period:
-            timeframe = total_pods_cost(period)
+    snapshot = current_snapshot()
+    period = selected_timeframe()
     data['selected_timeframe'] = period
-
-    for node in nodes:
-        print(node)
-        data['cost'] += node.cost
-    data['cost'] = round(data['cost'] * timeframe, 2)
-    data['nodes'] = nodes
-    data['node_count'] = len(nodes)
+    data['cost'] = round(snapshot.timeframe_node_cost[period], 2)
+    data['nodes'] = snapshot.nodes
+    data['node_count'] = len(snapshot.nodes)
 
     # get the pod selected
     return flask.render_template('node_cost.html', data=data)
 
 
-@app.route('/nodeless_forcast', methods=['GET', 'POST'])
+@bp.route('/nodeless_forcast', methods=['GET', 'POST'])
 def forcast_summary():
-    namespace = ''
+    namespace = 'all'
     data = {
         'cost': 0,
-        'pods': [],
         'pod_count': 0,
         'selected_namespace': '',
         'namespaces': ['all'],
         'selected_timeframe': '',
         'timeframes': [WEEK, MONTH, YEAR]
     }
-    pods = cluster_cost_calculator.get_nodeless_pods(namespace)
-    for pod in pods:
-        if pod.namespace not in data['namespaces']:
-            data['namespaces'].append(pod.namespace)
+    snapshot = current_snapshot()
+    data['namespaces'] += snapshot.namespaces
 
-    period = MONTH
-    timeframe = total_pods_cost(period)
     if request.method == 'POST':
-        namespace = request.form.get('namespaces')
-        if not namespace:
-            namespace = 'all'
-        else:
+        namespace = request.form.get('namespaces') or 'all'
+        if namespace != 'all':
             data['selected_namespace'] = namespace
-        for pod in pods:
-            if pod.namespace != namespace and namespace != 'all':
-                continue
-            data['pods'].append(pod)
-        period = request.form.get('timeframes')
-        if period:
-            timeframe = total_pods_cost(period)
+    period = selected_timeframe()
     data['selected_timeframe'] = period
 
-    if request.method == 'GET':
-        data['pods'] = pods
-
-    print('namespace: ', namespace)
-    data['cost'] = cluster_cost_calculator.get_total_nodeless_cost(
-        namespace, timeframe
-    )
-    data['spot_cost'] = cluster_cost_calculator.get_total_nodeless_cost(
-        namespace, timeframe, cost_field='spot_price'
-    )
-    data['pod_count'] = len(data['pods'])
+    # the pod table is filled page by page from /api/v1/cost/pods
+    totals = snapshot.totals(namespace, timeframe=period)
+    data['cost'] = round(totals.cost, 3)
+    data['spot_cost'] = round(totals.spot_price, 3)
+    data['pod_count'] = totals.pod_count
 
     return flask.render_template('cost_summary.html', data=data)
 
 
-@app.route('/api/cost/pods/<namespace>', methods=['GET'])
+@bp.route('/api/cost/pods/<namespace>', methods=['GET'])
 def calc(namespace):
-    if namespace == 'all':
-        namespace = ''
-    return cluster_cost_calculator.pod_costs(namespace)
+    pods = current_snapshot().pods_in(namespace)
+    return jsonify(costs=[pod.cost * 100 for pod in pods])
+
+
+@bp.route('/api/v1/cost/pods', methods=['GET'])
+def pod_cost_query():
+    '''Pod costs of the current snapshot, filtered, sorted and paginated,
+    or aggregated by namespace, instance type or owner.'''
+    try:
+        query = PodQuery.from_args(request.args, TIMEFRAME_HOURS)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    snapshot = current_snapshot()
+    return jsonify(query.run(snapshot, TIMEFRAME_HOURS))
+
+
+@bp.route('/api/v1/cost/history', methods=['GET'])
+def cost_history():
+    '''Hourly node, on-demand and spot cost of the cluster or of a
+    namespace over time, at the finest resolution still stored for
+    the range unless one is asked for.'''
+    sampler = get_startup().get('history')
+    if sampler is None:
+        return jsonify(error='cost history is disabled'), 404
+    namespace = request.args.get('namespace', 'all')
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 7 * DAY))
+    except ValueError:
+        return jsonify(error='start and end must be unix timestamps'), 400
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in TIERS_BY_NAME:
+        return jsonify(error='resolution must be one of: {}'.format(
+            ', '.join(TIERS_BY_NAME))), 400
+    history = sampler.history
+    tier, series = history.query(
+        ALL_NAMESPACES if namespace == 'all' else namespace,
+        start, end, TIERS_BY_NAME.get(resolution))
+    return jsonify(namespace=namespace, resolution=tier.name,
+                   step=tier.step or history.raw_step, **series)
+
+
+@bp.route('/api/v1/cost/regions', methods=['GET'])
+def region_comparison():
+    '''On-demand nodeless cost of the pods of the current snapshot in
+    every region of the given providers, cheapest first'''
+    providers = request.args.getlist('provider') or list(PROVIDERS)
+    unknown = [provider for provider in providers if provider not in PROVIDERS]
+    if unknown:
+        return jsonify(error='unknown providers: {}'.format(', '.join(unknown))), 400
+    timeframe = request.args.get('timeframe', MONTH)
+    if timeframe not in TIMEFRAME_HOURS:
+        return jsonify(error='invalid timeframe: {}'.format(timeframe)), 400
+    hours = TIMEFRAME_HOURS[timeframe]
+    targets = list_targets(INSTANCE_DATA_DIR, providers, request.args.getlist('region') or None)
+    snapshot = current_snapshot()
+    costs = compare_snapshot(snapshot, targets, INSTANCE_DATA_DIR)
+    return jsonify(timeframe=timeframe, pod_count=len(snapshot.pods),
+                   regions=[cost.to_dict(hours) for cost in costs])
+
+
+@bp.route('/export.<fmt>', methods=['GET'])
+def export(fmt):
+    '''Streams the per-pod cost report as CSV or NDJSON'''
+    if fmt not in EXPORT_FORMATS:
+        flask.abort(404)
+    namespace = request.args.get('namespace', 'all')
+    timeframe = request.args.get('timeframe', MONTH)
+    if timeframe not in TIMEFRAME_HOURS:
+        return jsonify(error='invalid timeframe: {}'.format(timeframe)), 400
+    pods = current_snapshot().pods_in(namespace)
+    iter_report, mimetype = EXPORT_FORMATS[fmt]
+    response = flask.Response(
+        flask.stream_with_context(iter_report(pods, TIMEFRAME_HOURS[timeframe])),
+        mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename="pod-costs-{}-{}.{}"'.format(
+        namespace, timeframe, fmt)
+    return response
+
+
+@bp.route('/api/status/spot_prices', methods=['GET'])
+def spot_price_status():
+    price_getter = get_startup().get('catalog').price_getter
+    if not isinstance(price_getter, SpotPriceTable):
+        return jsonify(loaded=False, live=True)
+    return jsonify(live=False, **price_getter.stats())
+
+
+@bp.route('/api/status/snapshot', methods=['GET'])
+def snapshot_status():
+    snapshots = get_startup().get('snapshots')
+    snapshot = snapshots.current()
+    return jsonify(
+        version=snapshot.version,
+        fingerprint=snapshot.fingerprint,
+        age=snapshot.age(),
+        build_duration=snapshot.build_duration,
+        pod_count=len(snapshot.pods),
+        node_count=len(snapshot.nodes),
+        last_error=snapshots.last_error)
+
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify(status='ok', phases=get_startup().status())
+
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    startup = get_startup()
+    ready = startup.ready(READY_PHASES)
+    phases = startup.status()
+    if not ready:
+        startup.warm_up()
+    return jsonify(ready=ready, phases=phases), 200 if ready else 503
 
 
 def total_pods_cost(timeframe):
-    namespace = ''
     if timeframe == WEEK:
-        timeframe = cluster_cost_calculator.hours_in_week
+        timeframe = ClusterCost.hours_in_week
     elif timeframe == MONTH:
-        timeframe = cluster_cost_calculator.hours_in_month
+        timeframe = ClusterCost.hours_in_month
     elif timeframe == YEAR:
-        timeframe = cluster_cost_calculator.hours_in_year
+        timeframe = ClusterCost.hours_in_year
     else:
         flash('Error: Timeframe given is not valid. '
               'Given timeframe: {}'.format(timeframe))
@@ -521,27 +932,31 @@ def total_pods_cost(timeframe):
     return timeframe
 
 
-kubeconfig = os.getenv('KUBECONFIG', '')
-cloud_provider = os.getenv('CLOUD_PROVIDER')
-if not cloud_provider:
-    logger.fatal(
-        'CLOUD_PROVIDER environment variable is required. '
-        'Please restart this pod with a CLOUD_PROVIDER '
-        'environment variable set (one of: aws, gce, azure)')
-    sys.exit(1)
-region = os.getenv('REGION')
-if not region:
-    logger.fatal(
-        'REGION environment variable is required. '
-        'Please restart this pod with a REGION environment variable set.')
-    sys.exit(1)
-
-from_file = False
-if os.getenv('FROM_FILE', False):
-    from_file = True
-file_path = os.getenv('INPUT_FILE_PATH', '/app/input_data.json')
-
-if not os.getenv('IS_TEST_SUITE', False):
-    cluster_cost_calculator = make_cluster_cost_calculator(
-        kubeconfig, cloud_provider, region, from_file=from_file, file_path=file_path
-    )
+def create_app(settings=None, preload=False, start=True):
+    '''Creates the Flask app.
+
+    preload is True to run every startup phase before returning, or the
+    names of the phases to run, so a server that forks workers afterwards
+    shares what they build between them. start starts the background
+    threads and warms up the remaining phases, a server that forks has
+    to call start_app() in every worker instead.
+    '''
+    if settings is None:
+        settings = Settings.from_env()
+    app = Flask(__name__)
+    # shared by forked workers, so flashed messages survive a worker switch
+    app.secret_key = os.getenv('SECRET_KEY', '').encode('utf-8') or os.urandom(24)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    app.extensions['cost_calculator'] = make_startup(settings)
+    app.register_blueprint(bp)
+    if preload:
+        app.extensions['cost_calculator'].preload(None if preload is True else preload)
+    if start:
+        start_app(app)
+    return app
+
+
+def start_app(app):
+    startup = app.extensions['cost_calculator']
+    startup.start()
+    startup.warm_up()
@@ -0,0 +1,282 @@
+'''Simulated packing of the pods onto the cheapest mix of nodes.
+
+The nodes a cluster runs today are a poor baseline for the nodeless
+cost when the node pools are oversized. pack_pods() packs the resource
+requests of the pods onto instance types of the region catalog with
+first-fit decreasing, then moves every packed node to the cheapest
+instance type its load fits, so the result is a mix of instance types.
+
+Pods are packed by distinct request shape with a count of pods per
+shape. Identical pods fill the open nodes in order, which is what
+first-fit does with them one at a time, so every shape is one
+vectorized step over the open nodes instead of a loop over its pods.
+Clusters with more than MAX_SHAPES distinct requests have their
+requests rounded up to a few percent, see coarsen().
+'''
+import hashlib
+from types import MappingProxyType
+
+import attr
+import numpy as np
+
+# slack for rounding errors when comparing requests to capacities
+EPSILON = 1e-9
+MAX_SHAPES = 2000
+# relative steps tried by coarsen(), smallest first
+ROUNDING_STEPS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+@attr.s(frozen=True)
+class PackingConstraints:
+    '''Limits of the simulated nodes. reserved_cpu (cores) and
+    reserved_memory (GiB) are kept by every node for the kubelet and
+    system daemons. families limits the instance types to those
+    starting with one of the prefixes, all types are used when empty.
+    candidates is the number of instance types tried as the type
+    nodes are opened with.'''
+    max_pods_per_node = attr.ib(default=110)
+    reserved_cpu = attr.ib(default=0.1)
+    reserved_memory = attr.ib(default=0.5)
+    families = attr.ib(default=(), converter=tuple)
+    burstable = attr.ib(default=False)
+    candidates = attr.ib(default=4)
+
+    @max_pods_per_node.validator
+    def _check_max_pods(self, attribute, value):
+        if value < 1:
+            raise ValueError('max_pods_per_node must be at least 1')
+
+
+@attr.s(frozen=True)
+class PackingResult:
+    '''Hourly cost of the packed nodes, and number of nodes by instance
+    type. unplaced_pods is the number of pods no allowed instance type
+    can hold, pods requesting GPUs are not packed and are counted there.'''
+    cost = attr.ib(default=0.0)
+    node_count = attr.ib(default=0)
+    instance_types = attr.ib(default=MappingProxyType({}), converter=MappingProxyType)
+    pod_count = attr.ib(default=0)
+    unplaced_pods = attr.ib(default=0)
+
+
+def _needs_gpu(pod):
+    return bool((pod.gpu_spec or '').strip())
+
+
+def request_shapes(pods):
+    '''Distinct (cpu, memory) requests of pods, and the pod count of each'''
+    requests = np.array([(pod.req_cpu, pod.req_memory) for pod in pods
+                         if not _needs_gpu(pod)],
+                        dtype=float).reshape(-1, 2)
+    shapes, counts = np.unique(requests, axis=0, return_counts=True)
+    return shapes[:, 0], shapes[:, 1], counts
+
+
+def _round_up(values, step):
+    '''values rounded up to the next power of 1 + step'''
+    base = np.log1p(step)
+    positive = values > 0
+    rounded = values.copy()
+    rounded[positive] = np.exp(np.ceil(np.log(values[positive]) / base - EPSILON) * base)
+    return np.maximum(rounded, values)
+
+
+def coarsen(cpus, memories, counts, max_shapes=MAX_SHAPES):
+    '''Merges request shapes rounded up on the smallest relative step
+    that leaves at most max_shapes of them. Packing time grows with the
+    number of shapes, the rounded requests overestimate the cost by
+    less than the step.'''
+    for step in ROUNDING_STEPS:
+        if len(counts) <= max_shapes:
+            break
+        shapes, inverse = np.unique(
+            np.stack([_round_up(cpus, step), _round_up(memories, step)], axis=1),
+            axis=0, return_inverse=True)
+        if len(shapes) <= max_shapes or step == ROUNDING_STEPS[-1]:
+            counts = np.bincount(inverse.reshape(-1), weights=counts).astype(np.int64)
+            return shapes[:, 0], shapes[:, 1], counts
+    return cpus, memories, counts
+
+
+def allowed_types(columns, constraints):
+    '''Rows of the catalog that can be used as nodes, with their
+    allocatable cpu and memory'''
+    mask = (columns.price > 0.0) & (columns.gpu == 0)
+    if not constraints.burstable:
+        mask &= ~columns.burstable
+    if constraints.families:
+        mask &= np.array([inst_type.startswith(constraints.families)
+                          for inst_type in columns.instance_type], dtype=bool)
+    cpus = columns.cpu - constraints.reserved_cpu
+    memories = columns.memory - constraints.reserved_memory
+    mask &= (cpus > 0) & (memories > 0)
+    rows = np.flatnonzero(mask)
+    return rows, cpus[rows], memories[rows]
+
+
+def _per_node(cpu, memory, node_cpu, node_memory, max_pods):
+    '''How many pods of a shape fit into the free capacities'''
+    fit = np.minimum(max_pods, np.inf)
+    if cpu > 0:
+        fit = np.minimum(fit, np.floor((node_cpu + EPSILON) / cpu))
+    if memory > 0:
+        fit = np.minimum(fit, np.floor((node_memory + EPSILON) / memory))
+    return fit.astype(np.int64)
+
+
+def first_fit_decreasing(cpus, memories, counts, node_cpu, node_memory, max_pods):
+    '''Packs counts[i] pods of every (cpus[i], memories[i]) shape onto
+    nodes of one size. Returns the used cpu, memory and pod count of
+    every node. All shapes must fit an empty node.'''
+    size = np.maximum(cpus / node_cpu, memories / node_memory)
+    order = np.argsort(-size, kind='stable')
+    capacity = int(counts.sum())
+    free_cpu = np.empty(capacity)
+    free_memory = np.empty(capacity)
+    free_pods = np.empty(capacity, dtype=np.int64)
+    nodes = 0
+    for i in order:
+        cpu, memory, count = cpus[i], memories[i], int(counts[i])
+        if nodes:
+            fit = _per_node(cpu, memory, free_cpu[:nodes], free_memory[:nodes],
+                            free_pods[:nodes])
+            # every node takes what fits of what the nodes before it left
+            before = np.cumsum(fit) - fit
+            take = np.minimum(fit, np.maximum(count - before, 0))
+            free_cpu[:nodes] -= take * cpu
+            free_memory[:nodes] -= take * memory
+            free_pods[:nodes] -= take
+            count -= int(take.sum())
+        if count:
+            per_node = int(_per_node(cpu, memory, node_cpu, node_memory, max_pods))
+            new = -(-count // per_node)
+            take = np.full(new, per_node, dtype=np.int64)
+            take[-1] = count - per_node * (new - 1)
+            end = nodes + new
+            free_cpu[nodes:end] = node_cpu - take * cpu
+            free_memory[nodes:end] = node_memory - take * memory
+            free_pods[nodes:end] = max_pods - take
+            nodes = end
+    return (node_cpu - free_cpu[:nodes], node_memory - free_memory[:nodes],
+            max_pods - free_pods[:nodes])
+
+
+def right_size(used_cpu, used_memory, type_cpus, type_memories, type_prices):
+    '''Index of the cheapest type every node's load fits'''
+    fits = ((type_cpus[None, :] + EPSILON >= used_cpu[:, None]) &
+            (type_memories[None, :] + EPSILON >= used_memory[:, None]))
+    prices = np.where(fits, type_prices[None, :], np.inf)
+    return np.argmin(prices, axis=1)
+
+
+def _fits(cpus, memories, type_cpus, type_memories):
+    '''Matrix telling whether every shape fits every type'''
+    return ((type_cpus[None, :] + EPSILON >= cpus[:, None]) &
+            (type_memories[None, :] + EPSILON >= memories[:, None]))
+
+
+def shape_groups(fits, counts):
+    '''Splits the shapes into groups that one type holds entirely, so
+    that every group can be packed onto nodes of a single size. Every
+    group is what the type holding the most of the remaining pods
+    holds. Returns a boolean mask of the shapes of every group.'''
+    groups = []
+    remaining = np.ones(len(counts), dtype=bool)
+    while remaining.any():
+        held = np.dot(counts * remaining, fits)
+        group = remaining & fits[:, int(np.argmax(held))]
+        groups.append(group)
+        remaining &= ~group
+    return groups
+
+
+def _pack_group(cpus, memories, counts, type_cpus, type_memories, type_prices,
+                constraints):
+    '''Cheapest packing of shapes that at least one type holds all of,
+    returns the type of every node'''
+    # types nodes are opened with must hold every shape, they are tried
+    # in order of a lower bound of the cost of packing with them alone
+    holds_all = ((type_cpus + EPSILON >= cpus.max()) &
+                 (type_memories + EPSILON >= memories.max()))
+    candidates = np.flatnonzero(holds_all)
+    total_cpu = float(np.dot(cpus, counts))
+    total_memory = float(np.dot(memories, counts))
+    max_pods = constraints.max_pods_per_node
+    bound = type_prices[candidates] * np.maximum.reduce([
+        total_cpu / type_cpus[candidates],
+        total_memory / type_memories[candidates],
+        np.full(len(candidates), float(counts.sum()) / max_pods),
+    ])
+    candidates = candidates[np.argsort(bound, kind='stable')[:constraints.candidates]]
+
+    best = None
+    for candidate in candidates:
+        used_cpu, used_memory, _ = first_fit_decreasing(
+            cpus, memories, counts, type_cpus[candidate],
+            type_memories[candidate], max_pods)
+        node_types = right_size(used_cpu, used_memory, type_cpus, type_memories,
+                                type_prices)
+        cost = float(type_prices[node_types].sum())
+        if best is None or cost < best[0]:
+            best = (cost, node_types)
+    return best[1]
+
+
+def pack_pods(pods, columns, constraints=PackingConstraints()):
+    '''Packs the requests of pods onto the instance types of a region
+    catalog (CatalogColumns) and returns a PackingResult'''
+    cpus, memories, counts = request_shapes(pods)
+    rows, type_cpus, type_memories = allowed_types(columns, constraints)
+    type_prices = columns.price[rows]
+    pod_count = len(pods)
+    unplaced = pod_count - int(counts.sum())
+
+    # shapes that no allowed type can hold are left out
+    fits = _fits(cpus, memories, type_cpus, type_memories)
+    fits_any = fits.any(axis=1)
+    unplaced += int(counts[~fits_any].sum())
+    cpus, memories, counts = cpus[fits_any], memories[fits_any], counts[fits_any]
+    if not len(counts):
+        return PackingResult(pod_count=pod_count, unplaced_pods=unplaced)
+    cpus, memories, counts = coarsen(cpus, memories, counts)
+
+    # e.g. cpu-heavy and memory-heavy pods that no type holds both of
+    groups = shape_groups(_fits(cpus, memories, type_cpus, type_memories), counts)
+    node_types = np.concatenate([
+        _pack_group(cpus[group], memories[group], counts[group],
+                    type_cpus, type_memories, type_prices, constraints)
+        for group in groups
+    ])
+    cost = float(type_prices[node_types].sum())
+    types, type_counts = np.unique(columns.instance_type[rows][node_types],
+                                   return_counts=True)
+    return PackingResult(
+        cost=cost,
+        node_count=len(node_types),
+        instance_types={t: int(n) for t, n in zip(types, type_counts)},
+        pod_count=pod_count,
+        unplaced_pods=unplaced,
+    )
+
+
+class NodePacker(object):
+    '''pack_pods() on the catalog of an InstanceSelector, remembering
+    the last result so a snapshot with the same requests and catalog
+    is not packed again'''
+    def __init__(self, instance_selector, constraints=PackingConstraints()):
+        self.instance_selector = instance_selector
+        self.constraints = constraints
+        self._last = None
+
+    def __call__(self, pods):
+        digest = hashlib.blake2b(digest_size=16)
+        for pod in pods:
+            digest.update(b'%r,%r,%r;' % (pod.req_cpu, pod.req_memory, _needs_gpu(pod)))
+        key = (digest.digest(), self.instance_selector.catalog_version)
+        last = self._last
+        if last is not None and last[0] == key:
+            return last[1]
+        result = pack_pods(pods, self.instance_selector.price_index.columns,
+                           self.constraints)
+        self._last = (key, result)
+        return result
@@ -0,0 +1,341 @@
+'''Compiled instance catalogs.
+
+The JSON catalogs downloaded by download_instance_data.sh hold every
+region of a provider, while a running calculator only uses one. They
+are compiled into one binary file per provider, that is memory-mapped
+at runtime, so only the pages of the configured region are read and
+worker processes share them through the page cache.
+
+File layout, all numbers little endian:
+
+    magic (8 bytes) | header length (uint64) | header (JSON) | columns
+
+The header gives the dtype, offset and length of every column, and the
+row range of every region in the instance and custom columns. Strings
+(instance types, families, GPU types) live in one string table.
+
+Run this module as a script to compile the JSON files of a directory:
+
+    python cost_calculator/catalog.py cost_calculator/instance-data
+'''
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+
+MAGIC = b'NCCATLG1'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+NO_STRING = -1
+
+INSTANCE_FLOAT_FIELDS = ('cpu', 'memory', 'gpu', 'price', 'baseline')
+CUSTOM_FLOAT_FIELDS = (
+    'pricePerCPU',
+    'pricePerGBOfMemory',
+    'minimumMemoryPerCPU',
+    'maximumMemoryPerCPU',
+    'baseMemoryUnit',
+)
+
+
+def catalog_path(datadir, cloud):
+    return os.path.join(datadir, '{}_catalog.bin'.format(cloud))
+
+
+def json_paths(datadir, cloud):
+    return (
+        os.path.join(datadir, '{}_instance_data.json'.format(cloud)),
+        os.path.join(datadir, '{}_custom_instance_data.json'.format(cloud)),
+    )
+
+
+class _StringTable(object):
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def columns(self):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        offsets[1:] = np.cumsum([len(s) for s in encoded])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return offsets, data
+
+
+def _optional_json(inst, field):
+    if field not in inst:
+        return None
+    return json.dumps(inst[field], sort_keys=True)
+
+
+def compile_catalog(cloud, inst_data_by_region, custom_by_region, path):
+    '''Writes the catalogs of all regions of a provider to path'''
+    strings = _StringTable()
+    instance = {field: [] for field in INSTANCE_FLOAT_FIELDS}
+    instance.update(instanceType=[], generation=[], burstable=[],
+                    supportedGPUTypes=[])
+    custom = {field: [] for field in CUSTOM_FLOAT_FIELDS}
+    custom.update(instanceFamily=[], supportedGPUTypes=[], cpusStart=[])
+    custom_cpus = []
+    regions = {}
+    for region in sorted(set(inst_data_by_region) | set(custom_by_region)):
+        start = len(instance['instanceType'])
+        for inst in inst_data_by_region.get(region, []):
+            for field in INSTANCE_FLOAT_FIELDS:
+                instance[field].append(inst[field])
+            instance['instanceType'].append(strings.add(inst['instanceType']))
+            instance['generation'].append(strings.add(inst.get('generation')))
+            instance['burstable'].append(inst['burstable'])
+            instance['supportedGPUTypes'].append(
+                strings.add(_optional_json(inst, 'supportedGPUTypes')))
+        custom_start = len(custom['instanceFamily'])
+        for cid in custom_by_region.get(region, []):
+            for field in CUSTOM_FLOAT_FIELDS:
+                custom[field].append(cid[field])
+            custom['instanceFamily'].append(strings.add(cid['instanceFamily']))
+            custom['supportedGPUTypes'].append(
+                strings.add(_optional_json(cid, 'supportedGPUTypes')))
+            custom['cpusStart'].append(len(custom_cpus))
+            custom_cpus.extend(cid['possibleNumberOfCPUs'])
+        regions[region] = [start, len(instance['instanceType']),
+                           custom_start, len(custom['instanceFamily'])]
+    custom['cpusStart'].append(len(custom_cpus))
+
+    arrays = {}
+    for field in INSTANCE_FLOAT_FIELDS:
+        arrays['instance.' + field] = np.array(instance[field], dtype='<f8')
+    arrays['instance.burstable'] = np.array(instance['burstable'], dtype=np.uint8)
+    for field in ('instanceType', 'generation', 'supportedGPUTypes'):
+        arrays['instance.' + field] = np.array(instance[field], dtype='<i4')
+    for field in CUSTOM_FLOAT_FIELDS:
+        arrays['custom.' + field] = np.array(custom[field], dtype='<f8')
+    for field in ('instanceFamily', 'supportedGPUTypes'):
+        arrays['custom.' + field] = np.array(custom[field], dtype='<i4')
+    arrays['custom.cpusStart'] = np.array(custom['cpusStart'], dtype='<i8')
+    arrays['custom.cpus'] = np.array(custom_cpus, dtype='<f8')
+    arrays['strings.offsets'], arrays['strings.data'] = strings.columns()
+
+    columns = {}
+    offset = 0
+    for name, array in arrays.items():
+        columns[name] = [array.dtype.str, offset, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'cloud': cloud,
+        'regions': regions,
+        'columns': columns,
+    }).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(np.uint64(len(header)).astype('<u8').tobytes())
+        fp.write(header)
+        for name, array in arrays.items():
+            data = array.tobytes()
+            fp.write(data)
+            fp.write(b'\0' * (-len(data) % ALIGNMENT))
+    os.replace(tmp_path, path)
+
+
+class CompiledCatalog(object):
+    '''Read-only, memory-mapped view of a compiled catalog file'''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a compiled catalog'.format(path))
+        header_start = len(MAGIC) + 8
+        header_len = int(np.frombuffer(
+            self._mmap, dtype='<u8', count=1, offset=len(MAGIC))[0])
+        header = json.loads(
+            self._mmap[header_start:header_start + header_len].decode('utf-8'))
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError('{}: unsupported catalog version {}'.format(
+                path, header['version']))
+        self.cloud = header['cloud']
+        self.regions = header['regions']
+        data_start = header_start + header_len
+        self._columns = {
+            name: np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                offset=data_start + offset)
+            for name, (dtype, offset, count) in header['columns'].items()
+        }
+
+    def column(self, name):
+        return self._columns[name]
+
+    def string(self, index):
+        if index == NO_STRING:
+            return None
+        offsets = self._columns['strings.offsets']
+        data = self._columns['strings.data']
+        return data[offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def __contains__(self, region):
+        return region in self.regions
+
+    def __getitem__(self, region):
+        return CompiledRegion(self, region)
+
+    def custom_data(self, region):
+        '''Custom machine families of a region as JSON-style dicts'''
+        if region not in self.regions:
+            return []
+        _, _, start, stop = self.regions[region]
+        cpus_start = self.column('custom.cpusStart')
+        cpus = self.column('custom.cpus')
+        families = []
+        for row in range(start, stop):
+            cid = {field: float(self.column('custom.' + field)[row])
+                   for field in CUSTOM_FLOAT_FIELDS}
+            cid['instanceFamily'] = self.string(
+                self.column('custom.instanceFamily')[row])
+            cid['possibleNumberOfCPUs'] = [
+                _number(cpu) for cpu in cpus[cpus_start[row]:cpus_start[row + 1]]]
+            gpu_types = self.string(self.column('custom.supportedGPUTypes')[row])
+            if gpu_types is not None:
+                cid['supportedGPUTypes'] = json.loads(gpu_types)
+            families.append(cid)
+        return families
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class CompiledRegion(object):
+    '''Instance catalog of one region, a sequence of JSON-style dicts.
+
+    The numeric columns are slices of the memory-mapped file, dicts
+    are only built for the rows that are asked for.
+    '''
+    def __init__(self, catalog, region):
+        self.catalog = catalog
+        self.region = region
+        self.start, self.stop = catalog.regions[region][:2]
+        self._instance_types = None
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def column(self, field):
+        return self.catalog.column('instance.' + field)[self.start:self.stop]
+
+    @property
+    def instance_types(self):
+        if self._instance_types is None:
+            self._instance_types = np.array(
+                [self.catalog.string(i) for i in self.column('instanceType')],
+                dtype=object)
+        return self._instance_types
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        inst = {field: float(self.column(field)[row])
+                for field in INSTANCE_FLOAT_FIELDS}
+        inst['cpu'] = _number(inst['cpu'])
+        inst['gpu'] = int(inst['gpu'])
+        inst['instanceType'] = self.instance_types[row]
+        inst['burstable'] = bool(self.column('burstable')[row])
+        generation = self.catalog.string(self.column('generation')[row])
+        if generation is not None:
+            inst['generation'] = generation
+        gpu_types = self.catalog.string(self.column('supportedGPUTypes')[row])
+        if gpu_types is not None:
+            inst['supportedGPUTypes'] = json.loads(gpu_types)
+        return inst
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class JSONCatalog(object):
+    '''Catalog of a provider parsed from its JSON files, with the
+    interface of CompiledCatalog'''
+    def __init__(self, inst_data_by_region, custom_by_region):
+        self.regions = inst_data_by_region
+        self._custom_by_region = custom_by_region
+
+    def __contains__(self, region):
+        return region in self.regions
+
+    def __getitem__(self, region):
+        return self.regions[region]
+
+    def custom_data(self, region):
+        return self._custom_by_region.get(region, [])
+
+
+def open_catalog(datadir, cloud):
+    '''Returns the catalog of a provider.
+
+    The compiled catalog is used when it exists and is at least as new
+    as the JSON files, otherwise the JSON files are parsed.
+    '''
+    path = catalog_path(datadir, cloud)
+    inst_path, custom_path = json_paths(datadir, cloud)
+    sources = [p for p in (inst_path, custom_path) if os.path.exists(p)]
+    if os.path.exists(path) and all(
+            os.path.getmtime(path) >= os.path.getmtime(p) for p in sources):
+        return CompiledCatalog(path)
+    with open(inst_path) as fp:
+        inst_data_by_region = json.load(fp)
+    custom_by_region = {}
+    if os.path.exists(custom_path):
+        with open(custom_path) as fp:
+            custom_by_region = json.load(fp)
+    return JSONCatalog(inst_data_by_region, custom_by_region)
+
+
+def load_catalog(datadir, cloud, region):
+    '''Returns (inst_data, custom_data) of a region'''
+    catalog = open_catalog(datadir, cloud)
+    return catalog[region], catalog.custom_data(region)
+
+
+def compile_directory(datadir):
+    '''Compiles the JSON catalogs of every provider found in datadir'''
+    compiled = []
+    for filename in sorted(os.listdir(datadir)):
+        if not filename.endswith('_instance_data.json'):
+            continue
+        cloud = filename[:-len('_instance_data.json')]
+        if cloud.endswith('_custom'):
+            continue
+        inst_path, custom_path = json_paths(datadir, cloud)
+        with open(inst_path) as fp:
+            inst_data_by_region = json.load(fp)
+        custom_by_region = {}
+        if os.path.exists(custom_path):
+            with open(custom_path) as fp:
+                custom_by_region = json.load(fp)
+        path = catalog_path(datadir, cloud)
+        compile_catalog(cloud, inst_data_by_region, custom_by_region, path)
+        compiled.append(path)
+    return compiled
+
+
+if __name__ == '__main__':
+    datadir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), 'instance-data')
+    for path in compile_directory(datadir):
+        print('compiled {} ({} bytes)'.format(path, os.path.getsize(path)))
@@ -0,0 +1,196 @@
+'''Nodeless cost of the same pods in other regions and providers.
+
+The pods are reduced to their distinct request shapes with a count of
+pods per shape, and every region prices the shapes with its own
+InstanceSelector. Processes keep the selectors they build, so the
+indexes of a region are built once per process and not once per
+comparison. The command line prices the regions in a process pool, the
+web app prices them in the request, which takes a fraction of a second
+and costs less than starting a pool in every web worker.
+'''
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import attr
+import numpy as np
+
+from cost_calculator.catalog import open_catalog
+from cost_calculator.instance_selector import InstanceSelector
+
+PROVIDERS = ('aws', 'azure', 'gce')
+# price of the requests that no instance of a region fits
+NO_INSTANCE_PRICE = 100000000.0
+
+# per process
+_catalogs = {}
+_selectors = {}
+
+
+@attr.s(frozen=True)
+class PodShapes:
+    '''Distinct (cpu, memory, GPU spec) requests of a set of pods and
+    the number of pods with each one'''
+    cpus = attr.ib()
+    memories = attr.ib()
+    gpu_specs = attr.ib()
+    counts = attr.ib()
+
+    @classmethod
+    def from_pods(cls, pods):
+        counts = {}
+        for pod in pods:
+            shape = (max(pod.req_cpu, pod.lim_cpu),
+                     max(pod.req_memory, pod.lim_memory),
+                     (pod.gpu_spec or '').strip())
+            counts[shape] = counts.get(shape, 0) + 1
+        return cls(
+            cpus=np.array([shape[0] for shape in counts], dtype=float),
+            memories=np.array([shape[1] for shape in counts], dtype=float),
+            gpu_specs=[shape[2] for shape in counts],
+            counts=np.array(list(counts.values()), dtype=np.int64),
+        )
+
+    @property
+    def pod_count(self):
+        return int(self.counts.sum())
+
+
+@attr.s(frozen=True)
+class RegionCost:
+    '''Hourly on-demand nodeless cost of the pods that fit an instance
+    of a region'''
+    cloud = attr.ib()
+    region = attr.ib()
+    cost = attr.ib()
+    pod_count = attr.ib()
+    unpriced_pods = attr.ib()
+
+    def to_dict(self, hours=1):
+        return {
+            'cloud': self.cloud,
+            'region': self.region,
+            'cost': self.cost * hours,
+            'pod_count': self.pod_count,
+            'unpriced_pods': self.unpriced_pods,
+        }
+
+
+def provider_catalog(datadir, cloud):
+    catalog = _catalogs.get((datadir, cloud))
+    if catalog is None:
+        catalog = _catalogs[datadir, cloud] = open_catalog(datadir, cloud)
+    return catalog
+
+
+def region_selector(datadir, cloud, region):
+    key = (datadir, cloud, region)
+    selector = _selectors.get(key)
+    if selector is None:
+        catalog = provider_catalog(datadir, cloud)
+        selector = InstanceSelector(
+            cloud, region, {region: catalog[region]},
+            {region: catalog.custom_data(region)})
+        _selectors[key] = selector
+    return selector
+
+
+def price_region(datadir, cloud, region, shapes):
+    selector = region_selector(datadir, cloud, region)
+    _, prices, _ = selector.get_cheapest_instances(
+        shapes.cpus, shapes.memories, shapes.gpu_specs)
+    fits = prices < NO_INSTANCE_PRICE
+    return RegionCost(
+        cloud=cloud,
+        region=region,
+        cost=float(np.dot(prices[fits], shapes.counts[fits])),
+        pod_count=int(shapes.counts[fits].sum()),
+        unpriced_pods=int(shapes.counts[~fits].sum()),
+    )
+
+
+def _price_regions(datadir, targets, shapes):
+    return [price_region(datadir, cloud, region, shapes)
+            for cloud, region in targets]
+
+
+def list_targets(datadir, providers=PROVIDERS, regions=None):
+    '''(cloud, region) of every region of providers, or of the given
+    regions only'''
+    targets = []
+    for cloud in providers:
+        for region in sorted(provider_catalog(datadir, cloud).regions):
+            if regions is None or region in regions:
+                targets.append((cloud, region))
+    return targets
+
+
+def make_executor(processes=None):
+    # spawned, not forked: the caller may run threads
+    return ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def compare_regions(pods, targets, datadir, executor=None, batch_size=8):
+    '''Prices pods in every (cloud, region) of targets. Returns
+    RegionCosts, cheapest first, regions where some pods fit no
+    instance after the others.
+
+    The targets are priced in batches of batch_size regions by the
+    worker processes of executor, or in this process when there is none.
+    '''
+    shapes = PodShapes.from_pods(pods)
+    if executor is None or len(targets) <= batch_size:
+        costs = _price_regions(datadir, targets, shapes)
+    else:
+        futures = [
+            executor.submit(_price_regions, datadir, targets[i:i + batch_size], shapes)
+            for i in range(0, len(targets), batch_size)
+        ]
+        costs = [cost for future in futures for cost in future.result()]
+    return sorted(costs, key=lambda c: (c.unpriced_pods, c.cost, c.cloud, c.region))
+
+
+class SnapshotComparisons(object):
+    '''The last maxsize comparisons, by targets, of the pods of the
+    snapshot with the given fingerprint. Looking up with another
+    fingerprint drops them all.'''
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.fingerprint = None
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, targets):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._costs.clear()
+                self.fingerprint = fingerprint
+            costs = self._costs.get(targets)
+            if costs is not None:
+                self._costs.move_to_end(targets)
+            return costs
+
+    def put(self, fingerprint, targets, costs):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                return
+            self._costs[targets] = costs
+            while len(self._costs) > self.maxsize:
+                self._costs.popitem(last=False)
+
+
+_snapshot_comparisons = SnapshotComparisons()
+
+
+def compare_snapshot(snapshot, targets, datadir):
+    '''compare_regions() of the pods of a ClusterSnapshot, in this
+    process. The result is kept until the content of the snapshot
+    changes, so polling the same comparison does not price it again.'''
+    targets = tuple(targets)
+    costs = _snapshot_comparisons.get(snapshot.fingerprint, targets)
+    if costs is None:
+        costs = compare_regions(snapshot.pods, targets, datadir)
+        _snapshot_comparisons.put(snapshot.fingerprint, targets, costs)
+    return costs
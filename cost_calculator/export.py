@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+EXPORT_FIELDS = (
+    'namespace',
+    'name',
+    'owner',
+    'req_cpu',
+    'req_memory',
+    'lim_cpu',
+    'lim_memory',
+    'gpu_spec',
+    'instance_type',
+    'on_demand_cost',
+    'spot_cost',
+)
+
+
+def export_row(pod, hours):
+    return (
+        pod.namespace,
+        pod.name,
+        pod.owner,
+        pod.req_cpu,
+        pod.req_memory,
+        pod.lim_cpu,
+        pod.lim_memory,
+        pod.gpu_spec,
+        pod.instance_type,
+        pod.cost * hours,
+        pod.spot_price * hours,
+    )
+
+
+def iter_csv(pods, hours, batch_size=500):
+    '''Yields the cost report as CSV, a header line and then batches of
+    batch_size rows, so the whole report is never held in memory.'''
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    for pod in pods:
+        writer.writerow(export_row(pod, hours))
+        rows += 1
+        if rows % batch_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def iter_ndjson(pods, hours, batch_size=500):
+    '''Yields the cost report as one JSON object per line'''
+    lines = []
+    for pod in pods:
+        lines.append(json.dumps(dict(zip(EXPORT_FIELDS, export_row(pod, hours)))))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
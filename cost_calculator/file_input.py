@@ -0,0 +1,112 @@
+'''Conversion of pod and node dumps into the FROM_FILE input format,
+{"pods": [...], "nodes": [...]}.
+
+Dumps can be the output of the jq commands in the README (a sequence of
+pod or node objects) or of kubectl get -o json. They are read object by
+object and pods are written out as they are read, so a dump of any size
+is converted in one pass without temporary files. Nodes are written
+after the pods, so they are kept until the end.
+'''
+import argparse
+import json
+import sys
+
+from cost_calculator.app import Pod, _node_from_raw
+from cost_calculator.jsonstream import iter_objects
+from cost_calculator.quantity import GIB
+
+
+def quantities(cpu, memory):
+    '''Resource list of cpu in cores and memory in GiB. Memory is written
+    in bytes, a GiB count of a small quantity would have an exponent.'''
+    resources = {}
+    if cpu:
+        resources['cpu'] = repr(cpu)
+    if memory:
+        resources['memory'] = str(int(round(memory * GIB)))
+    return resources
+
+
+def file_pod(pod_json):
+    '''Input format of a pod returned by the API. Requests and limits are
+    those of the whole pod, so the containers are not listed.'''
+    pod = Pod.from_raw(pod_json)
+    return {
+        'name': pod.name,
+        'namespace': pod.namespace,
+        'containers': {
+            'limits': quantities(pod.lim_cpu, pod.lim_memory),
+            'requests': quantities(pod.req_cpu, pod.req_memory),
+        },
+        'initContainers': None,
+        'labels': pod.labels,
+        'owner': pod.owner,
+    }
+
+
+def file_node(node_json):
+    '''Input format of a node returned by the API, None for virtual
+    kubelet nodes'''
+    if _node_from_raw(node_json) is None:
+        return None
+    metadata = node_json['metadata']
+    return {'name': metadata['name'], 'labels': metadata.get('labels') or {}}
+
+
+def classify(obj):
+    '''Returns ('pods' or 'nodes', object in the input format)'''
+    kind = obj.get('kind')
+    if kind == 'Pod' or 'containers' in (obj.get('spec') or {}):
+        return 'pods', file_pod(obj)
+    if kind == 'Node' or 'metadata' in obj:
+        return 'nodes', file_node(obj)
+    # already in the input format, as written by the jq commands
+    if 'containers' in obj:
+        return 'pods', obj
+    return 'nodes', obj
+
+
+def convert(inputs, out):
+    '''Writes the input format of the objects of the dump files inputs
+    to out, returns the number of pods and nodes written'''
+    nodes = []
+    pod_count = 0
+    out.write('{"pods": [')
+    for fp in inputs:
+        for obj in iter_objects(fp):
+            kind, converted = classify(obj)
+            if converted is None:
+                continue
+            if kind == 'nodes':
+                nodes.append(converted)
+                continue
+            out.write(',\n' if pod_count else '\n')
+            out.write(json.dumps(converted))
+            pod_count += 1
+    out.write('\n],\n"nodes": [')
+    for i, node in enumerate(nodes):
+        out.write(',\n' if i else '\n')
+        out.write(json.dumps(node))
+    out.write('\n]}\n')
+    return pod_count, len(nodes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Converts pod and node dumps into the input file of FROM_FILE.')
+    parser.add_argument('inputs', nargs='*', default=['pods.json', 'nodes.json'],
+                        metavar='FILE', help="dump files, '-' for stdin "
+                                             "(default: pods.json nodes.json)")
+    parser.add_argument('-o', '--output', default='input_example.json',
+                        help='output file (default: input_example.json)')
+    args = parser.parse_args(argv)
+    files = [sys.stdin if path == '-' else open(path, 'r') for path in args.inputs]
+    try:
+        with open(args.output, 'w') as out:
+            pod_count, node_count = convert(files, out)
+    finally:
+        for fp in files:
+            if fp is not sys.stdin:
+                fp.close()
+    print('saved {} pods and {} nodes to {}'.format(pod_count, node_count, args.output))
+    return 0
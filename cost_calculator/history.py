@@ -0,0 +1,190 @@
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+
+import attr
+
+from cost_calculator.aggregates import ALL_NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+# most points a query returns before it falls back to a coarser tier
+MAX_POINTS = 1000
+SERIES = ('node_cost', 'on_demand_cost', 'spot_cost')
+
+
+@attr.s(frozen=True)
+class Tier:
+    '''Resolution of stored samples. Samples of a tier are averaged
+    into buckets of step seconds, step 0 keeps every sample.'''
+    id = attr.ib()
+    name = attr.ib()
+    step = attr.ib()
+    retention = attr.ib()
+
+
+TIERS = (
+    Tier(0, 'raw', 0, 2 * DAY),
+    Tier(1, 'hour', HOUR, 90 * DAY),
+    Tier(2, 'day', DAY, 5 * 365 * DAY),
+)
+TIERS_BY_NAME = {tier.name: tier for tier in TIERS}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    tier INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    node_cost REAL,
+    on_demand_cost REAL,
+    spot_cost REAL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (tier, scope, ts)
+) WITHOUT ROWID
+'''
+
+INSERT_RAW = '''
+INSERT OR IGNORE INTO samples VALUES (0, ?, ?, ?, ?, ?, 1)
+'''
+
+# running average of the samples that fell into a bucket
+UPSERT_BUCKET = '''
+INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (tier, scope, ts) DO UPDATE SET
+    node_cost = (node_cost * count + excluded.node_cost) / (count + 1),
+    on_demand_cost = (on_demand_cost * count + excluded.on_demand_cost) / (count + 1),
+    spot_cost = (spot_cost * count + excluded.spot_cost) / (count + 1),
+    count = count + 1
+'''
+
+
+class CostHistory(object):
+    '''Time series of hourly cluster and namespace costs in SQLite.
+
+    Every sample is stored raw and folded into hourly and daily
+    averages as it is recorded, so there is no separate downsampling
+    pass. Each tier only keeps retention seconds of history, which
+    bounds the size of the database to a few thousand rows per
+    namespace. raw_step is the expected interval between samples.
+    Connections are opened per call, so the store can be
+    shared by threads and by forked worker processes.
+    '''
+    def __init__(self, path, raw_step=300, tiers=TIERS):
+        self.path = path
+        self.raw_step = raw_step
+        self.tiers = tiers
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, ts, samples):
+        '''Stores samples taken at ts, an iterable of (scope, node_cost,
+        on_demand_cost, spot_cost). A sample that is already stored for
+        a scope and ts is ignored, so several workers can record the
+        same snapshot.'''
+        with self._connect() as db:
+            for scope, node_cost, on_demand_cost, spot_cost in samples:
+                values = (node_cost, on_demand_cost, spot_cost)
+                if db.execute(INSERT_RAW, (scope, ts) + values).rowcount == 0:
+                    continue
+                for tier in self.tiers[1:]:
+                    bucket = ts - ts % tier.step
+                    db.execute(UPSERT_BUCKET, (tier.id, scope, bucket) + values)
+            for tier in self.tiers:
+                db.execute('DELETE FROM samples WHERE tier = ? AND ts < ?',
+                           (tier.id, ts - tier.retention))
+
+    def pick_tier(self, start, end, now=None):
+        '''The finest tier that still holds start and returns at most
+        MAX_POINTS points for the range'''
+        if now is None:
+            now = time.time()
+        for tier in self.tiers:
+            step = tier.step or self.raw_step
+            if start >= now - tier.retention and (end - start) / step <= MAX_POINTS:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, scope, start, end, tier=None):
+        '''Samples of scope between start and end in columns, as
+        {'ts': [...], 'node_cost': [...], ...}'''
+        if tier is None:
+            tier = self.pick_tier(start, end)
+        with self._connect() as db:
+            rows = db.execute(
+                'SELECT ts, node_cost, on_demand_cost, spot_cost FROM samples '
+                'WHERE tier = ? AND scope = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                (tier.id, scope, start, end)).fetchall()
+        columns = list(zip(*rows)) or [()] * (len(SERIES) + 1)
+        result = {'ts': list(columns[0])}
+        for name, column in zip(SERIES, columns[1:]):
+            result[name] = list(column)
+        return tier, result
+
+
+def snapshot_samples(snapshot):
+    '''Hourly costs of a ClusterSnapshot for the whole cluster and every
+    namespace. Nodes are not split up by namespace, so namespaces have
+    no node cost.'''
+    yield (ALL_NAMESPACES, snapshot.node_totals.cost,
+           snapshot.totals().cost, snapshot.totals().spot_price)
+    for namespace in snapshot.namespaces:
+        totals = snapshot.totals(namespace)
+        yield namespace, None, totals.cost, totals.spot_price
+
+
+class HistorySampler(object):
+    '''Records the current snapshot of a SnapshotScheduler into a
+    CostHistory every interval seconds.'''
+    def __init__(self, history, snapshots, interval=300):
+        self.history = history
+        self.snapshots = snapshots
+        self.interval = interval
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, now=None):
+        if now is None:
+            now = time.time()
+        # align samples so workers sampling the same interval collide
+        ts = int(now) - int(now) % int(self.interval)
+        self.history.record(ts, snapshot_samples(self.snapshots.current()))
+        return ts
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='history-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception('error recording cost history')
+            self._stop.wait(self.interval)
@@ -0,0 +1,54 @@
+import gzip
+import zlib
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/csv',
+    'application/json',
+    'application/x-ndjson',
+}
+
+
+def not_modified(request, snapshot):
+    '''Tells whether the client already has the pages of snapshot'''
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(snapshot.fingerprint)
+    if request.if_modified_since:
+        # Last-Modified has a resolution of one second
+        return int(snapshot.changed_at) <= request.if_modified_since.timestamp()
+    return False
+
+
+def set_validators(response, snapshot):
+    '''Sets the ETag and Last-Modified of a response rendered from
+    snapshot. The ETag is weak because the same content is served
+    with different encodings.'''
+    response.set_etag(snapshot.fingerprint, weak=True)
+    response.last_modified = int(snapshot.changed_at)
+    response.cache_control.no_cache = True
+    return response
+
+
+def compress(response, accept_encodings, min_size=1024):
+    '''Compresses a buffered response body with gzip or deflate,
+    whichever the client prefers. Streamed responses and bodies
+    smaller than min_size are left alone.'''
+    if (response.direct_passthrough or response.is_streamed or
+            response.status_code < 200 or response.status_code in (204, 304) or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(['gzip', 'deflate'])
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    if encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=6)
+    else:
+        data = zlib.compress(data, 6)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+import time
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+HTTP_GONE = 410
+
+
+def object_key(obj):
+    metadata = obj['metadata']
+    return metadata.get('namespace'), metadata['name']
+
+
+def iter_raw_pages(list_func, page_size=500, **kwargs):
+    '''Lists a resource page by page, yielding every page as the JSON
+    dict returned by the API server. The kubernetes client models are
+    never built, and only one page is held in memory at a time.'''
+    _continue = None
+    while True:
+        if _continue:
+            kwargs['_continue'] = _continue
+        resp = list_func(limit=page_size, _preload_content=False, **kwargs)
+        page = json.loads(resp.data)
+        yield page
+        _continue = page['metadata'].get('continue')
+        if not _continue:
+            return
+
+
+class RawWatch(watch.Watch):
+    '''Watch that leaves event objects as JSON dicts'''
+    def get_return_type(self, func):
+        return None
+
+
+class Informer(object):
+    '''Local cache of a kubernetes resource.
+
+    Objects are handled as the JSON dicts returned by the API server.
+    The cache is filled with an initial paginated list, then kept up to date
+    with a watch that resumes from the last seen resourceVersion. When
+    the API server no longer has that version (410 Gone) the resource
+    is listed again. transform turns an API object into the object
+    that is cached; objects it returns None for are not cached.
+    '''
+    def __init__(self, list_func, transform, name='', watch_timeout=300,
+                 retry_interval=5, page_size=500):
+        self.list_func = list_func
+        self.page_size = page_size
+        self.transform = transform
+        self.name = name or list_func.__name__
+        self.watch_timeout = watch_timeout
+        self.retry_interval = retry_interval
+        self.resource_version = None
+        self.relists = 0
+        self._store = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def items(self):
+        with self._lock:
+            return list(self._store.values())
+
+    def __len__(self):
+        return len(self._store)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f'informer-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.stop()
+        if self._thread is not None:
+            self._thread.join(self.retry_interval)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch_once()
+            except ApiException as e:
+                if e.status == HTTP_GONE:
+                    logger.info('%s: resource version %s is gone, relisting',
+                                self.name, self.resource_version)
+                    self.resource_version = None
+                    continue
+                logger.exception('%s: error watching', self.name)
+                self._stop.wait(self.retry_interval)
+            except Exception:
+                logger.exception('%s: error watching', self.name)
+                self._stop.wait(self.retry_interval)
+
+    def relist(self):
+        start = time.monotonic()
+        store = {}
+        resource_version = None
+        for page in iter_raw_pages(self.list_func, self.page_size):
+            for obj in page['items']:
+                item = self.transform(obj)
+                if item is not None:
+                    store[object_key(obj)] = item
+            resource_version = page['metadata'].get('resourceVersion')
+        with self._lock:
+            self._store = store
+        self.resource_version = resource_version
+        self.relists += 1
+        self._synced.set()
+        logger.info('%s: listed %d objects in %.2fs', self.name, len(store),
+                    time.monotonic() - start)
+
+    def watch_once(self):
+        self._watch = RawWatch()
+        stream = self._watch.stream(
+            self.list_func,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout)
+        for event in stream:
+            if self._stop.is_set():
+                break
+            if not self.handle_event(event):
+                break
+
+    def handle_event(self, event):
+        '''Applies one watch event to the cache, returns False when the
+        watch has to be restarted.'''
+        event_type = event['type']
+        if event_type == 'ERROR':
+            status = event['raw_object']
+            if status.get('code') == HTTP_GONE:
+                logger.info('%s: resource version %s is gone, relisting',
+                            self.name, self.resource_version)
+                self.resource_version = None
+            else:
+                logger.error('%s: watch error: %s', self.name,
+                             status.get('message'))
+            return False
+        obj = event['object']
+        self.resource_version = obj['metadata'].get('resourceVersion')
+        if event_type == 'BOOKMARK':
+            return True
+        key = object_key(obj)
+        item = None
+        if event_type != 'DELETED':
+            item = self.transform(obj)
+        with self._lock:
+            if item is None:
+                self._store.pop(key, None)
+            else:
+                self._store[key] = item
+        return True
@@ -1,13 +1,20 @@
 import ast
+import functools
 import math
 import os
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 
+import numpy as np
 # load instance data for aws and azure
 #
 import redis
 
+from cost_calculator.catalog import CompiledRegion, load_catalog
+
 t_unlimited_price = 0.05
 
 
@@ -37,6 +44,103 @@ def cheapest_custom_instance(cid, cpu_request, memory_request):
     return custom_cpus, custom_memory, custom_price
 
 
+class CustomInstanceSolver(object):
+    '''Cheapest GCE custom machine shapes for batches of requests.
+
+    Within a family the cheapest valid shape is the one with the fewest
+    cpus, since both the cpu and the memory part of the price grow with
+    the cpu count (this is also what cheapest_custom_instance ends up
+    with). The table holds the sorted cpu counts of every family, padded
+    with NaN to the same length, so a batch of requests is solved for
+    all families with one broadcasted comparison.
+    '''
+    def __init__(self, custom_data):
+        self.families = [
+            cid for cid in custom_data
+            if cid['baseMemoryUnit'] != 0.0 and
+            len(cid['possibleNumberOfCPUs']) >= 1
+        ]
+        self.cpu_values = [sorted(cid['possibleNumberOfCPUs'])
+                           for cid in self.families]
+        width = max([len(cpus) for cpus in self.cpu_values] + [0])
+        self.cpus = np.full((len(self.families), width), np.nan)
+        for i, cpus in enumerate(self.cpu_values):
+            self.cpus[i, :len(cpus)] = cpus
+
+        def column(field):
+            return np.array([float(cid[field]) for cid in self.families])
+
+        self.base_memory_unit = column('baseMemoryUnit')
+        self.minimum_memory_per_cpu = column('minimumMemoryPerCPU')
+        self.maximum_memory_per_cpu = column('maximumMemoryPerCPU')
+        self.price_per_cpu = column('pricePerCPU')
+        self.price_per_gb_of_memory = column('pricePerGBOfMemory')
+        self.max_gpus = np.array([
+            max(list(cid.get('supportedGPUTypes', {}).values()) + [0])
+            for cid in self.families
+        ])
+
+    def solve(self, cpu_requests, memory_requests):
+        '''Solves N requests for all F families.
+
+        Returns (found, index, memory, price) arrays of shape (N, F),
+        index points into cpu_values of the family.
+        '''
+        cpu_requests = np.asarray(cpu_requests, dtype=float).reshape(-1, 1)
+        memory_requests = np.asarray(
+            memory_requests, dtype=float).reshape(-1, 1)
+        unit = self.base_memory_unit
+        base_mem_size = unit * np.ceil(memory_requests / unit)
+        with np.errstate(invalid='ignore'):
+            valid = (
+                (cpu_requests[:, :, None] <= self.cpus) &
+                (base_mem_size[:, :, None] <=
+                 self.maximum_memory_per_cpu[:, None] * self.cpus)
+            )
+        found = valid.any(axis=2)
+        index = valid.argmax(axis=2)
+        cpus = self.cpus[np.arange(len(self.families)), index]
+        min_memory = self.minimum_memory_per_cpu * cpus
+        memory = np.where(base_mem_size < min_memory, min_memory,
+                          base_mem_size)
+        memory = np.ceil(memory / unit) * unit
+        price = memory * self.price_per_gb_of_memory + cpus * self.price_per_cpu
+        found &= (cpus != 0) & (memory != 0)
+        return found, index, memory, np.where(found, price, np.inf)
+
+    def instance_type(self, family, index, memory):
+        return '{}-custom-{}-{}'.format(
+            self.families[family]['instanceFamily'],
+            self.cpu_values[family][index], int(memory*1024))
+
+    def instances(self, cpu_request, memory_request):
+        '''Returns the cheapest shape of every family for one request, in
+        the same format as the instance catalog.'''
+        if not self.families:
+            return []
+        found, index, memory, price = self.solve(
+            [cpu_request], [memory_request])
+        inst_data = []
+        for family, cid in enumerate(self.families):
+            if not found[0, family]:
+                continue
+            custom_cpus = self.cpu_values[family][index[0, family]]
+            custom_memory = float(memory[0, family])
+            inst_data.append({
+                'instanceType':      self.instance_type(
+                    family, index[0, family], custom_memory),
+                'price':             float(price[0, family]),
+                'gpu':               int(self.max_gpus[family]),
+                'supportedGPUTypes': cid['supportedGPUTypes'],
+                'memory':            custom_memory,
+                'cpu':               custom_cpus,
+                'burstable':         False,
+                'baseline':          custom_cpus,
+            })
+        return inst_data
+
+
+@functools.lru_cache(maxsize=1024)
 def parse_gce_custom_machine(inst_type):
     try:
         parts = inst_type.split('-')
@@ -57,6 +161,257 @@ def parse_gce_custom_machine(inst_type):
         return '', 0, 0.0
 
 
+def parse_gpu_spec(gpu_spec):
+    gpu_count = 0
+    gpu_type = ''
+    if gpu_spec:
+        try:
+            parts = gpu_spec.split(' ')
+            gpu_count = int(parts[0])
+            gpu_type = ' '.join(parts[1:])
+        except Exception as e:
+            logging.error('invalid GPU spec: %s: %s', gpu_spec, str(e))
+    return gpu_count, gpu_type
+
+
+def gpu_matches(gpu_count, gpu_type, inst):
+    if gpu_type == '':
+        return inst['gpu'] >= gpu_count
+    supported_gpus = inst.get('supportedGPUTypes', {}).get(gpu_type, 0)
+    return supported_gpus >= gpu_count
+
+
+class CatalogColumns(object):
+    '''Column-oriented copy of a region catalog. The columns of a
+    compiled catalog are used as they are, without a copy.'''
+    def __init__(self, inst_data):
+        self.inst_data = inst_data
+        if isinstance(inst_data, CompiledRegion):
+            self.instance_type = inst_data.instance_types
+            self.cpu = inst_data.column('cpu')
+            self.memory = inst_data.column('memory')
+            self.gpu = inst_data.column('gpu')
+            self.price = inst_data.column('price')
+            self.baseline = inst_data.column('baseline')
+            self.burstable = inst_data.column('burstable').astype(bool)
+            return
+        self.instance_type = np.array(
+            [inst['instanceType'] for inst in inst_data], dtype=object)
+
+        def column(field, dtype=float):
+            return np.array([inst[field] for inst in inst_data], dtype=dtype)
+
+        self.cpu = column('cpu')
+        self.memory = column('memory')
+        self.gpu = column('gpu')
+        self.price = column('price')
+        self.baseline = column('baseline')
+        self.burstable = column('burstable', dtype=bool)
+
+    def __len__(self):
+        return len(self.inst_data)
+
+    def gpu_mask(self, gpu_count, gpu_type):
+        if gpu_type == '':
+            return self.gpu >= gpu_count
+        return np.array([gpu_matches(gpu_count, gpu_type, inst)
+                         for inst in self.inst_data], dtype=bool)
+
+
+class _FrontierIndex(object):
+    '''Lookup structure over the catalog rows matching one GPU spec.
+
+    Burstable instances are entered at their baseline cpu, since that
+    is the largest cpu request they serve at their list price. On AWS
+    they are also kept in a side table that prices requests above the
+    baseline with T-unlimited credits.
+    '''
+    def __init__(self, columns, rows, cpus, unlimited_rows):
+        # rank entries by price, the row number breaks price ties the
+        # same way a scan of the catalog would.
+        by_price = np.lexsort((rows, columns.price[rows]))
+        rows = rows[by_price]
+        cpus = cpus[by_price]
+        memories = columns.memory[rows]
+        # an entry is dominated if a cheaper one is at least as big.
+        earlier = np.tri(len(rows), k=-1, dtype=bool)
+        dominated = (earlier &
+                     (cpus[None, :] >= cpus[:, None]) &
+                     (memories[None, :] >= memories[:, None])).any(axis=1)
+        self.columns = columns
+        self.frontier_rows = rows[~dominated]
+        frontier_cpus = cpus[~dominated]
+        frontier_memories = memories[~dominated]
+        self.cpus = np.unique(frontier_cpus)
+        self.memories = np.unique(frontier_memories)
+        # best[i, j] is the rank of the cheapest frontier entry with
+        # cpu >= cpus[i] and memory >= memories[j], the last row and
+        # column hold the "nothing fits" sentinel.
+        num_frontier = len(self.frontier_rows)
+        best = np.full((len(self.cpus) + 1, len(self.memories) + 1),
+                       num_frontier)
+        i = np.searchsorted(self.cpus, frontier_cpus)
+        j = np.searchsorted(self.memories, frontier_memories)
+        best[i, j] = np.arange(num_frontier)
+        best = np.minimum.accumulate(best[::-1], axis=0)[::-1]
+        best = np.minimum.accumulate(best[:, ::-1], axis=1)[:, ::-1]
+        self.best = best
+        self.unlimited_rows = unlimited_rows
+
+    def cheapest(self, cpu_requests, memory_requests):
+        '''Returns (rows, prices, is_t_unlimited) arrays, rows are -1 and
+        prices inf where nothing fits.'''
+        columns = self.columns
+        i = np.searchsorted(self.cpus, cpu_requests)
+        j = np.searchsorted(self.memories, memory_requests)
+        rows = np.append(self.frontier_rows, -1)[self.best[i, j]]
+        prices = np.append(columns.price, np.inf)[rows]
+        is_t_unlimited = np.zeros(len(rows), dtype=bool)
+        if len(self.unlimited_rows) == 0:
+            return rows, prices, is_t_unlimited
+
+        u_rows = self.unlimited_rows
+        baseline = columns.baseline[u_rows]
+        cpu_requests = cpu_requests[:, None]
+        valid = ((cpu_requests > baseline) &
+                 (cpu_requests <= columns.cpu[u_rows]) &
+                 (columns.memory[u_rows] >= memory_requests[:, None]))
+        cpu_needed = cpu_requests - baseline
+        u_prices = np.where(
+            valid, columns.price[u_rows] + cpu_needed * t_unlimited_price,
+            np.inf)
+        u_best = u_prices.min(axis=1)
+        u_rows = np.where(u_prices == u_best[:, None], u_rows,
+                          len(columns)).min(axis=1)
+        use = (u_best < prices) | ((u_best == prices) & (u_rows < rows))
+        use &= np.isfinite(u_best)
+        rows = np.where(use, u_rows, rows)
+        prices = np.where(use, u_best, prices)
+        return rows, prices, use
+
+
+class PriceIndex(object):
+    '''Precomputed cheapest-instance lookups for one region.
+
+    The catalog is reduced to the cpu/memory Pareto frontier of
+    instances that are not beaten on price by a bigger instance, and
+    the frontier is laid out on a grid of its distinct cpu and memory
+    sizes, so a lookup is two binary searches. Lookups work on arrays
+    of requests, and the catalog itself is never modified.
+    '''
+    def __init__(self, cloud, inst_data):
+        self.cloud = cloud
+        self.inst_data = inst_data
+        self.columns = CatalogColumns(inst_data)
+        self._indexes = {}
+
+    def _build(self, gpu_count, gpu_type):
+        columns = self.columns
+        mask = (columns.price > 0.0) & columns.gpu_mask(gpu_count, gpu_type)
+        cpus = np.where(columns.burstable,
+                        np.minimum(columns.cpu, columns.baseline),
+                        columns.cpu)
+        rows = np.flatnonzero(mask)
+        unlimited_rows = np.array([], dtype=int)
+        if self.cloud == 'aws':
+            unlimited_rows = np.flatnonzero(mask & columns.burstable)
+        return _FrontierIndex(columns, rows, cpus[rows], unlimited_rows)
+
+    def _index(self, gpu_count, gpu_type):
+        key = (gpu_count, gpu_type)
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._build(gpu_count, gpu_type)
+            self._indexes[key] = index
+        return index
+
+    def frontier(self, gpu_count=0, gpu_type=''):
+        index = self._index(gpu_count, gpu_type)
+        return [self.inst_data[row] for row in index.frontier_rows]
+
+    def cheapest_batch(self, cpu_requests, memory_requests, gpu_count=0,
+                       gpu_type=''):
+        index = self._index(gpu_count, gpu_type)
+        return index.cheapest(
+            np.asarray(cpu_requests, dtype=float),
+            np.asarray(memory_requests, dtype=float))
+
+    def cheapest(self, cpu_request, memory_request, gpu_count=0, gpu_type=''):
+        '''Returns (price, order, inst, is_t_unlimited) for the cheapest
+        catalog instance that fits the request, or None.'''
+        rows, prices, is_t_unlimited = self.cheapest_batch(
+            [cpu_request], [memory_request], gpu_count, gpu_type)
+        if rows[0] < 0:
+            return None
+        row = int(rows[0])
+        return (float(prices[0]), row, self.inst_data[row],
+                bool(is_t_unlimited[0]))
+
+
+def selection_key(cpu_request, memory_request, gpu_spec):
+    '''Normalizes a request shape, so that e.g. Decimal and float
+    requests for the same resources share a cache entry.'''
+    return float(cpu_request), float(memory_request), (gpu_spec or '').strip()
+
+
+class SelectionCache(object):
+    '''Bounded LRU cache of selection results keyed on request shape.
+
+    Every entry belongs to a generation (the catalog and spot price
+    versions it was computed with). Looking up with a different
+    generation drops the whole cache.
+    '''
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, generation):
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result, generation):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
 class InstanceSelector(object):
     def __init__(
             self,
@@ -65,16 +420,58 @@ class InstanceSelector(object):
             inst_data_by_region,
             custom_inst_data_by_region,
             price_getter=None,
-            redis_client=None
+            redis_client=None,
+            cache_size=4096,
     ):
         self.cloud = cloud
-        self.inst_data = inst_data_by_region[region]
-        self.custom_data = custom_inst_data_by_region.get(region, {})
         self.redis = redis_client
         self.price_getter = price_getter
         self.region = region
+        self.catalog_version = 0
+        self.selection_cache = SelectionCache(cache_size)
+        self.set_catalog(
+            inst_data_by_region[region],
+            custom_inst_data_by_region.get(region, {}))
+
+    def set_catalog(self, inst_data, custom_data):
+        self.inst_data = inst_data
+        self.custom_data = custom_data
+        self.price_index = PriceIndex(self.cloud, self.inst_data)
+        self.custom_solver = CustomInstanceSolver(self.custom_data)
+        # the first entry of a type wins, like a scan of the catalog
+        self._rows_by_type = {}
+        for row, inst_type in enumerate(self.price_index.columns.instance_type):
+            self._rows_by_type.setdefault(inst_type, row)
+        self._custom_by_family = {}
+        for data in self.custom_data:
+            self._custom_by_family.setdefault(data['instanceFamily'], data)
+        self._specs = {}
+        self.unknown_instance_types = set()
+        self.catalog_version += 1
+
+    def cache_generation(self):
+        spot_version = 0
+        if self.price_getter:
+            spot_version = self.price_getter.version
+        return self.catalog_version, spot_version
 
     def spec_for_inst_type(self, inst_type):
+        '''Returns the catalog entry of an instance type, or None if it
+        can't be priced. Results, including misses, are cached until the
+        catalog changes, and every unknown type is logged once.'''
+        try:
+            return self._specs[inst_type]
+        except KeyError:
+            pass
+        spec = self._lookup_spec(inst_type)
+        if spec is None and inst_type not in self.unknown_instance_types:
+            self.unknown_instance_types.add(inst_type)
+            logging.warning('no price for instance type %s in %s',
+                            inst_type, self.region)
+        self._specs[inst_type] = spec
+        return spec
+
+    def _lookup_spec(self, inst_type):
         if 'custom' in inst_type:
             family, cpu, gb_memory = parse_gce_custom_machine(inst_type)
             if cpu == 0 or gb_memory == 0:
@@ -92,18 +489,17 @@ class InstanceSelector(object):
                 'burstable':         False,
                 'baseline':          cpu,
             }
-        else:
-            for inst in self.inst_data:
-                if inst_type == inst["instanceType"]:
-                    return inst
+        row = self._rows_by_type.get(inst_type)
+        if row is None:
+            return None
+        return self.inst_data[row]
 
     def price_for_gce_custom_instance(self, family, cpu, gb_memory):
-        for data in self.custom_data:
-            if family != data['instanceFamily']:
-                continue
-            return (cpu * data['pricePerCPU'] +
-                    gb_memory * data['pricePerGBOfMemory'])
-        return None
+        data = self._custom_by_family.get(family)
+        if data is None:
+            return None
+        return (cpu * data['pricePerCPU'] +
+                gb_memory * data['pricePerGBOfMemory'])
 
     def price_for_cpu_spec(self, cpu, inst):
         if not inst['burstable']:
@@ -127,84 +523,154 @@ class InstanceSelector(object):
         return cheapest_instance, lowest_price
 
     def get_custom_instances(self, cpu_request, memory_request, gpu_spec):
-        inst_data = []
-        for cid in self.custom_data:
-            if (cid['baseMemoryUnit'] == 0.0 or
-                    len(cid['possibleNumberOfCPUs']) < 1):
-                continue
-            custom_cpus, custom_memory, price = cheapest_custom_instance(
-                cid, cpu_request, memory_request)
-            if not custom_cpus or not custom_memory:
-                continue
-            max_gpus = 0
-            for _, gpu in cid.get('supportedGPUTypes', {}).items():
-                if gpu > max_gpus:
-                    max_gpus = gpu
-            instance_type = '{}-custom-{}-{}'.format(
-                cid['instanceFamily'], custom_cpus, int(custom_memory*1024))
-            inst_data.append({
-                'instanceType':      instance_type,
-                'price':             price,
-                'gpu':               max_gpus,
-                'supportedGPUTypes': cid['supportedGPUTypes'],
-                'memory':            custom_memory,
-                'cpu':               custom_cpus,
-                'burstable':         False,
-                'baseline':          custom_cpus,
-            })
-        return inst_data
+        return self.custom_solver.instances(cpu_request, memory_request)
 
     def parse_gpu_spec(self, gpu_spec):
-        gpu_count = 0
-        gpu_type = ''
-        if gpu_spec:
-            try:
-                parts = gpu_spec.split(' ')
-                gpu_count = int(parts[0])
-                gpu_type = ' '.join(parts[1:])
-            except Exception as e:
-                logging.error('invalid GPU spec: %s: %s', gpu_spec, str(e))
-        return gpu_count, gpu_type
+        return parse_gpu_spec(gpu_spec)
 
     def gpu_matches(self, gpu_count, gpu_type, inst):
-        if gpu_type == '':
-            return inst['gpu'] >= gpu_count
-        supported_gpus = inst.get('supportedGPUTypes', {}).get(gpu_type, 0)
-        return supported_gpus >= gpu_count
+        return gpu_matches(gpu_count, gpu_type, inst)
 
     def get_spot_price(self, instance_type):
-        spot_price = 10000000.0
+        return self.get_spot_prices([instance_type])[instance_type]
+
+    def get_spot_prices(self, instance_types):
+        '''Returns a dict of instance type to spot price, types without a
+        known spot price map to a price that never wins.'''
+        spot_prices = {}
         if self.price_getter:
-            spot_price = self.price_getter.get_spot_price(instance_type, self.region)
-        return spot_price
+            spot_prices = self.price_getter.get_spot_prices(
+                instance_types, self.region)
+        return {instance_type: spot_prices.get(instance_type, 10000000.0)
+                for instance_type in instance_types}
 
     def get_cheapest_instance(self, cpu_request, memory_request, gpu_spec):
-        gpu_count, gpu_type = self.parse_gpu_spec(gpu_spec)
-        matches = self.inst_data
-        matches += self.get_custom_instances(
-            cpu_request, memory_request, gpu_spec)
-        matches = [inst for inst in matches
-                   if (memory_request == 0.0 or
-                       inst['memory'] >= memory_request)]
-        matches = [inst for inst in matches
-                   if (cpu_request == 0.0 or
-                       inst['cpu'] >= cpu_request)]
-        matches = [inst for inst in matches
-                   if self.gpu_matches(gpu_count, gpu_type, inst)]
-        cheapest_instance = ""
-        lowest_price = 100000000.0
-        for inst in matches:
-            price, is_t_unlimited = self.price_for_cpu_spec(cpu_request, inst)
-            if 0.0 < price < lowest_price:
-                lowest_price = price
-                cheapest_instance = inst['instanceType']
-                if is_t_unlimited:
-                    cheapest_instance += ' (unlimited)'
-        lowest_spot_price = lowest_price
-        if cheapest_instance == "":
-            cheapest_instance = "Standard_B1ls"
-        lowest_spot_price = min(lowest_spot_price, self.get_spot_price(cheapest_instance))
-        return cheapest_instance, lowest_price, lowest_spot_price
+        key = selection_key(cpu_request, memory_request, gpu_spec)
+        generation = self.cache_generation()
+        result = self.selection_cache.get(key, generation)
+        if result is None:
+            types, prices, spot_prices = self._select_cheapest_instances(
+                np.array([key[0]]), np.array([key[1]]), [key[2]])
+            result = (types[0], float(prices[0]), float(spot_prices[0]))
+            self.selection_cache.put(key, result, generation)
+        return result
+
+    def get_cheapest_instances(self, cpu_requests, memory_requests, gpu_specs):
+        '''Batched get_cheapest_instance.
+
+        Returns arrays of instance types, on-demand prices and spot
+        prices. Every distinct request shape is looked up in the
+        selection cache once, and the shapes that miss are priced in
+        one pass.
+        '''
+        cpu_requests = np.asarray(cpu_requests, dtype=float)
+        memory_requests = np.asarray(memory_requests, dtype=float)
+        specs = {}
+        spec_codes = np.array(
+            [specs.setdefault((gpu_spec or '').strip(), len(specs))
+             for gpu_spec in gpu_specs], dtype=float)
+        spec_names = sorted(specs, key=specs.get)
+        shapes = np.column_stack((cpu_requests, memory_requests, spec_codes))
+        shapes, inverse = np.unique(shapes, axis=0, return_inverse=True)
+        generation = self.cache_generation()
+        results = [None] * len(shapes)
+        missing = []
+        for i, (cpu, memory, code) in enumerate(shapes):
+            key = (float(cpu), float(memory), spec_names[int(code)])
+            results[i] = self.selection_cache.get(key, generation)
+            if results[i] is None:
+                missing.append(i)
+        if missing:
+            missing_shapes = shapes[missing]
+            types, prices, spot_prices = self._select_cheapest_instances(
+                missing_shapes[:, 0], missing_shapes[:, 1],
+                [spec_names[int(code)] for code in missing_shapes[:, 2]])
+            for i, result in zip(missing, zip(types, prices.tolist(),
+                                              spot_prices.tolist())):
+                results[i] = result
+                cpu, memory, code = shapes[i]
+                key = (float(cpu), float(memory), spec_names[int(code)])
+                self.selection_cache.put(key, result, generation)
+        inverse = inverse.reshape(-1)
+        types = np.array([result[0] for result in results], dtype=object)
+        prices = np.array([result[1] for result in results], dtype=float)
+        spot_prices = np.array([result[2] for result in results], dtype=float)
+        return types[inverse], prices[inverse], spot_prices[inverse]
+
+    def _select_cheapest_instances(self, cpu_requests, memory_requests,
+                                   gpu_specs):
+        num_requests = len(cpu_requests)
+        types = np.full(num_requests, "Standard_B1ls", dtype=object)
+        prices = np.full(num_requests, 100000000.0)
+        by_spec = {}
+        for i, gpu_spec in enumerate(gpu_specs):
+            by_spec.setdefault(gpu_spec, []).append(i)
+        for gpu_spec, requests in by_spec.items():
+            gpu_count, gpu_type = self.parse_gpu_spec(gpu_spec)
+            requests = np.array(requests)
+            cpus = cpu_requests[requests]
+            memories = memory_requests[requests]
+            rows, best_prices, is_t_unlimited = self.price_index.cheapest_batch(
+                cpus, memories, gpu_count, gpu_type)
+            found = best_prices < 100000000.0
+            catalog_types = self.price_index.columns.instance_type
+            for k in np.flatnonzero(found):
+                inst_type = catalog_types[rows[k]]
+                if is_t_unlimited[k]:
+                    inst_type += ' (unlimited)'
+                types[requests[k]] = inst_type
+            prices[requests[found]] = best_prices[found]
+            # custom instances are shaped to the request, they only
+            # need to be checked against the GPU spec.
+            solver = self.custom_solver
+            if not solver.families:
+                continue
+            custom_found, index, memory, custom_prices = solver.solve(
+                cpus, memories)
+            gpu_ok = np.array([
+                gpu_matches(gpu_count, gpu_type, {
+                    'gpu': solver.max_gpus[family],
+                    'supportedGPUTypes': cid['supportedGPUTypes'],
+                })
+                for family, cid in enumerate(solver.families)
+            ])
+            custom_prices = np.where(gpu_ok, custom_prices, np.inf)
+            family = custom_prices.argmin(axis=1)
+            k = np.arange(len(requests))
+            custom_best = custom_prices[k, family]
+            use = (0.0 < custom_best) & (custom_best < prices[requests])
+            for k in np.flatnonzero(use):
+                types[requests[k]] = solver.instance_type(
+                    family[k], index[k, family[k]], memory[k, family[k]])
+            prices[requests[use]] = custom_best[use]
+        unique_types, inverse = np.unique(types, return_inverse=True)
+        spot_prices_by_type = self.get_spot_prices(unique_types.tolist())
+        spot_prices = np.array(
+            [spot_prices_by_type[inst_type] for inst_type in unique_types],
+            dtype=float)
+        spot_prices = np.minimum(prices, spot_prices[inverse.reshape(-1)])
+        return types, prices, spot_prices
+
+
+def decode_price_entry(data):
+    '''Decodes a cloudinfo price entry, e.g.
+    {"onDemandPrice": 0.0104, "spotPrice": {"us-east-1a": 0.0031}}
+
+    Entries are written as JSON. Python literals are accepted as a
+    fallback for entries that were not.
+    '''
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    try:
+        prices = json.loads(data)
+    except ValueError:
+        try:
+            prices = ast.literal_eval(data)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"cannot convert {data} to dict")
+    if not isinstance(prices, dict):
+        raise ValueError(f"cannot convert {data} to dict")
+    return prices
 
 
 class PriceGetter:
@@ -214,10 +680,29 @@ class PriceGetter:
         "gce": "google"
     }
 
-    def __init__(self, provider, redis_client):
+    def __init__(self, provider, redis_client, max_age=60):
         self.provider = provider
         self.redis_client = redis_client
         self.key_pattern = "/banzaicloud.com/cloudinfo/providers/{provider}/regions/{region}/prices/{instance_type}"
+        # prices are read live from redis, so there is no change
+        # notification: results derived from them are considered stale
+        # after max_age seconds.
+        self.max_age = max_age
+        # decoded entries by redis key, with the raw value they were
+        # decoded from.
+        self._parsed_entries = {}
+        self._version = 0
+        self._version_started = time.monotonic()
+
+    @property
+    def version(self):
+        if time.monotonic() - self._version_started >= self.max_age:
+            self.invalidate()
+        return self._version
+
+    def invalidate(self):
+        self._version += 1
+        self._version_started = time.monotonic()
 
     def _get_azure_region_key(self, region):
         return region.replace(" ", "").lower()
@@ -228,15 +713,14 @@ class PriceGetter:
             region = self._get_azure_region_key(region)
         return self.key_pattern.format(provider=provider, region=region, instance_type=instance_type)
 
-    def _convert_entry_to_dict(self, data):
-
-        prices_str = data.decode('utf-8')
-        if "null" in prices_str:
-            prices_str = prices_str.replace("null", "{}")
-        try:
-            prices = ast.literal_eval(prices_str)
-        except ValueError:
-            raise ValueError(f"cannot convert {prices_str} to dict")
+    def _convert_entry_to_dict(self, data, key=None):
+        if key is None:
+            return decode_price_entry(data)
+        cached = self._parsed_entries.get(key)
+        if cached is not None and cached[0] == data:
+            return cached[1]
+        prices = decode_price_entry(data)
+        self._parsed_entries[key] = (data, prices)
         return prices
 
     def _get_lowest_spot_price(self, prices):
@@ -246,45 +730,165 @@ class PriceGetter:
             return prices['onDemandPrice']
         return min(spot_prices.values())
 
-    def _get_data_for_instance(self, instance_type, region):
-        key = self._get_key(region=region, instance_type=instance_type)
-        data = self.redis_client.get(key)
-        prices = self._convert_entry_to_dict(data)
+    def _get_data_for_instances(self, instance_types, region):
+        instance_types = list(dict.fromkeys(instance_types))
+        if not instance_types:
+            return {}
+        keys = [self._get_key(region=region, instance_type=instance_type)
+                for instance_type in instance_types]
+        values = self.redis_client.mget(keys)
+        prices = {}
+        for instance_type, key, data in zip(instance_types, keys, values):
+            if data is None:
+                continue
+            prices[instance_type] = self._convert_entry_to_dict(data, key)
         return prices
 
     def get_spot_price(self, instance_type, region):
-        prices = self._get_data_for_instance(instance_type, region)
-        spot_price = self._get_lowest_spot_price(prices)
-        return spot_price
+        return self.get_spot_prices([instance_type], region).get(instance_type)
+
+    def get_spot_prices(self, instance_types, region):
+        '''Fetches the lowest spot price of every distinct instance type
+        with a single MGET. Types that have no entry in redis are left
+        out of the result.'''
+        prices = self._get_data_for_instances(instance_types, region)
+        return {instance_type: self._get_lowest_spot_price(data)
+                for instance_type, data in prices.items()}
     #
     # def get_ondemand_price(self, instance_type, region):
     #     prices = self._get_data_for_instance(instance_type, region)
     #     return prices['onDemandPrice']
 
 
+class SpotPriceTable(object):
+    '''In-memory table of the spot prices of one provider and region.
+
+    The table is loaded from redis by refresh(), which start() runs in
+    a background thread every refresh_interval seconds. Lookups never
+    touch redis, and if a refresh fails the last good prices are kept.
+    Until the first refresh succeeds no spot prices are known, so
+    callers price with on-demand prices only. It can be used in place
+    of the PriceGetter of an InstanceSelector.
+    '''
+    scan_count = 1000
+    mget_chunk_size = 500
+
+    def __init__(self, price_getter, region, refresh_interval=60):
+        self.price_getter = price_getter
+        self.region = region
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self.refreshed_at = None
+        self.refresh_duration = None
+        self.last_error = None
+        self._prices = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self.refreshed_at is not None
+
+    def age(self):
+        if self.refreshed_at is None:
+            return None
+        return time.time() - self.refreshed_at
+
+    def refresh(self):
+        start = time.monotonic()
+        try:
+            prices = self._load()
+        except Exception as e:
+            self.last_error = str(e)
+            logging.exception('error refreshing spot prices for %s',
+                              self.region)
+            return False
+        if prices != self._prices:
+            self._prices = prices
+            self.version += 1
+        self.refreshed_at = time.time()
+        self.refresh_duration = time.monotonic() - start
+        self.last_error = None
+        return True
+
+    def _load(self):
+        price_getter = self.price_getter
+        redis_client = price_getter.redis_client
+        pattern = price_getter._get_key(instance_type='*', region=self.region)
+        keys = [
+            key.decode('utf-8') if isinstance(key, bytes) else key
+            for key in redis_client.scan_iter(
+                match=pattern, count=self.scan_count)
+        ]
+        prices = {}
+        for i in range(0, len(keys), self.mget_chunk_size):
+            chunk = keys[i:i + self.mget_chunk_size]
+            for key, data in zip(chunk, redis_client.mget(chunk)):
+                if data is None:
+                    continue
+                instance_type = key.rsplit('/', 1)[1]
+                entry = price_getter._convert_entry_to_dict(data, key)
+                prices[instance_type] = price_getter._get_lowest_spot_price(
+                    entry)
+        return prices
+
+    def get_spot_price(self, instance_type, region):
+        return self.get_spot_prices([instance_type], region).get(instance_type)
+
+    def get_spot_prices(self, instance_types, region):
+        if region != self.region:
+            return self.price_getter.get_spot_prices(instance_types, region)
+        prices = self._prices
+        return {instance_type: prices[instance_type]
+                for instance_type in instance_types
+                if instance_type in prices}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='spot-price-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
+
+    def stats(self):
+        return {
+            'loaded': self.loaded,
+            'entries': len(self._prices),
+            'version': self.version,
+            'refreshed_at': self.refreshed_at,
+            'age': self.age(),
+            'refresh_duration': self.refresh_duration,
+            'refresh_interval': self.refresh_interval,
+            'last_error': self.last_error,
+        }
+
+
 def make_instance_selector(datadir, cloud_provider, region):
-    filename = '{}_instance_data.json'.format(cloud_provider)
-    filepath = os.path.join(datadir, filename)
-    with open(filepath) as fp:
-        jsonstr = fp.read()
-    inst_data_by_region = json.loads(jsonstr)
-    filename = '{}_custom_instance_data.json'.format(cloud_provider)
-    filepath = os.path.join(datadir, filename)
-    custom_inst_data_by_region = {}
-    if os.path.exists(filepath):
-        with open(filepath) as fp:
-            jsonstr = fp.read()
-            custom_inst_data_by_region = json.loads(jsonstr)
+    inst_data, custom_inst_data = load_catalog(datadir, cloud_provider, region)
     redis_host = os.getenv('REDIS_HOST', 'localhost')
     redis_client = redis.Redis(redis_host, 6379)
     price_getter = PriceGetter(
         provider=cloud_provider,
-        redis_client=redis_client
+        redis_client=redis_client,
+        max_age=float(os.getenv('SPOT_PRICE_MAX_AGE', 60)),
     )
     return InstanceSelector(
         cloud_provider,
         region,
-        inst_data_by_region,
-        custom_inst_data_by_region,
+        {region: inst_data},
+        {region: custom_inst_data},
         price_getter=price_getter,
+        cache_size=int(os.getenv('SELECTION_CACHE_SIZE', 4096)),
     )
@@ -0,0 +1,156 @@
+'''Incremental reading of JSON files too large to load at once.
+
+Values are decoded one at a time from a buffer holding a chunk of the
+file, so only the value being decoded is ever held in memory.
+'''
+import json
+import re
+
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class JSONReader(object):
+    '''Reads the JSON text of a file object piece by piece.
+
+    iter_object() and iter_array() step into a container without
+    decoding it, value() decodes the next value whole. The keys
+    yielded by iter_object() must each be followed by reading their
+    value before asking for the next key.
+    '''
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # offset in the file of buf[0], for error messages
+        self.offset = 0
+
+    def _fill(self):
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''Returns the next non-whitespace character, '' at the end'''
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _error(self, expected):
+        return ValueError('expected {} at offset {}'.format(
+            expected, self.offset + self.pos))
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(repr(char))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof or not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may go on in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _separator(self, close, expected):
+        char = self.peek()
+        self.pos += 1
+        if char == close:
+            return False
+        if char != ',':
+            self.pos -= 1
+            raise self._error(expected)
+        return True
+
+    def iter_array(self):
+        '''Yields the items of the array at the current position'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if not self._separator(']', "',' or ']'"):
+                return
+
+    def iter_object(self):
+        '''Yields the keys of the object at the current position'''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error('a key')
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self._separator('}', "',' or '}'"):
+                return
+
+
+def iter_values(fp, chunk_size=CHUNK_SIZE):
+    '''Yields the values of a file holding a sequence of JSON values,
+    such as the output of jq'''
+    reader = JSONReader(fp, chunk_size)
+    while reader.peek():
+        yield reader.value()
+
+
+def iter_items(fp, keys, chunk_size=CHUNK_SIZE):
+    '''Yields (key, item) for every item of the arrays found under keys
+    of the top-level object of a file, other keys are skipped. The
+    items of a top-level array are yielded with the key None.'''
+    reader = JSONReader(fp, chunk_size)
+    if reader.peek() == '[':
+        for item in reader.iter_array():
+            yield None, item
+        return
+    for key in reader.iter_object():
+        if key in keys and reader.peek() == '[':
+            for item in reader.iter_array():
+                yield key, item
+        else:
+            reader.value()
+
+
+def iter_objects(fp, list_key='items', chunk_size=CHUNK_SIZE):
+    '''Yields the objects of a file holding a sequence of JSON objects,
+    such as the output of jq, or an array of them. An object holding a
+    list_key array, such as the output of kubectl -o json, is replaced
+    by the items of that array, which are read one at a time.'''
+    reader = JSONReader(fp, chunk_size)
+    while reader.peek():
+        if reader.peek() == '[':
+            yield from reader.iter_array()
+            continue
+        obj = {}
+        is_list = False
+        for key in reader.iter_object():
+            if key == list_key and reader.peek() == '[':
+                is_list = True
+                yield from reader.iter_array()
+            else:
+                obj[key] = reader.value()
+        if not is_list:
+            yield obj
@@ -0,0 +1,220 @@
+import base64
+import bisect
+import binascii
+import json
+
+import attr
+
+from cost_calculator.aggregates import CostTotals, pod_contribution
+
+HOUR = 'hour'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+GROUP_BY = {
+    'namespace': lambda pod: pod.namespace,
+    'instance_type': lambda pod: pod.instance_type,
+    'owner': lambda pod: pod.owner,
+}
+POD_SORT_FIELDS = ('on_demand_cost', 'spot_cost', 'cpu', 'memory', 'req_cpu',
+                   'req_memory', 'lim_cpu', 'lim_memory', 'name', 'namespace',
+                   'instance_type')
+GROUP_SORT_FIELDS = ('on_demand_cost', 'spot_cost', 'cpu', 'memory',
+                     'pod_count', 'key')
+TEXT_SORT_FIELDS = ('name', 'namespace', 'instance_type', 'key')
+# fields after the sort field in the sort key of an item
+POD_TIE_BREAKER = ('namespace', 'name')
+GROUP_TIE_BREAKER = ('key',)
+
+
+def encode_cursor(sort, key):
+    data = json.dumps([sort, key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, sort, tie_breaker=POD_TIE_BREAKER):
+    '''Sort key of a cursor returned for sort, raises ValueError when it
+    is not one that items sorted by sort and tie_breaker have'''
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('cursor was returned for sort={}'.format(cursor_sort))
+    if not isinstance(key, list) or len(key) != 1 + len(tie_breaker):
+        raise ValueError('invalid cursor')
+    if sort.lstrip('-') in TEXT_SORT_FIELDS:
+        valid = isinstance(key[0], str)
+    else:
+        valid = _is_number(key[0])
+    if not valid or not all(isinstance(k, str) for k in key[1:]):
+        raise ValueError('invalid cursor')
+    return key
+
+
+def parse_label_selector(selector):
+    '''Parses "key=value" or "key" into (key, value or None)'''
+    key, sep, value = selector.partition('=')
+    if not key:
+        raise ValueError('invalid label selector: {}'.format(selector))
+    return key, value if sep else None
+
+
+@attr.s(frozen=True)
+class PodQuery:
+    '''Filters, sort order and page of a pod cost query.
+
+    Costs are reported for timeframe (hourly by default). Pages are
+    addressed with a cursor holding the sort key of the last returned
+    item, so paging stays consistent when the snapshot changes between
+    requests.
+    '''
+    namespace = attr.ib(default='')
+    search = attr.ib(default='')
+    labels = attr.ib(default=())
+    instance_types = attr.ib(default=())
+    min_cost = attr.ib(default=None)
+    group_by = attr.ib(default=None)
+    sort = attr.ib(default='-on_demand_cost')
+    limit = attr.ib(default=DEFAULT_LIMIT)
+    cursor = attr.ib(default=None)
+    timeframe = attr.ib(default=HOUR)
+
+    @classmethod
+    def from_args(cls, args, timeframes):
+        '''Builds a query from request arguments, raises ValueError for
+        invalid ones. timeframes maps timeframe names to hours.'''
+        namespace = args.get('namespace', '')
+        if namespace == 'all':
+            namespace = ''
+        group_by = args.get('group_by') or None
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError('group_by must be one of: {}'.format(', '.join(GROUP_BY)))
+        sort_fields = POD_SORT_FIELDS if group_by is None else GROUP_SORT_FIELDS
+        sort = args.get('sort') or '-on_demand_cost'
+        if sort.lstrip('-') not in sort_fields:
+            raise ValueError('sort must be one of: {}'.format(', '.join(sort_fields)))
+        timeframe = args.get('timeframe') or HOUR
+        if timeframe != HOUR and timeframe not in timeframes:
+            raise ValueError('invalid timeframe: {}'.format(timeframe))
+        try:
+            limit = int(args.get('limit', DEFAULT_LIMIT))
+            min_cost = args.get('min_cost')
+            if min_cost is not None:
+                min_cost = float(min_cost)
+        except ValueError:
+            raise ValueError('limit and min_cost must be numbers')
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError('limit must be between 1 and {}'.format(MAX_LIMIT))
+        cursor = args.get('cursor') or None
+        if cursor is not None:
+            cursor = decode_cursor(
+                cursor, sort, POD_TIE_BREAKER if group_by is None else GROUP_TIE_BREAKER)
+        return cls(
+            namespace=namespace,
+            search=args.get('search', '').strip().lower(),
+            labels=tuple(parse_label_selector(s) for s in args.getlist('label')),
+            instance_types=tuple(args.getlist('instance_type')),
+            min_cost=min_cost,
+            group_by=group_by,
+            sort=sort,
+            limit=limit,
+            cursor=cursor,
+            timeframe=timeframe,
+        )
+
+    def matches(self, pod, hours):
+        if self.namespace and pod.namespace != self.namespace:
+            return False
+        if self.search and self.search not in pod.name.lower():
+            return False
+        if self.instance_types and pod.instance_type not in self.instance_types:
+            return False
+        if self.min_cost is not None and pod.cost * hours < self.min_cost:
+            return False
+        for key, value in self.labels:
+            if key not in pod.labels:
+                return False
+            if value is not None and pod.labels[key] != value:
+                return False
+        return True
+
+    def run(self, snapshot, timeframes):
+        '''Returns the response of the query on a ClusterSnapshot'''
+        hours = 1 if self.timeframe == HOUR else timeframes[self.timeframe]
+        pods = [pod for pod in snapshot.pods_in(self.namespace)
+                if self.matches(pod, hours)]
+        if self.group_by is None:
+            items = [pod_item(pod, hours) for pod in pods]
+            tie_breaker = POD_TIE_BREAKER
+        else:
+            items = group_items(pods, GROUP_BY[self.group_by], hours)
+            tie_breaker = GROUP_TIE_BREAKER
+        field = self.sort.lstrip('-')
+        descending = self.sort.startswith('-')
+        keys = [[item[field]] + [item[f] for f in tie_breaker] for item in items]
+        order = sorted(range(len(items)), key=keys.__getitem__)
+        keys = [keys[i] for i in order]
+        if not descending:
+            start = 0 if self.cursor is None else bisect.bisect_right(keys, self.cursor)
+            page = order[start:start + self.limit]
+            more = start + self.limit < len(order)
+        else:
+            end = len(order) if self.cursor is None else bisect.bisect_left(keys, self.cursor)
+            start = max(0, end - self.limit)
+            page = order[start:end][::-1]
+            more = start > 0
+        page_items = [items[i] for i in page]
+        next_cursor = None
+        if more and page_items:
+            last = page_items[-1]
+            next_cursor = encode_cursor(
+                self.sort, [last[field]] + [last[f] for f in tie_breaker])
+        return {
+            'snapshot_version': snapshot.version,
+            'timeframe': self.timeframe,
+            'group_by': self.group_by,
+            'total': len(items),
+            'items': page_items,
+            'next_cursor': next_cursor,
+        }
+
+
+def pod_item(pod, hours):
+    return {
+        'namespace': pod.namespace,
+        'name': pod.name,
+        'owner': pod.owner,
+        'labels': pod.labels,
+        'instance_type': pod.instance_type,
+        'cpu': max(pod.req_cpu, pod.lim_cpu),
+        'memory': max(pod.req_memory, pod.lim_memory),
+        'req_cpu': pod.req_cpu,
+        'req_memory': pod.req_memory,
+        'lim_cpu': pod.lim_cpu,
+        'lim_memory': pod.lim_memory,
+        'gpu_spec': pod.gpu_spec,
+        'on_demand_cost': pod.cost * hours,
+        'spot_cost': pod.spot_price * hours,
+    }
+
+
+def group_items(pods, group_key, hours):
+    groups = {}
+    for pod in pods:
+        totals = groups.setdefault(group_key(pod), CostTotals())
+        totals.add(pod_contribution(pod))
+    return [
+        {
+            'key': key,
+            'pod_count': totals.pod_count,
+            'cpu': totals.cpu,
+            'memory': totals.memory,
+            'on_demand_cost': totals.cost * hours,
+            'spot_cost': totals.spot_price * hours,
+        }
+        for key, totals in groups.items()
+    ]
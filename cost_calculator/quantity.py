@@ -0,0 +1,86 @@
+import functools
+import re
+
+# suffix -> (power of 2, power of 10)
+SUFFIXES = {
+    'Ki': (10, 0),
+    'Mi': (20, 0),
+    'Gi': (30, 0),
+    'Ti': (40, 0),
+    'Pi': (50, 0),
+    'Ei': (60, 0),
+    'n': (0, -9),
+    'u': (0, -6),
+    'm': (0, -3),
+    '': (0, 0),
+    'k': (0, 3),
+    'M': (0, 6),
+    'G': (0, 9),
+    'T': (0, 12),
+    'P': (0, 15),
+    'E': (0, 18),
+}
+
+QUANTITY_RE = re.compile(
+    r'^(?P<sign>[+-]?)(?P<int>[0-9]*)(?:\.(?P<frac>[0-9]*))?'
+    r'(?:(?P<suffix>[a-zA-Z]{0,2})|[eE](?P<exp>[+-]?[0-9]+))$')
+
+GIB = 2 ** 30
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse(quantity, power_of_2_offset):
+    '''Parses a kubernetes quantity string into a float of
+    value / 2**power_of_2_offset.
+
+    The value is kept as an exact fraction and rounded once, so the
+    result is the same as float(kubernetes.utils.parse_quantity(q))
+    scaled by the power of two.'''
+    match = QUANTITY_RE.match(quantity.strip())
+    if not match:
+        raise ValueError(f'invalid quantity: {quantity}')
+    integer, fraction = match.group('int'), match.group('frac') or ''
+    if not integer and not fraction:
+        raise ValueError(f'invalid quantity: {quantity}')
+    if match.group('exp') is not None:
+        power_of_2, power_of_10 = 0, int(match.group('exp'))
+    else:
+        suffix = match.group('suffix')
+        if suffix not in SUFFIXES:
+            raise ValueError(f'invalid quantity suffix: {quantity}')
+        power_of_2, power_of_10 = SUFFIXES[suffix]
+    numerator = int(integer + fraction or '0')
+    if match.group('sign') == '-':
+        numerator = -numerator
+    power_of_10 -= len(fraction)
+    power_of_2 -= power_of_2_offset
+    denominator = 1
+    if power_of_10 >= 0:
+        numerator *= 10 ** power_of_10
+    else:
+        denominator = 10 ** -power_of_10
+    if power_of_2 >= 0:
+        numerator <<= power_of_2
+    else:
+        denominator <<= -power_of_2
+    return numerator / denominator
+
+
+def parse_quantity(quantity):
+    '''Parses a kubernetes quantity, e.g. "100m", "512Mi" or "1e3", into
+    a float. Results are memoized on the quantity string.'''
+    if isinstance(quantity, (int, float)):
+        return float(quantity)
+    return _parse(quantity, 0)
+
+
+def parse_cpu(quantity):
+    '''Returns a cpu quantity in cores'''
+    return parse_quantity(quantity)
+
+
+def parse_memory(quantity):
+    '''Returns a memory quantity in GiB'''
+    if isinstance(quantity, (int, float)):
+        return quantity / GIB
+    return _parse(quantity, 30)
@@ -0,0 +1,280 @@
+'''Offline cost report of a cluster dump, without a cluster or a server.
+
+    python -m cost_calculator report --provider aws --region us-east-1 dump.json
+
+The input is the JSON read by FROM_FILE ({"pods": [...], "nodes": [...]})
+or the output of kubectl get pods,nodes -o json. Several files can be
+given, e.g. separate pod and node dumps. Files are parsed incrementally
+and pods are priced in batches, so the per-pod report is written while
+the input is read.
+
+    python -m cost_calculator compare --provider aws --provider gce dump.json
+
+prices the pods of a dump in every region of the given providers, or
+of all providers, and prints the regions cheapest first.
+'''
+import argparse
+import json
+import os
+import sys
+
+import redis
+
+from cost_calculator.aggregates import ALL_NAMESPACES, CostTotals, pod_contribution
+from cost_calculator.app import (
+    INSTANCE_DATA_DIR, TIMEFRAME_HOURS, MONTH, ClusterCost, Node, Pod, Settings,
+    _node_from_raw, check_config, load_catalog)
+from cost_calculator.comparison import PROVIDERS, compare_regions, list_targets, make_executor
+from cost_calculator.export import iter_csv, iter_ndjson
+from cost_calculator.instance_selector import PriceGetter, SpotPriceTable
+from cost_calculator.jsonstream import iter_items
+
+BATCH_SIZE = 10000
+POD_FORMATS = {'csv': iter_csv, 'ndjson': iter_ndjson}
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    return open(path, 'r')
+
+
+def iter_dump(fp, cloud_provider=None):
+    '''Yields the Pods and Nodes of a dump'''
+    for key, item in iter_items(fp, ('pods', 'nodes', 'items')):
+        if key == 'pods':
+            yield Pod.from_file(item)
+        elif key == 'nodes':
+            yield Node.from_file(item, cloud_provider)
+        else:
+            kind = item.get('kind')
+            if kind is None:
+                kind = 'Pod' if 'containers' in item.get('spec', {}) else 'Node'
+            if kind == 'Pod':
+                yield Pod.from_raw(item)
+            elif kind == 'Node':
+                node = _node_from_raw(item, cloud_provider)
+                if node is not None:
+                    yield node
+
+
+class DumpReport(object):
+    '''Prices the pods of a dump batch by batch, keeping per-namespace
+    totals, and the nodes once the dump has been read.'''
+    def __init__(self, cluster_cost, batch_size=BATCH_SIZE):
+        self.cluster_cost = cluster_cost
+        self.batch_size = batch_size
+        self.nodes = []
+        self.totals = {ALL_NAMESPACES: CostTotals()}
+
+    def priced_pods(self, objects):
+        '''Yields the pods of objects priced, and collects the nodes'''
+        batch = []
+        for obj in objects:
+            if isinstance(obj, Node):
+                self.nodes.append(obj)
+                continue
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                yield from self._price(batch)
+                batch = []
+        if batch:
+            yield from self._price(batch)
+
+    def _price(self, pods):
+        for pod in self.cluster_cost.price_pods(pods):
+            contribution = pod_contribution(pod)
+            self.totals[ALL_NAMESPACES].add(contribution)
+            self.totals.setdefault(pod.namespace, CostTotals()).add(contribution)
+            yield pod
+
+    def summary(self, hours):
+        nodes = self.cluster_cost.price_nodes(self.nodes)
+        node_cost = sum(node.cost for node in nodes) * hours
+        pods = self.totals[ALL_NAMESPACES].for_hours(hours)
+        return {
+            'node_count': len(nodes),
+            'unpriced_nodes': [node.name for node in nodes if not node.cost],
+            'node_cost': node_cost,
+            'pod_count': pods.pod_count,
+            'on_demand_cost': pods.cost,
+            'spot_cost': pods.spot_price,
+            'savings': node_cost - pods.cost,
+            'savings_for_spot': node_cost - pods.spot_price,
+            'namespaces': {
+                namespace: {
+                    'pod_count': totals.pod_count,
+                    'on_demand_cost': totals.cost * hours,
+                    'spot_cost': totals.spot_price * hours,
+                }
+                for namespace, totals in sorted(self.totals.items())
+                if namespace != ALL_NAMESPACES
+            },
+        }
+
+
+def format_summary(summary, settings, timeframe):
+    lines = [
+        'Cost per {} ({} {})'.format(timeframe, settings.cloud_provider, settings.region),
+        '  nodes: {node_count}, ${node_cost:.2f}'.format(**summary),
+        '  nodeless: {pod_count} pods, ${on_demand_cost:.2f} on-demand, '
+        '${spot_cost:.2f} spot'.format(**summary),
+        '  savings: ${savings:.2f} on-demand, ${savings_for_spot:.2f} spot'.format(**summary),
+    ]
+    if summary['unpriced_nodes']:
+        lines.append('  nodes that could not be priced: {}'.format(
+            ', '.join(summary['unpriced_nodes'])))
+    lines.append('Namespaces:')
+    width = max([len(namespace) for namespace in summary['namespaces']] + [0])
+    for namespace, totals in summary['namespaces'].items():
+        lines.append('  {:<{width}}  {:>7} pods  ${:>12.2f}  ${:>12.2f} spot'.format(
+            namespace, totals['pod_count'], totals['on_demand_cost'],
+            totals['spot_cost'], width=width))
+    return '\n'.join(lines) + '\n'
+
+
+def make_cluster_cost(settings, redis_host=None):
+    '''ClusterCost for pricing dumps. Spot prices are read from redis
+    once when redis_host is given, otherwise spot prices are on-demand
+    prices.'''
+    check_config(settings)
+    instance_selector = load_catalog(settings)
+    if redis_host:
+        price_getter = PriceGetter(settings.cloud_provider, redis.Redis(redis_host, 6379))
+        table = SpotPriceTable(price_getter, settings.region)
+        if not table.refresh():
+            raise RuntimeError('could not load spot prices: {}'.format(table.last_error))
+        instance_selector.price_getter = table
+    else:
+        instance_selector.price_getter = None
+    return ClusterCost(None, instance_selector, from_file=True,
+                       cloud_provider=settings.cloud_provider)
+
+
+def iter_inputs(paths, cloud_provider=None):
+    '''Yields the Pods and Nodes of the dump files paths'''
+    for path in paths:
+        fp = open_input(path)
+        try:
+            yield from iter_dump(fp, cloud_provider)
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+
+def run_report(args, out):
+    settings = Settings(cloud_provider=args.provider, region=args.region)
+    report = DumpReport(make_cluster_cost(settings, args.redis_host), args.batch_size)
+    hours = TIMEFRAME_HOURS[args.timeframe]
+    pods = report.priced_pods(iter_inputs(args.inputs, settings.cloud_provider))
+    if args.format in POD_FORMATS:
+        for chunk in POD_FORMATS[args.format](pods, hours):
+            out.write(chunk)
+        summary_out = sys.stderr
+    else:
+        for _ in pods:
+            pass
+        summary_out = out
+    summary = report.summary(hours)
+    if args.format == 'json':
+        summary.update(provider=settings.cloud_provider, region=settings.region,
+                       timeframe=args.timeframe)
+        json.dump(summary, summary_out, indent=2)
+        summary_out.write('\n')
+    else:
+        summary_out.write(format_summary(summary, settings, args.timeframe))
+
+
+def format_comparison(costs, hours, timeframe):
+    lines = ['On-demand nodeless cost per {}, cheapest first'.format(timeframe)]
+    width = max([len(cost.region) for cost in costs] + [0])
+    for rank, cost in enumerate(costs, 1):
+        line = '{:>4}  {:<5}  {:<{width}}  ${:>12.2f}'.format(
+            rank, cost.cloud, cost.region, cost.cost * hours, width=width)
+        if cost.unpriced_pods:
+            line += '  ({} pods fit no instance)'.format(cost.unpriced_pods)
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def run_compare(args, out):
+    pods = [obj for obj in iter_inputs(args.inputs) if isinstance(obj, Pod)]
+    targets = list_targets(INSTANCE_DATA_DIR, args.provider or PROVIDERS, args.region or None)
+    if not targets:
+        raise ValueError('no region matches')
+    if args.processes == 0:
+        costs = compare_regions(pods, targets, INSTANCE_DATA_DIR)
+    else:
+        with make_executor(args.processes) as executor:
+            costs = compare_regions(pods, targets, INSTANCE_DATA_DIR, executor)
+    hours = TIMEFRAME_HOURS[args.timeframe]
+    if args.format == 'json':
+        json.dump({
+            'timeframe': args.timeframe,
+            'pod_count': len(pods),
+            'regions': [cost.to_dict(hours) for cost in costs],
+        }, out, indent=2)
+        out.write('\n')
+    else:
+        out.write(format_comparison(costs, hours, args.timeframe))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python -m cost_calculator')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    report = commands.add_parser(
+        'report', help='price a cluster dump',
+        description='Prices the pods and nodes of cluster dumps.')
+    report.add_argument('inputs', nargs='+', metavar='FILE',
+                        help="FROM_FILE input or kubectl -o json dump, '-' for stdin")
+    report.add_argument('--provider', default=os.getenv('CLOUD_PROVIDER'),
+                        choices=['aws', 'gce', 'azure'],
+                        help='cloud provider (default: $CLOUD_PROVIDER)')
+    report.add_argument('--region', default=os.getenv('REGION'),
+                        help='region (default: $REGION)')
+    report.add_argument('--timeframe', default=MONTH, choices=list(TIMEFRAME_HOURS))
+    report.add_argument('--format', default='text',
+                        choices=['text', 'json'] + list(POD_FORMATS),
+                        help='text or json summary, or the per-pod report as csv '
+                             'or ndjson with the summary on stderr')
+    report.add_argument('-o', '--output', help='output file (default: stdout)')
+    report.add_argument('--redis-host',
+                        help='read spot prices from this redis, otherwise spot '
+                             'prices are on-demand prices')
+    report.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=argparse.SUPPRESS)
+    report.set_defaults(run=run_report)
+
+    compare = commands.add_parser(
+        'compare', help='compare the nodeless cost of a cluster dump across regions',
+        description='Prices the pods of cluster dumps with the on-demand prices '
+                    'of every region of the given providers.')
+    compare.add_argument('inputs', nargs='+', metavar='FILE',
+                         help="FROM_FILE input or kubectl -o json dump, '-' for stdin")
+    compare.add_argument('--provider', action='append', choices=list(PROVIDERS),
+                         help='provider to compare, can be repeated (default: all)')
+    compare.add_argument('--region', action='append',
+                         help='region to compare, can be repeated (default: all)')
+    compare.add_argument('--timeframe', default=MONTH, choices=list(TIMEFRAME_HOURS))
+    compare.add_argument('--format', default='text', choices=['text', 'json'])
+    compare.add_argument('--processes', type=int, default=None,
+                         help='worker processes, 0 to price in this process '
+                              '(default: one per CPU)')
+    compare.add_argument('-o', '--output', help='output file (default: stdout)')
+    compare.set_defaults(run=run_compare)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                args.run(args, out)
+        else:
+            args.run(args, sys.stdout)
+    except (ValueError, RuntimeError, OSError) as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    return 0
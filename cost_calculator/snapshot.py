@@ -0,0 +1,271 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+
+import attr
+
+from cost_calculator.aggregates import ALL_NAMESPACES, CostTotals, namespace_totals
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(frozen=True)
+class NodeTotals:
+    '''Hourly cost and resources of the nodes that could be priced'''
+    node_count = attr.ib(default=0)
+    cost = attr.ib(default=0.0)
+    cpu = attr.ib(default=0.0)
+    memory = attr.ib(default=0.0)
+
+
+@attr.s(frozen=True)
+class ClusterSnapshot:
+    '''Immutable, versioned view of the priced cluster.
+
+    Holds copies of the priced pods and costed nodes, plus hourly
+    totals per namespace (ALL_NAMESPACES for the whole cluster) and
+    the same totals multiplied out for every timeframe. fingerprint
+    is a digest of the pods and nodes with their prices, changed_at
+    is when a snapshot with that fingerprint was first built. packing
+    is the PackingResult of the pods on the cheapest mix of nodes, None
+    when the snapshot is built without packing.
+    '''
+    version = attr.ib()
+    created_at = attr.ib()
+    build_duration = attr.ib()
+    fingerprint = attr.ib()
+    changed_at = attr.ib()
+    pods = attr.ib(converter=tuple)
+    nodes = attr.ib(converter=tuple)
+    invalid_nodes = attr.ib(converter=tuple)
+    pods_by_namespace = attr.ib(converter=MappingProxyType)
+    pod_totals = attr.ib(converter=MappingProxyType)
+    node_totals = attr.ib()
+    timeframe_totals = attr.ib(converter=MappingProxyType)
+    timeframe_node_cost = attr.ib(converter=MappingProxyType)
+    packing = attr.ib(default=None)
+
+    @property
+    def namespaces(self):
+        return sorted(ns for ns in self.pod_totals if ns != ALL_NAMESPACES)
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def pods_in(self, namespace=ALL_NAMESPACES):
+        if namespace in (ALL_NAMESPACES, 'all'):
+            return self.pods
+        return self.pods_by_namespace.get(namespace, ())
+
+    def totals(self, namespace=ALL_NAMESPACES, timeframe=None):
+        '''Pod totals of a namespace, hourly or for a timeframe'''
+        if namespace == 'all':
+            namespace = ALL_NAMESPACES
+        if timeframe is None:
+            totals = self.pod_totals
+        else:
+            totals = self.timeframe_totals[timeframe]
+        return totals.get(namespace, CostTotals())
+
+
+def fingerprint(pods, nodes):
+    '''Digest of the pods and nodes, whatever order they are listed in,
+    so that every worker gets the same one for the same cluster'''
+    digest = hashlib.blake2b(digest_size=16)
+    for pod in sorted(pods, key=lambda pod: (pod.namespace, pod.name)):
+        digest.update(repr((
+            pod.namespace, pod.name, pod.instance_type, pod.cost,
+            pod.spot_price, pod.req_cpu, pod.req_memory, pod.lim_cpu,
+            pod.lim_memory, pod.gpu_spec, pod.owner,
+            sorted(pod.labels.items()),
+        )).encode('utf-8'))
+    digest.update(b'nodes')
+    for node in sorted(nodes, key=lambda node: node.name):
+        digest.update(repr((
+            node.name, node.instance_type, node.cost, node.cpu, node.memory,
+        )).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_snapshot(cluster_cost, version, timeframes, pack=None):
+    '''Prices the whole cluster into a ClusterSnapshot. timeframes maps
+    a timeframe name to its number of hours, pack, when given, packs
+    the pods onto nodes and returns a PackingResult.'''
+    start = time.monotonic()
+    pods = [attr.evolve(pod) for pod in cluster_cost.get_nodeless_pods('')]
+    nodes = [attr.evolve(node) for node in cluster_cost.get_current_cluster_cost()]
+    pod_totals = namespace_totals(pods)
+    pods_by_namespace = {}
+    for pod in pods:
+        pods_by_namespace.setdefault(pod.namespace, []).append(pod)
+    for namespace, namespace_pods in pods_by_namespace.items():
+        pods_by_namespace[namespace] = tuple(namespace_pods)
+    valid_nodes = [node for node in nodes if node.cost]
+    node_totals = NodeTotals(
+        node_count=len(valid_nodes),
+        cost=sum(node.cost for node in valid_nodes),
+        cpu=sum(node.cpu for node in valid_nodes),
+        memory=sum(node.memory for node in valid_nodes))
+    timeframe_totals = {
+        timeframe: MappingProxyType({
+            namespace: totals.for_hours(hours)
+            for namespace, totals in pod_totals.items()
+        })
+        for timeframe, hours in timeframes.items()
+    }
+    timeframe_node_cost = {
+        timeframe: node_totals.cost * hours
+        for timeframe, hours in timeframes.items()
+    }
+    packing = None
+    if pack is not None:
+        try:
+            packing = pack(pods)
+        except Exception:
+            # the rest of the snapshot is still worth serving
+            logger.exception('error packing the pods onto nodes')
+    created_at = time.time()
+    return ClusterSnapshot(
+        version=version,
+        created_at=created_at,
+        build_duration=time.monotonic() - start,
+        fingerprint=fingerprint(pods, nodes),
+        changed_at=created_at,
+        pods=pods,
+        nodes=nodes,
+        invalid_nodes=[node.name for node in nodes if not node.cost],
+        pods_by_namespace=pods_by_namespace,
+        pod_totals=pod_totals,
+        node_totals=node_totals,
+        timeframe_totals=timeframe_totals,
+        timeframe_node_cost=timeframe_node_cost,
+        packing=packing,
+    )
+
+
+class ChangeTimes(object):
+    '''The fingerprint of the latest snapshot content and when it
+    changed, kept in a directory shared by the worker processes so that
+    they all report the same changed_at. changed_at never decreases,
+    content going back to an earlier state is a change too.'''
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._state_path = os.path.join(path, 'changed_at')
+        self._lock_path = os.path.join(path, 'changed_at.lock')
+
+    def _read(self):
+        try:
+            with open(self._state_path) as fp:
+                fingerprint, _, changed_at = fp.read().partition(' ')
+        except FileNotFoundError:
+            return None, 0.0
+        return fingerprint, float(changed_at)
+
+    def changed(self, fingerprint, now):
+        '''changed_at of the content with fingerprint, now or later when
+        the content differs from the latest one recorded'''
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            latest, changed_at = self._read()
+            if latest == fingerprint:
+                return changed_at
+            changed_at = max(changed_at, now)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.')
+            with os.fdopen(fd, 'w') as fp:
+                fp.write('{} {!r}'.format(fingerprint, changed_at))
+            os.replace(tmp_path, self._state_path)
+            return changed_at
+
+
+class SnapshotScheduler(object):
+    '''Rebuilds the cluster snapshot in the background.
+
+    build is called with the next version number and returns a
+    ClusterSnapshot. start() rebuilds it every interval seconds, and
+    current() swaps in a fresh build synchronously when the current
+    snapshot is missing or older than max_staleness seconds. With
+    change_times, a ChangeTimes, changed_at is shared with the other
+    workers.
+    '''
+    def __init__(self, build, interval=30, max_staleness=300, change_times=None):
+        self.build = build
+        self.change_times = change_times
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.last_error = None
+        self._snapshot = None
+        self._version = 0
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def has_snapshot(self):
+        return self._snapshot is not None
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age() > self.max_staleness:
+            with self._build_lock:
+                # another request may have rebuilt it while we waited
+                if self._snapshot is snapshot:
+                    self._rebuild()
+                snapshot = self._snapshot
+        return snapshot
+
+    def refresh(self):
+        with self._build_lock:
+            return self._rebuild()
+
+    def _rebuild(self):
+        snapshot = self.build(self._version + 1)
+        previous = self._snapshot
+        if previous is not None and previous.fingerprint == snapshot.fingerprint:
+            snapshot = attr.evolve(snapshot, changed_at=previous.changed_at)
+        else:
+            changed_at = snapshot.changed_at
+            if self.change_times is not None:
+                try:
+                    changed_at = self.change_times.changed(snapshot.fingerprint, changed_at)
+                except (OSError, ValueError):
+                    logger.exception('error reading the change time of the snapshot')
+            # Last-Modified never goes back, even to earlier content
+            if previous is not None:
+                changed_at = max(changed_at, previous.changed_at)
+            if changed_at != snapshot.changed_at:
+                snapshot = attr.evolve(snapshot, changed_at=changed_at)
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        return snapshot
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='snapshot-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        if self._snapshot is not None:
+            self._stop.wait(self.interval)
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception('error building cluster snapshot')
+            self._stop.wait(self.interval)
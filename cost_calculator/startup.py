@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Phase(object):
+    '''One step of startup, run the first time its value is needed.
+
+    factory is called at most once, unless it raises, in which case the
+    error is recorded and the next get() tries again. ready, when
+    given, is called with the value and tells whether the phase is
+    done beyond having run, e.g. a table that fills in the background.
+    start, when given, is called with the value to start its background
+    threads. It is kept apart from the factory so that a value can be
+    built in a process that forks afterwards.
+    '''
+    def __init__(self, name, factory, ready=None, start=None):
+        self.name = name
+        self.factory = factory
+        self.ready_func = ready
+        self.start_func = start
+        self.started = False
+        self.started_at = None
+        self.duration = None
+        self.error = None
+        self._value = None
+        self._done = False
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def ready(self):
+        if not self._done:
+            return False
+        return self.ready_func is None or bool(self.ready_func(self._value))
+
+    def get(self):
+        if self._done:
+            return self._value
+        with self._lock:
+            if not self._done:
+                self._run()
+        return self._value
+
+    def _run(self):
+        self.started_at = time.time()
+        start = time.monotonic()
+        try:
+            value = self.factory()
+        except Exception as e:
+            self.error = str(e)
+            logger.exception('startup phase %s failed', self.name)
+            raise
+        finally:
+            self.duration = time.monotonic() - start
+        self._value = value
+        self.error = None
+        self._done = True
+        logger.info('startup phase %s took %.3fs', self.name, self.duration)
+
+    def start(self):
+        with self._lock:
+            if not self._done or self.started:
+                return
+            self.started = True
+        if self.start_func is not None:
+            self.start_func(self._value)
+
+    def set(self, value):
+        '''Marks the phase done with a value built elsewhere'''
+        with self._lock:
+            self._value = value
+            self.error = None
+            self._done = True
+
+    def status(self):
+        return {
+            'done': self._done,
+            'ready': self.ready,
+            'started': self.started,
+            'duration': self.duration,
+            'error': self.error,
+        }
+
+
+class Startup(object):
+    '''Ordered set of lazy startup phases.
+
+    Phases are registered in dependency order; warm_up() runs them all
+    in a background thread so the first request does not have to.
+    Background threads of the phases only run after start(), phases
+    that are done later are started as soon as they are done. preload()
+    runs every phase without starting threads, for servers that build
+    their state once and then fork workers.
+    '''
+    def __init__(self):
+        self.phases = {}
+        self.started = False
+        self._warm_up_thread = None
+        self._warm_up_lock = threading.Lock()
+
+    def add(self, name, factory, ready=None, start=None):
+        phase = Phase(name, factory, ready, start)
+        self.phases[name] = phase
+        return phase
+
+    def __getitem__(self, name):
+        return self.phases[name]
+
+    def get(self, name):
+        phase = self.phases[name]
+        value = phase.get()
+        if self.started and not phase.started:
+            phase.start()
+        return value
+
+    def preload(self, names=None):
+        '''Runs the phases, or those named, in this thread, stopping at
+        the first one that fails. Failed phases are retried by the next
+        warm_up().'''
+        self._warm_up(names)
+
+    def start(self):
+        self.started = True
+        for phase in self.phases.values():
+            phase.start()
+
+    def ready(self, names=None):
+        if names is None:
+            names = self.phases
+        return all(self.phases[name].ready for name in names)
+
+    def status(self):
+        return {name: phase.status() for name, phase in self.phases.items()}
+
+    def warm_up(self):
+        with self._warm_up_lock:
+            if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+                return
+            self._warm_up_thread = threading.Thread(
+                target=self._warm_up, name='startup', daemon=True)
+            self._warm_up_thread.start()
+
+    def _warm_up(self, names=None):
+        for name in self.phases if names is None else names:
+            try:
+                self.get(name)
+            except Exception:
+                # recorded on the phase, retried by the next warm_up()
+                return
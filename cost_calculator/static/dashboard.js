@@ -5,57 +5,74 @@
 
   feather.replace()
 
-  const namespace = document.getElementsByClassName('namespace-option')[1].value;
-  const costURL = `/api/cost/pods/${namespace}`;
-  console.log(costURL);
-  fetch(costURL)
-    .then(resp => resp.json())
-    .then(data => {
-      console.log(data)
-      // Graphs
-      var ctx = document.getElementById('forcast-chart').getContext('2d');
-      // eslint-disable-next-line no-unused-vars
-      var myChart = new Chart(ctx, {
-        "type": 'line',
-        "data": {
-          labels: [
-            'Sunday',
-            'Monday',
-            'Tuesday',
-            'Wednesday',
-            'Thursday',
-            'Friday',
-            'Saturday'
-          ],
-          datasets: [{
-            data: data.costs,
-            lineTension: 0,
-            backgroundColor: 'transparent',
-            borderColor: '#007bff',
-            borderWidth: 4,
-            pointBackgroundColor: '#007bff'
-          }]
-        },
-        options: {
-          responsive: true,
-          scales: {
-            yAxes: [{
-              ticks: {
-                beginAtZero: false
-              }
-            }]
+  const history = document.getElementById('cost-history')
+  if (!history) {
+    return
+  }
+  const range = document.getElementById('history-range')
+  const ctx = document.getElementById('forcast-chart').getContext('2d')
+  const chart = new Chart(ctx, {
+    type: 'line',
+    data: {
+      labels: [],
+      datasets: [
+        { label: 'Node cost', borderColor: '#6c757d' },
+        { label: 'Nodeless on-demand cost', borderColor: '#007bff' },
+        { label: 'Nodeless spot cost', borderColor: '#28a745' }
+      ].map(dataset => Object.assign(dataset, {
+        data: [],
+        lineTension: 0,
+        backgroundColor: 'transparent',
+        borderWidth: 2,
+        pointRadius: 0
+      }))
+    },
+    options: {
+      responsive: true,
+      scales: {
+        yAxes: [{
+          scaleLabel: {
+            display: true,
+            labelString: 'Cost per hour'
           },
-          layout: {
-            padding: {
-              left: 50,
-              right: 0,
-              top: 0,
-              bottom: 0
-          },
-          legend: {
-            display: true
+          ticks: {
+            beginAtZero: false
           }
+        }]
+      },
+      legend: {
+        display: true
+      }
+    }
+  })
+
+  function label (ts, resolution) {
+    const date = new Date(ts * 1000)
+    return resolution === 'day' ? date.toLocaleDateString() : date.toLocaleString()
+  }
+
+  function load () {
+    const end = Math.floor(Date.now() / 1000)
+    const params = new URLSearchParams({
+      namespace: history.dataset.namespace,
+      start: end - Number(range.value) * 86400,
+      end: end
+    })
+    fetch(`/api/v1/cost/history?${params}`)
+      .then(resp => resp.json())
+      .then(data => {
+        if (data.error) {
+          history.hidden = true
+          return
         }
-      }}); 
-    });
+        chart.data.labels = data.ts.map(ts => label(ts, data.resolution))
+        chart.data.datasets[0].data = data.node_cost
+        chart.data.datasets[1].data = data.on_demand_cost
+        chart.data.datasets[2].data = data.spot_cost
+        chart.update()
+      })
+  }
+
+  range.addEventListener('change', load)
+  load()
 }())
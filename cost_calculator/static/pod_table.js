@@ -0,0 +1,126 @@
+/* Fills the forecast pod table page by page from /api/v1/cost/pods.
+   Sorting and searching are done by the server. */
+
+(function () {
+  'use strict'
+
+  const table = document.getElementById('pod-table')
+  if (!table) {
+    return
+  }
+  const tbody = table.tBodies[0]
+  const prev = document.getElementById('pod-prev')
+  const next = document.getElementById('pod-next')
+  const info = document.getElementById('pod-page-info')
+  const search = document.getElementById('pod-search')
+
+  const state = {
+    sort: '-on_demand_cost',
+    search: '',
+    // cursors[i] is the cursor of page i, the first page has none
+    cursors: [null],
+    page: 0,
+    nextCursor: null
+  }
+  let request = 0
+
+  function round (value) {
+    return Math.round(value * 100) / 100
+  }
+
+  function cell (row, text) {
+    const td = document.createElement('td')
+    td.textContent = text
+    row.appendChild(td)
+  }
+
+  function render (data) {
+    const rows = document.createDocumentFragment()
+    data.items.forEach(function (pod) {
+      const row = document.createElement('tr')
+      if (pod.cpu === 0 && pod.memory === 0) {
+        row.style.backgroundColor = '#e0ce47'
+      }
+      cell(row, pod.namespace)
+      cell(row, pod.name)
+      cell(row, round(pod.req_cpu))
+      cell(row, round(pod.req_memory))
+      cell(row, round(pod.lim_cpu))
+      cell(row, round(pod.lim_memory))
+      cell(row, pod.gpu_spec)
+      cell(row, pod.instance_type)
+      cell(row, pod.on_demand_cost)
+      cell(row, pod.spot_cost)
+      rows.appendChild(row)
+    })
+    tbody.replaceChildren(rows)
+
+    const pageSize = Number(table.dataset.pageSize)
+    const first = data.total === 0 ? 0 : state.page * pageSize + 1
+    info.textContent = `${first}-${state.page * pageSize + data.items.length} of ${data.total}`
+    state.nextCursor = data.next_cursor
+    prev.disabled = state.page === 0
+    next.disabled = data.next_cursor === null
+  }
+
+  function load () {
+    const params = new URLSearchParams({
+      namespace: table.dataset.namespace,
+      sort: state.sort,
+      limit: table.dataset.pageSize
+    })
+    if (state.search) {
+      params.set('search', state.search)
+    }
+    const cursor = state.cursors[state.page]
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    const current = ++request
+    fetch(`/api/v1/cost/pods?${params}`)
+      .then(resp => resp.json())
+      .then(data => {
+        // drop responses to requests that have been superseded
+        if (current === request) {
+          render(data)
+        }
+      })
+  }
+
+  function reset () {
+    state.cursors = [null]
+    state.page = 0
+    load()
+  }
+
+  prev.addEventListener('click', function () {
+    state.page -= 1
+    load()
+  })
+
+  next.addEventListener('click', function () {
+    state.cursors[state.page + 1] = state.nextCursor
+    state.page += 1
+    load()
+  })
+
+  table.tHead.querySelectorAll('th[data-sort]').forEach(function (th) {
+    th.style.cursor = 'pointer'
+    th.addEventListener('click', function () {
+      const field = th.dataset.sort
+      state.sort = state.sort === '-' + field ? field : '-' + field
+      reset()
+    })
+  })
+
+  let timer = null
+  search.addEventListener('input', function () {
+    clearTimeout(timer)
+    timer = setTimeout(function () {
+      state.search = search.value.trim()
+      reset()
+    }, 250)
+  })
+
+  load()
+}())
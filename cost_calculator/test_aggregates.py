@@ -0,0 +1,31 @@
+import unittest
+
+from cost_calculator.aggregates import ALL_NAMESPACES, CostTotals, namespace_totals
+from cost_calculator.app import Pod
+
+
+class TestNamespaceTotals(unittest.TestCase):
+    def test_namespace_totals(self):
+        pods = [
+            Pod(namespace='a', name='p1', req_cpu=1.0, req_memory=2.0, lim_cpu=2.0, lim_memory=1.0,
+                gpu_spec='', cost=0.5, spot_price=0.2),
+            Pod(namespace='a', name='p2', req_cpu=0.5, req_memory=0.5, lim_cpu=0.0, lim_memory=0.0,
+                gpu_spec='', cost=0.25, spot_price=0.1),
+        ]
+        totals = namespace_totals(pods)
+        self.assertEqual(sorted(totals), [ALL_NAMESPACES, 'a'])
+        self.assertEqual(
+            (totals['a'].pod_count, totals['a'].cost, totals['a'].spot_price,
+             totals['a'].cpu, totals['a'].memory),
+            (2, 0.75, 0.30000000000000004, 2.5, 2.5))
+        self.assertEqual(totals[ALL_NAMESPACES], totals['a'])
+        self.assertEqual(namespace_totals([]), {ALL_NAMESPACES: CostTotals()})
+
+    def test_for_hours(self):
+        totals = CostTotals(pod_count=2, cost=0.5, spot_price=0.25, cpu=1.0, memory=2.0)
+        self.assertEqual(totals.for_hours(10),
+                         CostTotals(pod_count=2, cost=5.0, spot_price=2.5, cpu=1.0, memory=2.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
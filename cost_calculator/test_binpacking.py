@@ -0,0 +1,176 @@
+import os
+import random
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from cost_calculator.app import INSTANCE_DATA_DIR, packing_constraints
+from cost_calculator.binpacking import (
+    NodePacker, PackingConstraints, coarsen, first_fit_decreasing, pack_pods, request_shapes)
+from cost_calculator.comparison import region_selector
+from cost_calculator.instance_selector import CatalogColumns
+from cost_calculator.testing import (
+    make_cluster_cost, make_request_pod, make_snapshots, make_test_app)
+
+NO_RESERVE = PackingConstraints(reserved_cpu=0.0, reserved_memory=0.0)
+
+
+def make_catalog(*types):
+    return CatalogColumns([
+        {'instanceType': name, 'cpu': cpu, 'memory': memory, 'gpu': gpu,
+         'price': price, 'baseline': cpu, 'burstable': False}
+        for name, cpu, memory, gpu, price in types
+    ])
+
+
+def naive_ffd(pods, node_cpu, node_memory, max_pods):
+    '''First-fit decreasing one pod at a time, returns the used cpu of
+    every node'''
+    pods = sorted(pods, key=lambda p: (-max(p[0] / node_cpu, p[1] / node_memory), p))
+    nodes = []
+    for cpu, memory in pods:
+        for node in nodes:
+            if (node[0] + cpu <= node_cpu + 1e-9 and node[1] + memory <= node_memory + 1e-9
+                    and node[2] < max_pods):
+                break
+        else:
+            node = [0.0, 0.0, 0]
+            nodes.append(node)
+        node[0] += cpu
+        node[1] += memory
+        node[2] += 1
+    return [node[0] for node in nodes]
+
+
+class TestBinPacking(unittest.TestCase):
+    def setUp(self):
+        self.catalog = make_catalog(
+            ('small', 2, 4, 0, 0.1),
+            ('large', 8, 16, 0, 0.35),
+            ('gpu', 8, 16, 1, 0.2),
+        )
+
+    def test_matches_naive_ffd(self):
+        rand = random.Random(7)
+        pods = [(rand.choice([0.1, 0.25, 0.5, 1.0, 1.5]), rand.choice([0.25, 1.0, 2.0, 3.0]))
+                for _ in range(500)]
+        cpus, memories, counts = request_shapes([make_request_pod('p', c, m) for c, m in pods])
+        used_cpu, _, used_pods = first_fit_decreasing(cpus, memories, counts, 4.0, 8.0, 10)
+        self.assertEqual([round(cpu, 6) for cpu in used_cpu],
+                         [round(cpu, 6) for cpu in naive_ffd(pods, 4.0, 8.0, 10)])
+        self.assertEqual(used_pods.sum(), 500)
+        self.assertLessEqual(used_pods.max(), 10)
+
+    def test_right_sizes_nodes(self):
+        # 9 pods fill one large node, the last one goes on a small node
+        pods = [make_request_pod('p{}'.format(i), 1.0, 1.0) for i in range(9)]
+        result = pack_pods(pods, self.catalog, NO_RESERVE)
+        self.assertEqual(dict(result.instance_types), {'large': 1, 'small': 1})
+        self.assertAlmostEqual(result.cost, 0.45)
+        self.assertEqual(result.node_count, 2)
+        self.assertEqual(result.pod_count, 9)
+        self.assertEqual(result.unplaced_pods, 0)
+
+    def test_cheaper_mix_than_one_type(self):
+        # four small nodes cost more than one large node
+        pods = [make_request_pod('p{}'.format(i), 2.0, 4.0) for i in range(4)]
+        result = pack_pods(pods, self.catalog, NO_RESERVE)
+        self.assertEqual(dict(result.instance_types), {'large': 1})
+
+    def test_constraints(self):
+        pods = [make_request_pod('p{}'.format(i), 0.1, 0.1) for i in range(20)]
+        result = pack_pods(pods, self.catalog, PackingConstraints(
+            max_pods_per_node=5, reserved_cpu=0.0, reserved_memory=0.0))
+        self.assertEqual(result.node_count, 4)
+        result = pack_pods(pods, self.catalog, PackingConstraints(
+            reserved_cpu=0.0, reserved_memory=0.0, families=['large']))
+        self.assertEqual(dict(result.instance_types), {'large': 1})
+        # the reserve leaves 1.5 cores of a small node
+        pods = [make_request_pod('p{}'.format(i), 1.0, 1.0) for i in range(2)]
+        result = pack_pods(pods, self.catalog, PackingConstraints(reserved_cpu=0.5))
+        self.assertEqual(dict(result.instance_types), {'small': 2})
+
+    def test_unplaced_pods(self):
+        pods = [make_request_pod('a', 1.0, 1.0), make_request_pod('huge', 64.0, 1.0),
+                make_request_pod('gpu', 1.0, 1.0, gpu_spec='1')]
+        result = pack_pods(pods, self.catalog, NO_RESERVE)
+        self.assertEqual(result.unplaced_pods, 2)
+        self.assertEqual(dict(result.instance_types), {'small': 1})
+        result = pack_pods([], self.catalog)
+        self.assertEqual((result.cost, result.node_count, result.pod_count), (0.0, 0, 0))
+
+    def test_no_type_holds_every_shape(self):
+        # the cpu-heavy pod only fits c.big, the memory-heavy one only r.big
+        catalog = make_catalog(('c.big', 72, 144, 0, 3.0), ('r.big', 16, 512, 0, 4.0))
+        pods = [make_request_pod('cpu', 60.0, 8.0), make_request_pod('memory', 4.0, 400.0)]
+        result = pack_pods(pods, catalog, NO_RESERVE)
+        self.assertEqual(dict(result.instance_types), {'c.big': 1, 'r.big': 1})
+        self.assertAlmostEqual(result.cost, 7.0)
+        self.assertEqual(result.unplaced_pods, 0)
+
+    def test_max_pods_at_least_one(self):
+        with self.assertRaises(ValueError):
+            PackingConstraints(max_pods_per_node=0)
+        with patch.dict(os.environ, {'PACKING_MAX_PODS_PER_NODE': '0'}):
+            with self.assertRaises(ValueError):
+                packing_constraints()
+
+    def test_coarsen(self):
+        cpus = np.linspace(0.1, 2.0, 500)
+        memories = np.linspace(0.5, 4.0, 500)
+        counts = np.arange(1, 501)
+        self.assertIs(coarsen(cpus, memories, counts)[2], counts)
+        rounded_cpus, rounded_memories, rounded_counts = coarsen(cpus, memories, counts, 100)
+        self.assertLessEqual(len(rounded_counts), 100)
+        self.assertEqual(rounded_counts.sum(), counts.sum())
+        # rounded up, by less than the step
+        self.assertGreaterEqual(np.dot(rounded_cpus, rounded_counts), np.dot(cpus, counts))
+        self.assertLess(np.dot(rounded_cpus, rounded_counts), np.dot(cpus, counts) * 1.05)
+        self.assertTrue(0.5 <= rounded_memories.min() < 0.5 * 1.05)
+
+    def test_region_catalog(self):
+        selector = region_selector(INSTANCE_DATA_DIR, 'aws', 'us-east-1')
+        rand = random.Random(3)
+        pods = [make_request_pod('p{}'.format(i), rand.choice([0.1, 0.25, 0.5, 1.0, 2.0, 4.0]),
+                         rand.choice([0.125, 0.5, 1.0, 4.0, 8.0]))
+                for i in range(50000)]
+        start = time.monotonic()
+        result = pack_pods(pods, selector.price_index.columns)
+        self.assertLess(time.monotonic() - start, 5.0)
+        self.assertEqual(result.unplaced_pods, 0)
+        self.assertEqual(sum(result.instance_types.values()), result.node_count)
+        # no packing beats paying for the requested cores alone
+        columns = selector.price_index.columns
+        priced = columns.price > 0
+        cheapest_core = np.min(columns.price[priced] / columns.cpu[priced])
+        self.assertGreaterEqual(result.cost, sum(p.req_cpu for p in pods) * cheapest_core)
+
+    def test_packer_reuses_result(self):
+        selector = Mock(catalog_version=1)
+        selector.price_index.columns = self.catalog
+        packer = NodePacker(selector, NO_RESERVE)
+        pods = [make_request_pod('p', 1.0, 1.0)]
+        result = packer(pods)
+        self.assertIs(packer([make_request_pod('q', 1.0, 1.0)]), result)
+        self.assertIsNot(packer(pods * 2), result)
+        result = packer(pods * 2)
+        selector.catalog_version = 2
+        self.assertIsNot(packer(pods * 2), result)
+
+    def test_cost_summary(self):
+        cluster_cost = make_cluster_cost([make_request_pod('p', 1.0, 1.0)])
+        selector = Mock(catalog_version=1)
+        selector.price_index.columns = self.catalog
+        app = make_test_app(make_snapshots(self, cluster_cost, NodePacker(selector, NO_RESERVE)))
+        body = app.test_client().get('/').get_data(as_text=True)
+        self.assertIn('Optimally Packed Node Cost', body)
+        self.assertIn('$73.0 (1 nodes', body)
+
+    @patch.dict(os.environ, {'PACKING_INSTANCE_FAMILIES': 'm5., c5.',
+                             'PACKING_MAX_PODS_PER_NODE': '58'})
+    def test_constraints_from_env(self):
+        constraints = packing_constraints()
+        self.assertEqual(constraints.families, ('m5.', 'c5.'))
+        self.assertEqual(constraints.max_pods_per_node, 58)
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cost_calculator.catalog import CompiledCatalog, CompiledRegion, catalog_path, \
+    compile_directory, load_catalog
+from cost_calculator.instance_selector import make_instance_selector
+from cost_calculator.test_instance_selector import mget_prices
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+datadir = os.path.join(scriptdir, 'instance-data')
+
+
+class TestCompiledCatalog(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        for filename in os.listdir(datadir):
+            if filename.endswith('.json'):
+                shutil.copy(os.path.join(datadir, filename), cls.tmpdir)
+        compile_directory(cls.tmpdir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_round_trip(self):
+        for cloud in ('aws', 'azure', 'gce'):
+            catalog = CompiledCatalog(catalog_path(self.tmpdir, cloud))
+            with open(os.path.join(datadir, f'{cloud}_instance_data.json')) as fp:
+                inst_data_by_region = json.load(fp)
+            self.assertEqual(sorted(catalog.regions), sorted(inst_data_by_region))
+            for region, inst_data in inst_data_by_region.items():
+                self.assertEqual(list(catalog[region]), inst_data, f'{cloud}: {region}')
+        catalog = CompiledCatalog(catalog_path(self.tmpdir, 'gce'))
+        with open(os.path.join(datadir, 'gce_custom_instance_data.json')) as fp:
+            custom_by_region = json.load(fp)
+        for region, custom_data in custom_by_region.items():
+            self.assertEqual(catalog.custom_data(region), custom_data)
+
+    def test_selection_matches_json(self):
+        shapes = [(cpu, memory, gpu) for cpu in (0, 0.5, 1, 3, 34)
+                  for memory in (0, 1, 3.75, 180) for gpu in ('', '1')]
+        for cloud, region in [('aws', 'us-east-1'), ('azure', 'East US'), ('gce', 'us-west1-a')]:
+            with patch('cost_calculator.instance_selector.redis.Redis.mget') as mocked_mget:
+                mocked_mget.side_effect = mget_prices
+                compiled = make_instance_selector(self.tmpdir, cloud, region)
+                self.assertIsInstance(compiled.inst_data, CompiledRegion)
+                selector = make_instance_selector(datadir, cloud, region)
+                for shape in shapes:
+                    self.assertEqual(compiled.get_cheapest_instance(*shape),
+                                     selector.get_cheapest_instance(*shape), f'{cloud}: {shape}')
+                for inst in selector.inst_data[:5]:
+                    self.assertEqual(compiled.spec_for_inst_type(inst['instanceType']), inst)
+
+    def test_newer_json_is_used(self):
+        path = catalog_path(self.tmpdir, 'aws')
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime - 10, mtime - 10))
+        try:
+            inst_data, _ = load_catalog(self.tmpdir, 'aws', 'us-east-1')
+            self.assertIsInstance(inst_data, list)
+        finally:
+            os.utime(path, (mtime, mtime))
+        inst_data, _ = load_catalog(self.tmpdir, 'aws', 'us-east-1')
+        self.assertIsInstance(inst_data, CompiledRegion)
+
+    def test_not_a_catalog(self):
+        path = os.path.join(self.tmpdir, 'aws_instance_data.json')
+        with self.assertRaises(ValueError):
+            CompiledCatalog(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cost_calculator.cgroup import available_cpus, cgroup_cpu_quota
+
+
+class TestCgroup(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, text):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            fp.write(text)
+
+    def test_cgroup_v2(self):
+        self.write('cpu.max', '150000 100000\n')
+        self.assertEqual(cgroup_cpu_quota(self.root), 1.5)
+        self.write('cpu.max', 'max 100000\n')
+        self.assertIsNone(cgroup_cpu_quota(self.root))
+
+    def test_cgroup_v1(self):
+        self.write('cpu/cpu.cfs_quota_us', '200000\n')
+        self.write('cpu/cpu.cfs_period_us', '100000\n')
+        self.assertEqual(cgroup_cpu_quota(self.root), 2.0)
+        self.write('cpu/cpu.cfs_quota_us', '-1\n')
+        self.assertIsNone(cgroup_cpu_quota(self.root))
+
+    @patch('os.sched_getaffinity', return_value=set(range(32)), create=True)
+    def test_available_cpus(self, _):
+        self.assertEqual(available_cpus(self.root), 32)
+        self.write('cpu.max', '150000 100000\n')
+        self.assertEqual(available_cpus(self.root), 2)
+        self.write('cpu.max', '10000 100000\n')
+        self.assertEqual(available_cpus(self.root), 1)
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+
+from cost_calculator.app import INSTANCE_DATA_DIR
+from cost_calculator.comparison import (
+    PodShapes, SnapshotComparisons, compare_regions, compare_snapshot, list_targets, make_executor,
+    region_selector)
+from cost_calculator.testing import (
+    make_cluster_cost, make_request_pod, make_snapshots, make_test_app)
+
+
+class TestComparison(unittest.TestCase):
+    def setUp(self):
+        self.pods = [make_request_pod('p{}'.format(i), [0.25, 1.0, 2.0][i % 3], [0.5, 2.0][i % 2])
+                     for i in range(30)]
+        self.targets = [('aws', 'us-east-1'), ('aws', 'eu-west-1'), ('gce', 'us-east1-b')]
+
+    def test_pod_shapes(self):
+        shapes = PodShapes.from_pods(self.pods)
+        self.assertEqual(len(shapes.counts), 6)
+        self.assertEqual(shapes.pod_count, 30)
+
+    def test_compare_regions(self):
+        costs = compare_regions(self.pods, self.targets, INSTANCE_DATA_DIR)
+        self.assertEqual(sorted((c.cloud, c.region) for c in costs), sorted(self.targets))
+        self.assertEqual([c.cost for c in costs], sorted(c.cost for c in costs))
+        for cost in costs:
+            selector = region_selector(INSTANCE_DATA_DIR, cost.cloud, cost.region)
+            expected = sum(selector.get_cheapest_instance(pod.req_cpu, pod.req_memory, '')[1]
+                           for pod in self.pods)
+            self.assertAlmostEqual(cost.cost, expected)
+            self.assertEqual(cost.pod_count, 30)
+
+    def test_unpriced_pods_rank_last(self):
+        pods = self.pods + [make_request_pod('huge', 1000.0, 1.0)]
+        costs = compare_regions(pods, self.targets, INSTANCE_DATA_DIR)
+        self.assertTrue(all(c.unpriced_pods == 1 for c in costs))
+        self.assertEqual(costs[0].pod_count, 30)
+
+    def test_process_pool(self):
+        with make_executor(1) as executor:
+            pooled = compare_regions(self.pods, self.targets, INSTANCE_DATA_DIR, executor, batch_size=1)
+        self.assertEqual(pooled, compare_regions(self.pods, self.targets, INSTANCE_DATA_DIR))
+
+    def test_list_targets(self):
+        targets = list_targets(INSTANCE_DATA_DIR, ['aws', 'gce'], ['us-east-1', 'us-east1-b'])
+        self.assertEqual(targets, [('aws', 'us-east-1'), ('gce', 'us-east1-b')])
+        self.assertGreater(len(list_targets(INSTANCE_DATA_DIR)), 100)
+
+    def test_route(self):
+        client = make_test_app(make_snapshots(self, make_cluster_cost(self.pods))).test_client()
+        data = client.get('/api/v1/cost/regions?provider=aws&region=us-east-1&timeframe=week').get_json()
+        self.assertEqual(data['pod_count'], 30)
+        region, = data['regions']
+        self.assertEqual(region['region'], 'us-east-1')
+        hourly = compare_regions(self.pods, [('aws', 'us-east-1')], INSTANCE_DATA_DIR)[0].cost
+        self.assertAlmostEqual(region['cost'], hourly * 168)
+        self.assertEqual(client.get('/api/v1/cost/regions?provider=ibm').status_code, 400)
+        self.assertEqual(client.get('/api/v1/cost/regions?timeframe=day').status_code, 400)
+
+    def test_compare_snapshot_is_cached(self):
+        cluster_cost = make_cluster_cost(self.pods)
+        snapshots = make_snapshots(self, cluster_cost)
+        snapshot = snapshots.refresh()
+        targets = [('aws', 'us-east-1')]
+        with patch('cost_calculator.comparison.compare_regions', wraps=compare_regions) as compare:
+            costs = compare_snapshot(snapshot, targets, INSTANCE_DATA_DIR)
+            self.assertIs(compare_snapshot(snapshots.refresh(), targets, INSTANCE_DATA_DIR), costs)
+            self.assertEqual(compare.call_count, 1)
+            cluster_cost.get_nodeless_pods.return_value = self.pods[:10]
+            self.assertEqual(compare_snapshot(snapshots.refresh(), targets, INSTANCE_DATA_DIR)[0].pod_count, 10)
+            self.assertEqual(compare.call_count, 2)
+
+    def test_snapshot_comparisons(self):
+        comparisons = SnapshotComparisons(maxsize=2)
+        comparisons.get('a', ('x',))
+        for targets in (('x',), ('y',), ('z',)):
+            comparisons.put('a', targets, [targets])
+        self.assertIsNone(comparisons.get('a', ('x',)))
+        self.assertEqual(comparisons.get('a', ('z',)), [('z',)])
+        # another snapshot content drops them all
+        self.assertIsNone(comparisons.get('b', ('z',)))
+        comparisons.put('a', ('z',), [('z',)])
+        self.assertIsNone(comparisons.get('b', ('z',)))
+
+
+if __name__ == '__main__':
+    unittest.main()
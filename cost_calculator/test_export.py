@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import unittest
+
+from cost_calculator.export import EXPORT_FIELDS, iter_csv, iter_ndjson
+from cost_calculator.testing import make_cluster_cost, make_pod, make_snapshots, make_test_app
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.pods = [make_pod('a' if i % 2 else 'b', 'p{}'.format(i), 0.01 * i) for i in range(7)]
+
+    def test_iter_csv(self):
+        chunks = list(iter_csv(iter(self.pods), 10, batch_size=3))
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[3]['name'], 'p3')
+        self.assertAlmostEqual(float(rows[3]['on_demand_cost']), 0.3)
+        self.assertAlmostEqual(float(rows[3]['spot_cost']), 0.15)
+
+    def test_iter_ndjson(self):
+        chunks = list(iter_ndjson(iter(self.pods), 1, batch_size=3))
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['p{}'.format(i) for i in range(7)])
+        self.assertEqual(sorted(rows[0]), sorted(EXPORT_FIELDS))
+
+    def test_export_routes(self):
+        client = make_test_app(make_snapshots(self, make_cluster_cost(self.pods))).test_client()
+
+        response = client.get('/export.csv?namespace=a&timeframe=week')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['name'] for row in rows], ['p1', 'p3', 'p5'])
+        self.assertAlmostEqual(float(rows[0]['on_demand_cost']), 0.01 * 168)
+
+        response = client.get('/export.ndjson')
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 7)
+        self.assertEqual(client.get('/export.csv?timeframe=day').status_code, 400)
+        self.assertEqual(client.get('/export.xml').status_code, 404)
+
+    def test_forecast_page_size(self):
+        sizes = []
+        for count in (10, 1000):
+            cluster_cost = make_cluster_cost([
+                make_pod('a', 'pod-{}'.format(i), 0.01) for i in range(count)])
+            app = make_test_app(make_snapshots(self, cluster_cost))
+            response = app.test_client().get('/nodeless_forcast')
+            self.assertNotIn(b'pod-0', response.data)
+            sizes.append(len(response.data))
+        # only the pod count differs
+        self.assertLessEqual(abs(sizes[1] - sizes[0]), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
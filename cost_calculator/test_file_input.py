@@ -0,0 +1,96 @@
+import io
+import json
+import unittest
+
+from cost_calculator.app import ClusterCost, Pod
+from cost_calculator.file_input import convert, quantities
+from cost_calculator.quantity import parse_memory
+
+JQ_PODS = '''{
+  "name": "web-0",
+  "namespace": "default",
+  "containers": {
+    "limits": {
+      "memory": "1536Mi"
+    },
+    "requests": {
+      "cpu": "100m",
+      "memory": "768Mi"
+    }
+  },
+  "initContainers": null
+}
+{
+  "name": "idle",
+  "namespace": "default",
+  "containers": {},
+  "initContainers": null
+}
+'''
+
+JQ_NODES = '''{
+  "name": "node-1",
+  "labels": {
+    "kubernetes.io/instance-type": "m5.large"
+  }
+}
+'''
+
+KUBECTL_PODS = {
+    'apiVersion': 'v1',
+    'kind': 'List',
+    'items': [{
+        'kind': 'Pod',
+        'metadata': {
+            'namespace': 'data', 'name': 'db-0', 'labels': {'app': 'db'},
+            'ownerReferences': [{'kind': 'StatefulSet', 'name': 'db', 'controller': True}],
+        },
+        'spec': {
+            'containers': [
+                {'resources': {'requests': {'cpu': '1500m', 'memory': '1500Mi'},
+                               'limits': {'memory': '3Gi'}}},
+                {'resources': {'requests': {'cpu': '250m'}}},
+            ],
+        },
+    }, {
+        'kind': 'Node',
+        'metadata': {'name': 'kip', 'labels': {'type': 'virtual-kubelet'}},
+    }],
+    'metadata': {'resourceVersion': ''},
+}
+
+
+class TestConvert(unittest.TestCase):
+    def test_jq_dumps(self):
+        out = io.StringIO()
+        self.assertEqual(convert([io.StringIO(JQ_PODS), io.StringIO(JQ_NODES)], out), (2, 1))
+        data = json.loads(out.getvalue())
+        self.assertEqual([pod['name'] for pod in data['pods']], ['web-0', 'idle'])
+        self.assertEqual(data['pods'][0]['containers']['requests']['cpu'], '100m')
+        self.assertEqual(data['nodes'], [json.loads(JQ_NODES)])
+
+    def test_kubectl_dump(self):
+        out = io.StringIO()
+        self.assertEqual(convert([io.StringIO(json.dumps(KUBECTL_PODS, indent=4))], out), (1, 0))
+        data = json.loads(out.getvalue())
+        cluster_cost = ClusterCost(None, None, from_file=True, file_data=data)
+        pod, = cluster_cost.get_pods('')
+        expected = Pod.from_raw(KUBECTL_PODS['items'][0])
+        self.assertEqual(pod, expected)
+        self.assertEqual(pod.owner, 'StatefulSet/db')
+        self.assertEqual(pod.req_cpu, 1.75)
+
+    def test_small_memory(self):
+        memory = parse_memory('64Ki')
+        resources = quantities(0.0, memory)
+        self.assertEqual(resources, {'memory': '65536'})
+        self.assertEqual(parse_memory(resources['memory']), memory)
+
+    def test_empty(self):
+        out = io.StringIO()
+        self.assertEqual(convert([io.StringIO('')], out), (0, 0))
+        self.assertEqual(json.loads(out.getvalue()), {'pods': [], 'nodes': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from cost_calculator.app import make_history_sampler
+from cost_calculator.history import DAY, HOUR, TIERS_BY_NAME, CostHistory, HistorySampler
+from cost_calculator.testing import make_cluster_cost, make_pod, make_snapshots, make_test_app
+
+# a Monday, midnight UTC
+T0 = 1700438400
+
+
+class TestCostHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.history = CostHistory(os.path.join(self.tmpdir, 'history.sqlite3'), raw_step=600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_downsampling(self):
+        for i in range(12):
+            # two samples of the same interval, as from two workers
+            for _ in range(2):
+                self.history.record(T0 + i * 600, [('', 10.0, float(i), i / 2), ('ns', None, 1.0, 0.5)])
+        tier, raw = self.history.query('', T0, T0 + DAY, TIERS_BY_NAME['raw'])
+        self.assertEqual(len(raw['ts']), 12)
+        self.assertEqual(raw['on_demand_cost'][3], 3.0)
+        _, hourly = self.history.query('', T0, T0 + DAY, TIERS_BY_NAME['hour'])
+        self.assertEqual(hourly['ts'], [T0, T0 + HOUR])
+        self.assertEqual(hourly['node_cost'], [10.0, 10.0])
+        self.assertAlmostEqual(hourly['on_demand_cost'][0], 2.5)
+        self.assertAlmostEqual(hourly['on_demand_cost'][1], 8.5)
+        _, daily = self.history.query('ns', T0, T0 + DAY, TIERS_BY_NAME['day'])
+        self.assertEqual(daily, {'ts': [T0], 'node_cost': [None],
+                                 'on_demand_cost': [1.0], 'spot_cost': [0.5]})
+
+    def test_retention(self):
+        self.history.record(T0, [('', 1.0, 1.0, 1.0)])
+        self.history.record(T0 + 3 * DAY, [('', 2.0, 2.0, 2.0)])
+        _, raw = self.history.query('', 0, T0 + 3 * DAY, TIERS_BY_NAME['raw'])
+        self.assertEqual(raw['ts'], [T0 + 3 * DAY])
+        _, hourly = self.history.query('', 0, T0 + 3 * DAY, TIERS_BY_NAME['hour'])
+        self.assertEqual(len(hourly['ts']), 2)
+
+    def test_pick_tier(self):
+        now = T0 + 400 * DAY
+        self.assertEqual(self.history.pick_tier(now - DAY, now, now).name, 'raw')
+        self.assertEqual(self.history.pick_tier(now - 7 * DAY, now, now).name, 'hour')
+        self.assertEqual(self.history.pick_tier(now - 60 * DAY, now, now).name, 'day')
+        self.assertEqual(self.history.pick_tier(now - 365 * DAY, now, now).name, 'day')
+
+    def test_sampler_and_route(self):
+        snapshots = make_snapshots(self, make_cluster_cost([
+            make_pod('a', 'p1', 0.5), make_pod('b', 'p2', 0.25)]))
+        sampler = HistorySampler(self.history, snapshots, interval=600)
+        self.assertEqual(sampler.sample(T0 + 650), T0 + 600)
+
+        app = make_test_app()
+        app.extensions['cost_calculator']['history'].set(sampler)
+        client = app.test_client()
+        data = client.get('/api/v1/cost/history?resolution=raw&start={}&end={}'.format(T0, T0 + DAY)).get_json()
+        self.assertEqual(data['resolution'], 'raw')
+        self.assertEqual(data['step'], 600)
+        self.assertEqual(data['ts'], [T0 + 600])
+        self.assertEqual(data['on_demand_cost'], [0.75])
+        data = client.get('/api/v1/cost/history?namespace=b&resolution=day&start=0').get_json()
+        self.assertEqual(data['spot_cost'], [0.125])
+        self.assertEqual(client.get('/api/v1/cost/history?resolution=minute').status_code, 400)
+        self.assertEqual(client.get('/api/v1/cost/history?start=x').status_code, 400)
+
+        app.extensions['cost_calculator']['history'].set(None)
+        self.assertEqual(client.get('/api/v1/cost/history').status_code, 404)
+
+    def test_disabled_without_history_db(self):
+        with patch.dict(os.environ, {'HISTORY_DB': ''}):
+            self.assertIsNone(make_history_sampler(Mock()))
+        path = os.path.join(self.tmpdir, 'volume.sqlite3')
+        with patch.dict(os.environ, {'HISTORY_DB': path}):
+            self.assertEqual(make_history_sampler(Mock()).history.path, path)
+        with patch.dict(os.environ, {'HISTORY_DB': path, 'HISTORY_INTERVAL': '0.5'}):
+            with self.assertRaises(ValueError):
+                make_history_sampler(Mock())
+
+
+if __name__ == '__main__':
+    unittest.main()
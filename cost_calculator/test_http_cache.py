@@ -0,0 +1,113 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from unittest.mock import patch
+
+from cost_calculator.app import make_snapshot_scheduler
+from cost_calculator.snapshot import ChangeTimes
+from cost_calculator.testing import make_cluster_cost, make_pod, make_snapshots, make_test_app
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.cluster_cost = make_cluster_cost([
+            make_pod('default', 'p{}'.format(i), 0.1) for i in range(50)])
+        self.snapshots = make_snapshots(self, self.cluster_cost)
+        self.client = make_test_app(self.snapshots).test_client()
+
+    def test_not_modified(self):
+        response = self.client.get('/api/v1/cost/pods')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get('/api/v1/cost/pods', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get('/api/v1/cost/pods', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        # a rebuild with the same content keeps the validators
+        self.snapshots.refresh()
+        response = self.client.get('/api/cost/pods/all', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.cluster_cost.get_nodeless_pods.side_effect = lambda namespace: [make_pod('default', 'p0', 0.2)]
+        self.snapshots.refresh()
+        response = self.client.get('/api/v1/cost/pods', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_pending_flashes_are_rendered(self):
+        etag = self.client.get('/').headers['ETag']
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Error: Timeframe given is not valid.')]
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Timeframe given is not valid', response.get_data(as_text=True))
+        self.assertNotIn('ETag', response.headers)
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_workers_share_change_times(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        with patch.dict(os.environ, {'SNAPSHOT_STATE_DIR': state_dir}):
+            first = make_snapshot_scheduler(self.cluster_cost).refresh()
+            second = make_snapshot_scheduler(self.cluster_cost).refresh()
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertEqual(second.changed_at, first.changed_at)
+        self.assertLess(first.changed_at, second.created_at)
+        # pods listed in another order have the same content
+        self.cluster_cost.get_nodeless_pods.side_effect = lambda namespace: [
+            make_pod('default', 'p{}'.format(i), 0.1) for i in reversed(range(50))]
+        with patch.dict(os.environ, {'SNAPSHOT_STATE_DIR': state_dir}):
+            third = make_snapshot_scheduler(self.cluster_cost).refresh()
+        self.assertEqual((third.fingerprint, third.changed_at),
+                         (first.fingerprint, first.changed_at))
+
+    def test_change_times_never_decrease(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        change_times = ChangeTimes(state_dir)
+        self.assertEqual(change_times.changed('a', 1000.0), 1000.0)
+        self.assertEqual(change_times.changed('a', 1010.0), 1000.0)
+        self.assertEqual(change_times.changed('b', 1020.0), 1020.0)
+        # back to earlier content is a change
+        self.assertEqual(change_times.changed('a', 1030.0), 1030.0)
+        # a worker whose clock is behind
+        self.assertEqual(change_times.changed('c', 1025.0), 1030.0)
+        self.assertEqual(ChangeTimes(state_dir).changed('c', 1040.0), 1030.0)
+
+    def test_last_modified_after_reverting(self):
+        snapshots = make_snapshots(self, self.cluster_cost)
+        pods = self.cluster_cost.get_nodeless_pods.side_effect
+        before = snapshots.refresh()
+        self.cluster_cost.get_nodeless_pods.side_effect = lambda namespace: [make_pod('default', 'p0', 0.2)]
+        changed = snapshots.refresh()
+        self.cluster_cost.get_nodeless_pods.side_effect = pods
+        reverted = snapshots.refresh()
+        self.assertEqual(reverted.fingerprint, before.fingerprint)
+        self.assertGreaterEqual(reverted.changed_at, changed.changed_at)
+        self.assertGreater(changed.changed_at, before.changed_at)
+
+    def test_compression(self):
+        plain = self.client.get('/api/v1/cost/pods')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        response = self.client.get('/api/v1/cost/pods', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        response = self.client.get('/api/v1/cost/pods', headers={'Accept-Encoding': 'deflate'})
+        self.assertEqual(zlib.decompress(response.data), plain.data)
+        # below the size threshold
+        response = self.client.get('/healthz', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
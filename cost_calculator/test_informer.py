@@ -0,0 +1,84 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+
+from cost_calculator.informer import Informer, iter_raw_pages
+
+
+def make_pod(name, resource_version, namespace='default'):
+    return {'metadata': {'name': name, 'namespace': namespace, 'resourceVersion': resource_version}}
+
+
+def make_list(resource_version, *pods, _continue=None):
+    page = {'items': list(pods), 'metadata': {'resourceVersion': resource_version}}
+    if _continue:
+        page['metadata']['continue'] = _continue
+    return SimpleNamespace(data=json.dumps(page).encode('utf-8'))
+
+
+def event(event_type, pod):
+    return {'type': event_type, 'object': pod, 'raw_object': {}}
+
+
+class TestInformer(unittest.TestCase):
+    def make_informer(self, list_func):
+        return Informer(list_func, lambda pod: pod['metadata']['name'], name='pods')
+
+    def test_list_then_watch(self):
+        list_func = Mock(return_value=make_list('10', make_pod('a', '1'), make_pod('b', '2')))
+        informer = self.make_informer(list_func)
+        informer.relist()
+        self.assertTrue(informer.has_synced())
+        self.assertEqual(sorted(informer.items()), ['a', 'b'])
+
+        events = [
+            event('ADDED', make_pod('c', '11')),
+            event('DELETED', make_pod('a', '12')),
+            event('MODIFIED', make_pod('b', '13')),
+        ]
+        with patch('cost_calculator.informer.RawWatch') as mock_watch:
+            mock_watch.return_value.stream.return_value = iter(events)
+            informer.watch_once()
+            _, kwargs = mock_watch.return_value.stream.call_args
+            self.assertEqual(kwargs['resource_version'], '10')
+        self.assertEqual(sorted(informer.items()), ['b', 'c'])
+        self.assertEqual(informer.resource_version, '13')
+
+    def test_iter_raw_pages(self):
+        list_func = Mock(side_effect=[
+            make_list('10', make_pod('a', '1'), _continue='token'),
+            make_list('10', make_pod('b', '2')),
+        ])
+        pages = list(iter_raw_pages(list_func, page_size=1, namespace='default'))
+        self.assertEqual([pod['metadata']['name'] for page in pages for pod in page['items']], ['a', 'b'])
+        first, second = list_func.call_args_list
+        self.assertEqual(first[1], {'limit': 1, '_preload_content': False, 'namespace': 'default'})
+        self.assertEqual(second[1]['_continue'], 'token')
+
+    def test_gone_event_forces_relist(self):
+        informer = self.make_informer(Mock(return_value=make_list('10')))
+        informer.relist()
+        gone = {'type': 'ERROR', 'object': None, 'raw_object': {'code': 410, 'message': 'too old'}}
+        self.assertFalse(informer.handle_event(gone))
+        self.assertIsNone(informer.resource_version)
+
+    def test_gone_exception_forces_relist(self):
+        list_func = Mock(side_effect=[make_list('10'), make_list('20', make_pod('a', '15'))])
+        informer = self.make_informer(list_func)
+        with patch('cost_calculator.informer.RawWatch') as mock_watch:
+            def stream(*args, **kwargs):
+                if kwargs['resource_version'] == '10':
+                    raise ApiException(status=410)
+                informer._stop.set()
+                return iter([])
+            mock_watch.return_value.stream.side_effect = stream
+            informer._run()
+        self.assertEqual(informer.relists, 2)
+        self.assertEqual(informer.items(), ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import fnmatch
+import json
 import os
 import unittest
 from unittest.mock import Mock, patch
@@ -5,18 +7,28 @@ from unittest.mock import Mock, patch
 from instance_selector import (
     make_instance_selector,
     cheapest_custom_instance,
-    PriceGetter
+    CustomInstanceSolver,
+    PriceGetter,
+    PriceIndex,
+    SpotPriceTable,
+    decode_price_entry,
+    SelectionCache,
 )
+from kubernetes.client import ApiClient
 from kubernetes.client.models import V1Node, V1NodeList, V1ObjectMeta, V1Pod, V1PodSpec, V1Container, \
     V1ResourceRequirements
 
-os.environ['IS_TEST_SUITE'] = 'yes'
-from cost_calculator.app import ClusterCost, KIP_NODE_LABEL_KEY, KIP_NODE_LABEL_VALUE, k8s_pod_resource_requirements
+from cost_calculator.app import ClusterCost, KIP_NODE_LABEL_KEY, KIP_NODE_LABEL_VALUE, \
+    k8s_pod_resource_requirements, raw_pod_resource_requirements
 
 scriptdir = os.path.dirname(os.path.realpath(__file__))
 datadir = os.path.join(scriptdir, 'instance-data')
 
 
+def mget_prices(keys):
+    return [b'{"onDemandPrice": 0.0252, "spotPrices": null}' for _ in keys]
+
+
 class TestUtils(unittest.TestCase):
     def test_pod_resources(self):
         cases = [
@@ -86,6 +98,9 @@ class TestUtils(unittest.TestCase):
         for case in cases:
             got = k8s_pod_resource_requirements(case['pod'])
             self.assertEqual(got, case['expected'])
+            pod_json = ApiClient().sanitize_for_serialization(case['pod'])
+            got = raw_pod_resource_requirements(pod_json)
+            self.assertEqual(got, case['expected'])
 
 
 class TestInstanceSelector(unittest.TestCase):
@@ -95,8 +110,8 @@ class TestInstanceSelector(unittest.TestCase):
         self.assertEqual(inst_type, expected, msg)
 
     def run_instance_test(self, cloud, region, cases):
-        with patch('cost_calculator.instance_selector.redis.Redis.get') as mocked_get:
-            mocked_get.return_value = b'{"onDemandPrice": 0.0252, "spotPrices": null}'
+        with patch('cost_calculator.instance_selector.redis.Redis.mget') as mocked_mget:
+            mocked_mget.side_effect = mget_prices
             self.instance_selector = make_instance_selector(datadir, cloud, region)
             for case in cases:
                 self.assert_matches(*case)
@@ -127,6 +142,20 @@ class TestInstanceSelector(unittest.TestCase):
             self.assertEqual(inst['cpu'], cpu)
             self.assertEqual(inst['memory'], gb_memory)
 
+    def test_spec_for_inst_type_index(self):
+        for cloud, region in [('aws', 'us-east-1'), ('azure', 'East US'), ('gce', 'us-west1-a')]:
+            instance_selector = make_instance_selector(datadir, cloud, region)
+            for inst in instance_selector.inst_data:
+                expected = next(i for i in instance_selector.inst_data
+                                if i['instanceType'] == inst['instanceType'])
+                self.assertIs(instance_selector.spec_for_inst_type(inst['instanceType']), expected)
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertIsNone(instance_selector.spec_for_inst_type('unknown-type'))
+            self.assertIsNone(instance_selector.spec_for_inst_type('unknown-type'))
+            self.assertIsNone(instance_selector.spec_for_inst_type('zz-custom-2-2048'))
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(instance_selector.unknown_instance_types, {'unknown-type', 'zz-custom-2-2048'})
+
     def test_gce(self):
         cases = [
             (0, 3.75, '1', 'n1-standard-1'),
@@ -156,6 +185,48 @@ class TestInstanceSelector(unittest.TestCase):
         ]
         self.run_instance_test('azure', 'East US', cases)
 
+    def test_get_cheapest_instance_does_not_modify_catalog(self):
+        with patch('cost_calculator.instance_selector.redis.Redis.mget') as mocked_mget:
+            mocked_mget.side_effect = mget_prices
+            instance_selector = make_instance_selector(datadir, 'gce', 'us-west1-a')
+            num_instances = len(instance_selector.inst_data)
+            for _ in range(3):
+                instance_selector.get_cheapest_instance(34, 16, '')
+            self.assertEqual(len(instance_selector.inst_data), num_instances)
+
+    def test_price_index_matches_catalog_scan(self):
+        def scan(selector, cpu, memory, gpu_spec):
+            gpu_count, gpu_type = selector.parse_gpu_spec(gpu_spec)
+            cheapest, lowest_price = None, 100000000.0
+            for inst in selector.inst_data:
+                if inst['memory'] < memory or inst['cpu'] < cpu:
+                    continue
+                if not selector.gpu_matches(gpu_count, gpu_type, inst):
+                    continue
+                price, is_t_unlimited = selector.price_for_cpu_spec(cpu, inst)
+                if 0.0 < price < lowest_price:
+                    lowest_price = price
+                    cheapest = (inst['instanceType'], is_t_unlimited)
+            return cheapest, lowest_price
+
+        requests = [(cpu, memory) for cpu in (0, 0.1, 0.25, 0.5, 1, 1.5, 2, 3, 7, 33, 96)
+                    for memory in (0, 0.2, 0.5, 1, 1.7, 4, 15, 64, 300)]
+        for cloud, region in [('aws', 'us-east-1'), ('azure', 'East US'), ('gce', 'us-west1-a')]:
+            selector = make_instance_selector(datadir, cloud, region)
+            index = PriceIndex(cloud, selector.inst_data)
+            for gpu_spec in ('', '1', '1 nvidia-tesla-t4'):
+                gpu_count, gpu_type = selector.parse_gpu_spec(gpu_spec)
+                for cpu, memory in requests:
+                    expected, expected_price = scan(selector, cpu, memory, gpu_spec)
+                    best = index.cheapest(cpu, memory, gpu_count, gpu_type)
+                    got, got_price = None, 100000000.0
+                    if best is not None:
+                        got = (best[2]['instanceType'], best[3])
+                        got_price = best[0]
+                    msg = f'{cloud}: {cpu}, {memory}, {gpu_spec}'
+                    self.assertEqual(got, expected, msg)
+                    self.assertEqual(got_price, expected_price, msg)
+
     def test_cheapest_custom_instance(self):
         custom_instance_data = {
             'baseMemoryUnit': 0.25,
@@ -186,6 +257,72 @@ class TestInstanceSelector(unittest.TestCase):
             if cpu is not None:
                 self.assertEqual(price, expected_price)
 
+    def test_get_cheapest_instances_matches_single_lookups(self):
+        shapes = [(cpu, memory, gpu) for cpu in (0, 0.25, 1, 1.5, 3, 34, 100)
+                  for memory in (0, 0.5, 1, 3.75, 16, 180) for gpu in ('', '1')]
+        for cloud, region in [('aws', 'us-east-1'), ('azure', 'East US'), ('gce', 'us-west1-a')]:
+            with patch('cost_calculator.instance_selector.redis.Redis.mget') as mocked_mget:
+                mocked_mget.side_effect = mget_prices
+                batch_selector = make_instance_selector(datadir, cloud, region)
+                types, prices, spot_prices = batch_selector.get_cheapest_instances(*zip(*shapes))
+                selector = make_instance_selector(datadir, cloud, region)
+                for i, shape in enumerate(shapes):
+                    expected = selector.get_cheapest_instance(*shape)
+                    self.assertEqual((types[i], prices[i], spot_prices[i]), expected, f'{cloud}: {shape}')
+            self.assertEqual(len(batch_selector.get_cheapest_instances([], [], [])[0]), 0)
+
+    def test_custom_instance_solver_matches_scalar_solver(self):
+        with open(os.path.join(datadir, 'gce_custom_instance_data.json')) as fp:
+            custom_data_by_region = json.load(fp)
+        cpu_requests = [0, 0.1, 0.5, 1, 1.5, 2, 3, 7, 33, 64, 81]
+        memory_requests = [0, 0.3, 0.5, 1, 3.75, 16, 17.1, 180, 700]
+        shapes = [(cpu, memory) for cpu in cpu_requests for memory in memory_requests]
+        for region, custom_data in custom_data_by_region.items():
+            solver = CustomInstanceSolver(custom_data)
+            found, index, memory, price = solver.solve(*zip(*shapes))
+            for i, (cpu_req, memory_req) in enumerate(shapes):
+                for family, cid in enumerate(solver.families):
+                    expected = cheapest_custom_instance(cid, cpu_req, memory_req)
+                    if expected[0] is None:
+                        self.assertFalse(found[i, family])
+                        continue
+                    self.assertTrue(found[i, family])
+                    self.assertEqual(solver.cpu_values[family][index[i, family]], expected[0])
+                    self.assertEqual(memory[i, family], expected[1])
+                    self.assertEqual(price[i, family], expected[2])
+
+
+class TestSelectionCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = SelectionCache(maxsize=2)
+        cache.get('a', 1)
+        cache.put('a', 'A', 1)
+        cache.put('b', 'B', 1)
+        self.assertEqual(cache.get('a', 1), 'A')
+        cache.put('c', 'C', 1)
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.get('c', 1), 'C')
+        self.assertEqual(cache.stats(), {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 2, 'evictions': 1})
+
+    def test_generation_change_invalidates(self):
+        cache = SelectionCache(maxsize=2)
+        cache.get('a', 1)
+        cache.put('a', 'A', 1)
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(len(cache), 0)
+
+    def test_selector_caches_request_shapes(self):
+        with patch('cost_calculator.instance_selector.redis.Redis.mget') as mocked_mget:
+            mocked_mget.side_effect = mget_prices
+            instance_selector = make_instance_selector(datadir, 'aws', 'us-east-1')
+            for _ in range(10):
+                instance_selector.get_cheapest_instance(1, 2.0, '')
+            self.assertEqual(mocked_mget.call_count, 1)
+            self.assertEqual(instance_selector.selection_cache.hits, 9)
+            instance_selector.set_catalog(instance_selector.inst_data, instance_selector.custom_data)
+            instance_selector.get_cheapest_instance(1, 2.0, '')
+            self.assertEqual(mocked_mget.call_count, 2)
+
 
 class TestClusterCost(unittest.TestCase):
     def test_get_nodes(self):
@@ -232,6 +369,16 @@ class TestClusterCost(unittest.TestCase):
             self.assertNotEqual(node.name, 'kip-node')
             self.assertIn(node.name, physical_nodes)
 
+    def test_nodegroup_of_provider(self):
+        labels = {'alpha.eksctl.io/nodegroup-name': 'eksctl-ng',
+                  'eks.amazonaws.com/nodegroup': 'eks-ng'}
+        file_data = {'nodes': [{'name': 'node-1', 'labels': labels}]}
+        for cloud_provider, nodegroup in (('aws', 'eks-ng'), ('gce', 'eksctl-ng')):
+            cluster_cost = ClusterCost(None, Mock(), from_file=True, file_data=file_data,
+                                       cloud_provider=cloud_provider)
+            node, = cluster_cost.get_nodes()
+            self.assertEqual(node.nodegroup, nodegroup)
+
 
 class RedisMock:
     def __init__(self, store):
@@ -240,6 +387,13 @@ class RedisMock:
     def get(self, key):
         return self.store.get(key)
 
+    def scan_iter(self, match, count=None):
+        return [key.encode('utf-8') for key in self.store if fnmatch.fnmatchcase(key, match)]
+
+    def mget(self, keys):
+        self.mget_calls = getattr(self, 'mget_calls', 0) + 1
+        return [self.store.get(key) for key in keys]
+
 
 class TestPriceGetter(unittest.TestCase):
     def test_get_spot_price(self):
@@ -275,6 +429,74 @@ class TestPriceGetter(unittest.TestCase):
             spot_price = price_getter.get_spot_price(instance_type=case['instanceType'], region=case['region'])
             self.assertEqual(spot_price, case['expected_price'])
 
+    def test_decode_price_entry(self):
+        cases = [
+            (b'{"onDemandPrice": 0.0252, "spotPrice": null}', {'onDemandPrice': 0.0252, 'spotPrice': None}),
+            (b'{"onDemandPrice": 0.1, "spotPrice": {"nullzone-1": 0.05}}',
+             {'onDemandPrice': 0.1, 'spotPrice': {'nullzone-1': 0.05}}),
+            (b"{'onDemandPrice': 0.1}", {'onDemandPrice': 0.1}),
+        ]
+        for data, expected in cases:
+            self.assertEqual(decode_price_entry(data), expected)
+        for data in (b'not a price', b'[1, 2]'):
+            with self.assertRaises(ValueError):
+                decode_price_entry(data)
+
+    def test_unchanged_entries_are_not_decoded_again(self):
+        key = '/banzaicloud.com/cloudinfo/providers/amazon/regions/us-east-1/prices/t3.micro'
+        store = {key: b'{"onDemandPrice": 0.0104, "spotPrice": {"us-east-1a": 0.0031}}'}
+        price_getter = PriceGetter(provider='aws', redis_client=RedisMock(store=store))
+        with patch(PriceGetter.__module__ + '.decode_price_entry',
+                   wraps=decode_price_entry) as decode:
+            price_getter.get_spot_prices(['t3.micro'], 'us-east-1')
+            price_getter.get_spot_prices(['t3.micro'], 'us-east-1')
+            self.assertEqual(decode.call_count, 1)
+            store[key] = b'{"onDemandPrice": 0.0104, "spotPrice": {"us-east-1a": 0.0029}}'
+            self.assertEqual(price_getter.get_spot_prices(['t3.micro'], 'us-east-1'), {'t3.micro': 0.0029})
+            self.assertEqual(decode.call_count, 2)
+
+    def test_get_spot_prices(self):
+        key = '/banzaicloud.com/cloudinfo/providers/amazon/regions/us-east-1/prices/{}'
+        redis_client = RedisMock(store={
+            key.format('t3.micro'): b'{"onDemandPrice": 0.0104, "spotPrice": {"us-east-1a": 0.0031}}',
+            key.format('m5.large'): b'{"onDemandPrice": 0.096, "spotPrice": {}}',
+        })
+        price_getter = PriceGetter(provider='aws', redis_client=redis_client)
+        spot_prices = price_getter.get_spot_prices(
+            ['t3.micro', 'm5.large', 't3.micro', 'missing.large'], 'us-east-1')
+        self.assertEqual(spot_prices, {'t3.micro': 0.0031, 'm5.large': 0.096})
+        self.assertEqual(redis_client.mget_calls, 1)
+
+
+class TestSpotPriceTable(unittest.TestCase):
+    key = '/banzaicloud.com/cloudinfo/providers/amazon/regions/{}/prices/{}'
+
+    def test_refresh_loads_region(self):
+        store = {
+            self.key.format('us-east-1', 't3.micro'): b'{"onDemandPrice": 0.0104, "spotPrice": {"us-east-1a": 0.0031}}',
+            self.key.format('us-east-1', 'm5.large'): b'{"onDemandPrice": 0.096, "spotPrice": null}',
+            self.key.format('us-west-2', 't3.micro'): b'{"onDemandPrice": 0.0104, "spotPrice": {"us-west-2a": 0.002}}',
+        }
+        table = SpotPriceTable(PriceGetter(provider='aws', redis_client=RedisMock(store=store)), 'us-east-1')
+        self.assertEqual(table.get_spot_prices(['t3.micro'], 'us-east-1'), {})
+        self.assertTrue(table.refresh())
+        self.assertEqual(table.stats()['entries'], 2)
+        self.assertEqual(table.version, 1)
+        self.assertEqual(table.get_spot_prices(['t3.micro', 'm5.large', 'c5.large'], 'us-east-1'),
+                         {'t3.micro': 0.0031, 'm5.large': 0.096})
+        table.refresh()
+        self.assertEqual(table.version, 1)
+
+    def test_failed_refresh_keeps_last_prices(self):
+        store = {self.key.format('us-east-1', 't3.micro'): b'{"onDemandPrice": 0.0104, "spotPrice": {"a": 0.0031}}'}
+        redis_client = RedisMock(store=store)
+        table = SpotPriceTable(PriceGetter(provider='aws', redis_client=redis_client), 'us-east-1')
+        table.refresh()
+        redis_client.mget = Mock(side_effect=ConnectionError('redis is down'))
+        self.assertFalse(table.refresh())
+        self.assertEqual(table.last_error, 'redis is down')
+        self.assertEqual(table.get_spot_price('t3.micro', 'us-east-1'), 0.0031)
+
 
 if __name__ == '__main__':
     unittest.main()
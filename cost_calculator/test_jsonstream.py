@@ -0,0 +1,47 @@
+import io
+import json
+import unittest
+
+from cost_calculator.jsonstream import iter_items, iter_objects, iter_values
+
+
+class TestJSONStream(unittest.TestCase):
+    def test_iter_items(self):
+        doc = {
+            'apiVersion': 'v1',
+            'items': [{'kind': 'Pod', 'n': i, 'x': 1.25 * i, 's': 'a\\"]}' * i} for i in range(50)],
+            'kind': 'List',
+            'metadata': {'items': [1, 2]},
+        }
+        text = json.dumps(doc, indent=4)
+        for chunk_size in (1, 7, 64, 1 << 20):
+            items = list(iter_items(io.StringIO(text), ('items',), chunk_size))
+            self.assertEqual(items, [('items', item) for item in doc['items']], chunk_size)
+
+    def test_several_keys_and_arrays(self):
+        text = '{"nodes": [], "skip": [1, {"a": 2}], "pods": [10, 20] , "more": 123456789}'
+        self.assertEqual(list(iter_items(io.StringIO(text), ('pods', 'nodes'), 3)),
+                         [('pods', 10), ('pods', 20)])
+        self.assertEqual(list(iter_items(io.StringIO('[1, 2, 3]'), ('pods',), 1)),
+                         [(None, 1), (None, 2), (None, 3)])
+
+    def test_iter_values(self):
+        text = '{\n  "a": 1\n}\n{\n  "a": 22\n}\n333 "x"\n'
+        for chunk_size in (1, 5, 1024):
+            self.assertEqual(list(iter_values(io.StringIO(text), chunk_size)),
+                             [{'a': 1}, {'a': 22}, 333, 'x'])
+
+    def test_iter_objects(self):
+        text = '{"name": "a", "items": 1}\n{"kind": "List", "items": [{"n": 1}, {"n": 2}]}\n[{"n": 3}]'
+        for chunk_size in (2, 1024):
+            self.assertEqual(list(iter_objects(io.StringIO(text), chunk_size=chunk_size)),
+                             [{'name': 'a', 'items': 1}, {'n': 1}, {'n': 2}, {'n': 3}])
+
+    def test_errors(self):
+        for text in ('{"pods": [1 2]}', '{"pods" [1]}', '{pods: []}', '{"pods": [1, {"a": ]}'):
+            with self.assertRaises(ValueError, msg=text):
+                list(iter_items(io.StringIO(text), ('pods',), 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
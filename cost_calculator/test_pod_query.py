@@ -0,0 +1,106 @@
+import unittest
+
+from werkzeug.datastructures import MultiDict
+
+from cost_calculator.app import Pod, pod_owner
+from cost_calculator.pod_query import PodQuery, encode_cursor
+from cost_calculator.snapshot import build_snapshot
+from cost_calculator.testing import make_cluster_cost, make_pod
+
+TIMEFRAMES = {'week': 168}
+
+
+class TestPodQuery(unittest.TestCase):
+    def setUp(self):
+        pods = [
+            make_pod('a', 'p1', 0.1, labels={'app': 'web'}, owner='Deployment/web'),
+            make_pod('a', 'p2', 0.2, labels={'app': 'web'}, owner='Deployment/web'),
+            make_pod('b', 'p3', 0.2, instance_type='c5.large', labels={'app': 'db'}),
+            make_pod('b', 'p4', 0.4, instance_type='c5.large'),
+            make_pod('c', 'p5', 0.05),
+        ]
+        self.snapshot = build_snapshot(make_cluster_cost(pods), 7, TIMEFRAMES)
+
+    def query(self, **args):
+        return PodQuery.from_args(MultiDict(args), TIMEFRAMES).run(self.snapshot, TIMEFRAMES)
+
+    def names(self, result):
+        return [item['name'] for item in result['items']]
+
+    def all_pages(self, **args):
+        names = []
+        result = self.query(**args)
+        while True:
+            names += self.names(result)
+            if result['next_cursor'] is None:
+                return names
+            result = self.query(cursor=result['next_cursor'], **args)
+
+    def test_sort_and_paginate(self):
+        result = self.query(limit='2')
+        self.assertEqual(result['snapshot_version'], 7)
+        self.assertEqual(result['total'], 5)
+        # cost ties are broken by namespace and name
+        self.assertEqual(self.names(result), ['p4', 'p3'])
+        self.assertEqual(self.all_pages(limit='2'), ['p4', 'p3', 'p2', 'p1', 'p5'])
+        self.assertEqual(self.all_pages(limit='2', sort='on_demand_cost'), ['p5', 'p1', 'p2', 'p3', 'p4'])
+        self.assertEqual(self.all_pages(limit='3', sort='-name'), ['p5', 'p4', 'p3', 'p2', 'p1'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(self.query(namespace='b')), ['p4', 'p3'])
+        self.assertEqual(self.names(self.query(label='app=web')), ['p2', 'p1'])
+        self.assertEqual(self.names(self.query(label='app')), ['p3', 'p2', 'p1'])
+        self.assertEqual(self.names(self.query(instance_type='c5.large')), ['p4', 'p3'])
+        self.assertEqual(self.names(self.query(search=' P4 ')), ['p4'])
+        self.assertEqual(self.all_pages(limit='1', search='p', namespace='a', sort='name'), ['p1', 'p2'])
+        result = self.query(min_cost='30', timeframe='week')
+        self.assertEqual(self.names(result), ['p4', 'p3', 'p2'])
+        self.assertAlmostEqual(result['items'][0]['on_demand_cost'], 0.4 * 168)
+        self.assertAlmostEqual(result['items'][0]['spot_cost'], 0.2 * 168)
+
+    def test_group_by(self):
+        result = self.query(group_by='namespace', sort='key')
+        self.assertEqual([item['key'] for item in result['items']], ['a', 'b', 'c'])
+        self.assertEqual(result['items'][1]['pod_count'], 2)
+        self.assertAlmostEqual(result['items'][1]['on_demand_cost'], 0.6)
+        result = self.query(group_by='owner', label='app=web')
+        self.assertEqual([item['key'] for item in result['items']], ['Deployment/web'])
+
+    def test_invalid_args(self):
+        for args in [{'sort': 'price'}, {'group_by': 'node'}, {'limit': '0'},
+                     {'min_cost': 'x'}, {'timeframe': 'day'}, {'cursor': 'nope'},
+                     {'cursor': encode_cursor('name', ['p1', 'a', 'p1'])},
+                     # cursors of the same sort that items cannot have
+                     {'cursor': encode_cursor('-on_demand_cost', ['p1', 'a', 'p1'])},
+                     {'cursor': encode_cursor('-on_demand_cost', [0.1, 'a'])},
+                     {'cursor': encode_cursor('-on_demand_cost', 0.1)},
+                     {'cursor': encode_cursor('-on_demand_cost', [0.1, 'a', 'p1']),
+                      'group_by': 'namespace'},
+                     {'sort': 'name', 'cursor': encode_cursor('name', [1, 'a', 'p1'])}]:
+            with self.assertRaises(ValueError, msg=args):
+                PodQuery.from_args(MultiDict(args), TIMEFRAMES)
+
+
+class TestPodOwner(unittest.TestCase):
+    def test_pod_owner(self):
+        labels = {'pod-template-hash': '5d669ffbd8'}
+        self.assertEqual(pod_owner([('ReplicaSet', 'web-5d669ffbd8', True)], labels), 'Deployment/web')
+        self.assertEqual(pod_owner([('StatefulSet', 'db', True)], {}), 'StatefulSet/db')
+        self.assertEqual(pod_owner([('Node', 'n1', False)], {}), '')
+        self.assertEqual(pod_owner([], {}), '')
+
+    def test_from_raw(self):
+        pod = Pod.from_raw({
+            'metadata': {
+                'namespace': 'default', 'name': 'job-x',
+                'labels': {'app': 'batch'},
+                'ownerReferences': [{'kind': 'Job', 'name': 'job', 'controller': True}],
+            },
+            'spec': {'containers': []},
+        })
+        self.assertEqual(pod.labels, {'app': 'batch'})
+        self.assertEqual(pod.owner, 'Job/job')
+
+
+if __name__ == '__main__':
+    unittest.main()
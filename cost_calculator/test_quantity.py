@@ -0,0 +1,35 @@
+import unittest
+
+from kubernetes.utils import parse_quantity as k8s_parse_quantity
+
+from cost_calculator.quantity import parse_cpu, parse_memory, parse_quantity
+
+QUANTITIES = [
+    '0', '1', '2', '0.5', '.5', '1.', '+3', '-1', '100m', '250m', '1500m', '0.1m', '300m',
+    '10n', '7u', '1k', '1M', '1G', '1T', '1P', '1E', '3.5G',
+    '1Ki', '512Mi', '0.5Gi', '1.5Gi', '3Ti', '2Pi', '1Ei', '1536Mi', '768Mi',
+    '1e3', '1E3', '1.5e-3', '5e+2', '123456789',
+]
+
+
+class TestParseQuantity(unittest.TestCase):
+    def test_matches_kubernetes_parse_quantity(self):
+        for quantity in QUANTITIES:
+            expected = float(k8s_parse_quantity(quantity))
+            self.assertEqual(parse_quantity(quantity), expected, quantity)
+            self.assertEqual(parse_memory(quantity), expected / 2 ** 30, quantity)
+
+    def test_units(self):
+        self.assertEqual(parse_cpu('100m'), 0.1)
+        self.assertEqual(parse_cpu(2), 2.0)
+        self.assertEqual(parse_memory('512Mi'), 0.5)
+        self.assertEqual(parse_memory(2 ** 31), 2.0)
+
+    def test_invalid(self):
+        for quantity in ['', 'm', '1e', '1K', '1Mb', 'abc', '1.2.3', '--1']:
+            with self.assertRaises(ValueError, msg=quantity):
+                parse_quantity(quantity)
+
+
+if __name__ == '__main__':
+    unittest.main()
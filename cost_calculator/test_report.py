@@ -0,0 +1,112 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cost_calculator.report import main
+
+FILE_INPUT = {
+    'pods': [
+        {'name': 'web-0', 'namespace': 'default', 'initContainers': None,
+         'containers': {'requests': {'cpu': '1', 'memory': '2Gi'}}},
+        {'name': 'db-0', 'namespace': 'data', 'initContainers': None,
+         'containers': {'requests': {'cpu': '2', 'memory': '8Gi'}}, 'owner': 'StatefulSet/db'},
+    ],
+    'nodes': [
+        {'name': 'node-1', 'labels': {'beta.kubernetes.io/instance-type': 'm5.xlarge'}},
+    ],
+}
+
+
+def raw_pod(namespace, name, cpu, memory):
+    return {
+        'kind': 'Pod',
+        'metadata': {'namespace': namespace, 'name': name},
+        'spec': {'containers': [{'resources': {'requests': {'cpu': cpu, 'memory': memory}}}]},
+    }
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return path
+
+    def run_report(self, *args):
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = main(['report', '--provider', 'aws', '--region', 'us-east-1'] + list(args))
+        return code, out.getvalue(), err.getvalue()
+
+    def test_file_input(self):
+        code, out, _ = self.run_report('--format', 'json', '--timeframe', 'week',
+                                       self.write('input.json', FILE_INPUT))
+        self.assertEqual(code, 0)
+        summary = json.loads(out)
+        self.assertEqual(summary['pod_count'], 2)
+        self.assertEqual(summary['node_count'], 1)
+        self.assertEqual(summary['unpriced_nodes'], [])
+        self.assertGreater(summary['node_cost'], 0)
+        self.assertEqual(sorted(summary['namespaces']), ['data', 'default'])
+        self.assertAlmostEqual(
+            summary['on_demand_cost'],
+            sum(ns['on_demand_cost'] for ns in summary['namespaces'].values()))
+
+    def test_kubectl_dumps(self):
+        pods = self.write('pods.json', {
+            'kind': 'List',
+            'items': [raw_pod('ns-{}'.format(i % 3), 'pod-{}'.format(i), '250m', '512Mi')
+                      for i in range(25)],
+        })
+        nodes = self.write('nodes.json', {
+            'kind': 'List',
+            'items': [
+                {'kind': 'Node', 'metadata': {'name': 'n1', 'labels': {
+                    'kubernetes.io/instance-type': 'm5.large'}}},
+                {'kind': 'Node', 'metadata': {'name': 'kip', 'labels': {
+                    'type': 'virtual-kubelet'}}},
+            ],
+        })
+        code, out, err = self.run_report('--format', 'csv', '--batch-size', '10', pods, nodes)
+        self.assertEqual(code, 0)
+        rows = list(csv.DictReader(io.StringIO(out)))
+        self.assertEqual([row['name'] for row in rows], ['pod-{}'.format(i) for i in range(25)])
+        self.assertEqual(len({row['instance_type'] for row in rows}), 1)
+        self.assertIn('nodes: 1,', err)
+        self.assertIn('nodeless: 25 pods', err)
+
+    def test_compare(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = main(['compare', '--processes', '0', '--provider', 'aws', '--format', 'json',
+                         self.write('input.json', FILE_INPUT)])
+        self.assertEqual(code, 0)
+        data = json.loads(out.getvalue())
+        self.assertEqual(data['pod_count'], 2)
+        self.assertIn('us-east-1', [region['region'] for region in data['regions']])
+        self.assertTrue(all(region['cloud'] == 'aws' for region in data['regions']))
+
+    def test_errors(self):
+        code, _, err = self.run_report(os.path.join(self.tmpdir, 'missing.json'))
+        self.assertEqual(code, 1)
+        self.assertIn('error:', err)
+        path = os.path.join(self.tmpdir, 'bad.json')
+        with open(path, 'w') as f:
+            f.write('{"pods": [')
+        self.assertEqual(self.run_report(path)[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
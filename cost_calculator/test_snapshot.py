@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest.mock import Mock
+
+import attr
+
+from cost_calculator.app import Node
+from cost_calculator.snapshot import SnapshotScheduler, build_snapshot
+from cost_calculator.testing import make_cluster_cost, make_pod
+
+
+class TestBuildSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.pods = [make_pod('a', 'p1', 0.1), make_pod('b', 'p2', 0.2), make_pod('b', 'p3', 0.3)]
+        self.nodes = [
+            Node(name='n1', nodegroup='', cpu=2.0, memory=8.0, gpu_spec='',
+                 instance_type='m5.large', cost=0.5),
+            Node(name='n2', nodegroup='', cpu=0.0, memory=0.0, gpu_spec='',
+                 instance_type='unknown'),
+        ]
+        self.cluster_cost = make_cluster_cost(self.pods, self.nodes)
+
+    def test_totals(self):
+        snapshot = build_snapshot(self.cluster_cost, 3, {'week': 10})
+        self.assertEqual(snapshot.version, 3)
+        self.assertEqual(snapshot.namespaces, ['a', 'b'])
+        self.assertAlmostEqual(snapshot.totals().cost, 0.6)
+        self.assertEqual(snapshot.totals('b').pod_count, 2)
+        self.assertAlmostEqual(snapshot.totals('b', timeframe='week').cost, 5.0)
+        self.assertAlmostEqual(snapshot.totals('all', timeframe='week').spot_price, 3.0)
+        self.assertEqual(snapshot.totals('missing').pod_count, 0)
+        self.assertEqual(snapshot.node_totals.node_count, 1)
+        self.assertEqual(snapshot.timeframe_node_cost['week'], 5.0)
+        self.assertEqual(snapshot.invalid_nodes, ('n2',))
+        self.assertEqual([pod.name for pod in snapshot.pods_in('b')], ['p2', 'p3'])
+        self.assertEqual(len(snapshot.pods_in('all')), 3)
+
+    def test_packing_error(self):
+        snapshot = build_snapshot(self.cluster_cost, 1, {},
+                                  pack=Mock(side_effect=ValueError))
+        self.assertIsNone(snapshot.packing)
+        self.assertAlmostEqual(snapshot.totals().cost, 0.6)
+
+    def test_immutable(self):
+        snapshot = build_snapshot(self.cluster_cost, 1, {})
+        with self.assertRaises(attr.exceptions.FrozenInstanceError):
+            snapshot.version = 2
+        with self.assertRaises(TypeError):
+            snapshot.pod_totals['a'] = None
+        # the pods of the cluster can change without touching the snapshot
+        self.pods[0].cost = 10.0
+        self.assertEqual(snapshot.pods_in('a')[0].cost, 0.1)
+
+
+class TestSnapshotScheduler(unittest.TestCase):
+    def make_build(self):
+        age = Mock(return_value=0.0)
+        return Mock(side_effect=lambda version: Mock(
+            version=version, age=age, fingerprint=str(version), changed_at=0.0)), age
+
+    def test_current_builds_once(self):
+        build, _ = self.make_build()
+        snapshots = SnapshotScheduler(build, max_staleness=60)
+        first = snapshots.current()
+        self.assertIs(snapshots.current(), first)
+        self.assertEqual(first.version, 1)
+        self.assertEqual(build.call_count, 1)
+
+    def test_stale_snapshot_is_rebuilt(self):
+        build, age = self.make_build()
+        snapshots = SnapshotScheduler(build, max_staleness=60)
+        first = snapshots.current()
+        age.return_value = 120.0
+        second = snapshots.current()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.version, 2)
+
+    def test_background_refresh(self):
+        build, _ = self.make_build()
+        snapshots = SnapshotScheduler(build, interval=0.01)
+        snapshots.start()
+        deadline = time.monotonic() + 5
+        while build.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        snapshots.stop()
+        self.assertGreaterEqual(snapshots.current().version, 2)
+        self.assertIsNone(snapshots.last_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
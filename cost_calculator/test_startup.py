@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import Mock
+
+from cost_calculator.startup import Phase, Startup
+
+
+class TestPhase(unittest.TestCase):
+    def test_runs_once(self):
+        factory = Mock(return_value='value')
+        phase = Phase('catalog', factory)
+        self.assertFalse(phase.done)
+        self.assertEqual(phase.get(), 'value')
+        self.assertEqual(phase.get(), 'value')
+        self.assertEqual(factory.call_count, 1)
+        self.assertTrue(phase.ready)
+        self.assertIsNotNone(phase.duration)
+
+    def test_error_is_retried(self):
+        factory = Mock(side_effect=[ValueError('no region'), 'value'])
+        phase = Phase('config', factory)
+        with self.assertRaises(ValueError):
+            phase.get()
+        self.assertEqual(phase.status()['error'], 'no region')
+        self.assertFalse(phase.ready)
+        self.assertEqual(phase.get(), 'value')
+        self.assertIsNone(phase.error)
+
+    def test_ready_func(self):
+        table = Mock(loaded=False)
+        phase = Phase('spot_prices', lambda: table, ready=lambda t: t.loaded)
+        phase.get()
+        self.assertTrue(phase.done)
+        self.assertFalse(phase.ready)
+        table.loaded = True
+        self.assertTrue(phase.ready)
+
+
+class TestStartup(unittest.TestCase):
+    def test_warm_up(self):
+        startup = Startup()
+        startup.add('config', Mock(side_effect=ValueError('no region')))
+        catalog = startup.add('catalog', Mock(return_value='catalog'))
+        startup.warm_up()
+        startup._warm_up_thread.join()
+        self.assertFalse(startup.ready())
+        # phases after a failed one are not run
+        self.assertFalse(catalog.done)
+        self.assertEqual(startup.status()['config']['error'], 'no region')
+
+        startup['config'].set(None)
+        startup.warm_up()
+        startup._warm_up_thread.join()
+        self.assertTrue(startup.ready())
+        self.assertEqual(startup.get('catalog'), 'catalog')
+
+    def test_preload_then_start(self):
+        startup = Startup()
+        start_table = Mock()
+        start_snapshots = Mock()
+        startup.add('spot_prices', Mock(return_value='table'), start=start_table)
+        startup.add('snapshots', Mock(return_value='snapshots'), start=start_snapshots)
+        startup['snapshots'].factory.side_effect = [ValueError('no cluster'), 'snapshots']
+        startup.preload()
+        self.assertTrue(startup['spot_prices'].done)
+        self.assertFalse(startup['snapshots'].done)
+        start_table.assert_not_called()
+
+        # as in a worker after the fork
+        startup.start()
+        start_table.assert_called_once_with('table')
+        startup.get('snapshots')
+        start_snapshots.assert_called_once_with('snapshots')
+        startup.start()
+        self.assertEqual(start_table.call_count, 1)
+
+    def test_preload_some_phases(self):
+        startup = Startup()
+        startup.add('catalog', Mock(return_value='catalog'))
+        startup.add('snapshots', Mock(return_value='snapshots'))
+        startup.preload(['catalog'])
+        self.assertTrue(startup['catalog'].done)
+        self.assertFalse(startup['snapshots'].done)
+        startup['snapshots'].factory.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+'''Helpers shared by the tests'''
+import os
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
+
+from cost_calculator.app import Pod, Settings, create_app, make_snapshot_scheduler
+
+
+def make_pod(namespace, name, cost, instance_type='m5.large', labels=None, owner=''):
+    '''Priced pod requesting 1 core and 2 GiB'''
+    return Pod(namespace=namespace, name=name, req_cpu=1.0, req_memory=2.0,
+               lim_cpu=0.0, lim_memory=0.0, gpu_spec='', instance_type=instance_type,
+               cost=cost, spot_price=cost / 2, labels=labels or {}, owner=owner)
+
+
+def make_request_pod(name, cpu, memory, gpu_spec=''):
+    '''Unpriced pod of the default namespace with the given requests'''
+    return Pod(namespace='default', name=name, req_cpu=cpu, req_memory=memory,
+               lim_cpu=0.0, lim_memory=0.0, gpu_spec=gpu_spec)
+
+
+def make_cluster_cost(pods, nodes=()):
+    '''Mock ClusterCost listing the priced pods and nodes'''
+    cluster_cost = Mock()
+    cluster_cost.get_nodeless_pods.return_value = pods
+    cluster_cost.get_current_cluster_cost.return_value = list(nodes)
+    return cluster_cost
+
+
+def make_snapshots(test, cluster_cost, pack=None):
+    '''SnapshotScheduler of cluster_cost keeping its change times in a
+    directory removed after test, not in the one of the host'''
+    state_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, state_dir)
+    with patch.dict(os.environ, {'SNAPSHOT_STATE_DIR': state_dir}):
+        return make_snapshot_scheduler(cluster_cost, pack)
+
+
+def make_test_app(snapshots=None):
+    '''App of an aws us-east-1 cluster that is not started, serving the
+    snapshots of a SnapshotScheduler when given'''
+    app = create_app(Settings('aws', 'us-east-1'), start=False)
+    if snapshots is not None:
+        app.extensions['cost_calculator']['snapshots'].set(snapshots)
+    return app
@@ -0,0 +1,14 @@
+'''Entry point of production WSGI servers.
+
+The config and the catalog are preloaded, so that a server that imports
+this module before forking shares the catalog and its price index
+between its workers. The cluster snapshot is built in every worker
+after the fork, by the startup warm-up that gunicorn.conf.py starts
+there, so the server binds its port and answers /healthz right away
+instead of after the first snapshot of a large cluster.
+'''
+from cost_calculator.app import create_app
+
+PRELOAD_PHASES = ('config', 'catalog')
+
+app = create_app(preload=PRELOAD_PHASES, start=False)
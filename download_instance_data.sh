@@ -9,3 +9,6 @@ for filename in "${instance_data_files[@]}"; do
     echo $filename
     curl https://elotl-cloud-data.s3.amazonaws.com/$filename > $download_dir/$filename
 done
+
+# compile the catalogs into the memory-mapped format loaded at runtime
+python3 $SCRIPT_DIR/cost_calculator/catalog.py $download_dir
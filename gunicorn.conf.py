@@ -0,0 +1,34 @@
+# gunicorn settings of the nodeless-cost-calculator image:
+#
+#     gunicorn -c gunicorn.conf.py cost_calculator.wsgi:app
+#
+# The config and the catalog are loaded once in the master process and
+# the workers are forked from it. Each worker builds the rest of the
+# startup phases and starts its own background threads (spot price
+# refresh, informers and snapshot rebuilds) after the fork, so every
+# worker adds its own watches on the API server and its own copy of the
+# cluster cache. That is why there are at most 2 workers by default,
+# sized to the container's CPU limit, and requests are served by
+# threads instead.
+import os
+import sys
+
+# the config is read before gunicorn puts the app directory on the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cost_calculator.cgroup import available_cpus  # noqa: E402
+
+bind = '0.0.0.0:5000'
+workers = int(os.getenv('WEB_CONCURRENCY', min(2, available_cpus())))
+# request threads mostly render templates under the GIL, so they add
+# concurrency for requests waiting on I/O, not CPU parallelism
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = True
+timeout = 120
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from cost_calculator.app import start_app
+    start_app(worker.app.wsgi())
@@ -0,0 +1,43 @@
+"""Compares the memoized quantity parser of the cost calculator with
+kubernetes.utils.parse_quantity on the kind of quantities found in pod
+specs. Run from the repository root: python scripts/benchmark_quantity.py
+"""
+import os
+import random
+import sys
+import timeit
+
+from kubernetes.utils import parse_quantity as k8s_parse_quantity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'cost_calculator'))
+from quantity import parse_cpu, parse_memory  # noqa: E402
+
+CPU = ['50m', '100m', '250m', '500m', '1', '2', '4']
+MEMORY = ['64Mi', '128Mi', '256Mi', '512Mi', '1Gi', '2Gi', '1536Mi']
+NUM_CONTAINERS = 100000
+
+
+def k8s_parse(cpus, memories):
+    for cpu, memory in zip(cpus, memories):
+        float(k8s_parse_quantity(cpu))
+        float(k8s_parse_quantity(memory)) / 2 ** 30
+
+
+def memoized_parse(cpus, memories):
+    for cpu, memory in zip(cpus, memories):
+        parse_cpu(cpu)
+        parse_memory(memory)
+
+
+def main():
+    rng = random.Random(0)
+    cpus = [rng.choice(CPU) for _ in range(NUM_CONTAINERS)]
+    memories = [rng.choice(MEMORY) for _ in range(NUM_CONTAINERS)]
+    for name, func in [('kubernetes.utils.parse_quantity', k8s_parse),
+                       ('cost_calculator.quantity', memoized_parse)]:
+        seconds = min(timeit.repeat(lambda: func(cpus, memories), number=1, repeat=3))
+        print(f'{name:35s} {NUM_CONTAINERS} containers: {seconds * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,54 +1,15 @@
-import json
-import os
-
-
-with open(os.getcwd() + '/pods.json', 'r') as jfile:
-    lines = jfile.readlines()
-
-pods_lines = []
-for l in lines:
-    wl = l
-    if l == '}\n':
-        wl = '},\n'
-    pods_lines.append(wl)
-
-for line in [-1,-2,-3,-4]:
-    if pods_lines[line] == "},\n":
-        pods_lines[line] = "}\n"
-        break
+"""Converts the pods.json and nodes.json dumps of the README into the
+input file of FROM_FILE. Run from the directory holding the dumps:
 
-pods_lines = ['{\"pods\":\n', '[\n'] + pods_lines + [']\n', '}\n']
-with open('/tmp/temp_pods.json', 'w') as output_file:
-    output_file.writelines(pods_lines)
+    python data_sanitazer.py [pods.json nodes.json] [-o input_example.json]
 
-with open('/tmp/temp_pods.json', 'r') as tmp_file:
-    pods_data = json.load(tmp_file)
-pods = pods_data["pods"]
-
-with open(os.getcwd() + '/nodes.json', 'r') as jfile:
-    lines = jfile.readlines()
-
-nodes_lines = []
-for l in lines:
-    wl = l
-    if l == '}\n':
-        wl = '},\n'
-    nodes_lines.append(wl)
-
-for line in [-1,-2,-3,-4]:
-    if nodes_lines[line] == "},\n":
-        nodes_lines[line] = "}\n"
-        break
-nodes_lines = ['[\n'] + nodes_lines + [']\n']
-with open('/tmp/temp_node.json', 'w') as output_file:
-    output_file.writelines(nodes_lines)
-
-with open('/tmp/temp_node.json', 'r') as tmp_file:
-    nodes_data = json.load(tmp_file)
+Plain kubectl get -o json dumps are accepted as well.
+"""
+import os
+import sys
 
-output = {"pods": pods, "nodes": nodes_data}
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from cost_calculator.file_input import main  # noqa: E402
 
-outpath = os.getcwd() + '/input_example.json'
-with open(outpath, 'w') as outfile:
-    json.dump(output, outfile)
-print("saved to ", outpath)
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())